@@ -0,0 +1,45 @@
+# 本番用の起動設定(gunicorn -c myfruitshop/gunicorn.conf.py)
+import json
+import multiprocessing
+import os
+
+chdir = os.path.dirname(os.path.abspath(__file__))
+wsgi_app = 'myfruitshop.wsgi:application'
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:80')
+
+# CPUごとに複数のプロセスをforkし、各プロセスはスレッドでリクエストを処理する。
+# DB接続はスレッドごとに持つため、MySQLの最大接続数は workers x threads 以上にしておく
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+
+# アプリをマスタープロセスで読み込み、ウォームアップしてからforkする。
+# ログの書き込みスレッド(QueuedFileHandler)はforkしたワーカーで作り直される。
+# 全ワーカーが同じファイルに書き込むため、ローテーションはファイルロックで1プロセスずつ行う(myfruitshop/log_handlers.py)
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+# メモリの増加に備えて一定数のリクエストごとにワーカーを入れ替える(同時に入れ替わらないようばらつかせる)
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '1000'))
+max_requests_jitter = max_requests // 10
+
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+accesslog = '-'
+errorlog = '-'
+
+
+def warm_up(log) -> None:
+    from myfruitshop.warmup import warm_up as run_warm_up
+    log.info('warm-up: %s', json.dumps(run_warm_up()))
+
+
+def when_ready(server) -> None:
+    # preload_appの場合はマスターで1回だけ行い、ワーカーはその状態を引き継ぐ
+    if server.cfg.preload_app:
+        warm_up(server.log)
+
+
+def post_worker_init(worker) -> None:
+    if not worker.cfg.preload_app:
+        warm_up(worker.log)
@@ -0,0 +1,168 @@
+import atexit
+import copy
+import logging
+import os
+import queue
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from logging.handlers import QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+from typing import Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# forkした子プロセスで書き込みスレッドを作り直すため、生成したハンドラーを覚えておく
+_queued_handlers: weakref.WeakSet = weakref.WeakSet()
+
+
+class SharedRolloverMixin:
+    # gunicornのワーカーや取り込みのワーカーなど、複数のプロセスが同じファイルに書き込む場合のローテーション。
+    # ローテーションはファイルロック(<ファイル名>.lock)を取って1プロセスずつ行い、
+    # 開いているファイルが他のプロセスにローテーション済み(同じ名前の別のファイル)なら、ローテーションせずに開き直す。
+    # (開き直す前に書いた行はローテーション済みのファイルに入り、番号付きのファイルを上書きしないため失われない)
+    baseFilename: str
+    stream: Optional[object]
+
+    @contextmanager
+    def rollover_lock(self) -> Iterator[None]:
+        if fcntl is None:
+            yield
+            return
+        with open(f'{self.baseFilename}.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def stream_is_current(self) -> bool:
+        if self.stream is None:
+            return True
+        try:
+            on_disk: os.stat_result = os.stat(self.baseFilename)
+        except FileNotFoundError:
+            return False
+        opened: os.stat_result = os.fstat(self.stream.fileno())
+        return (on_disk.st_dev, on_disk.st_ino) == (opened.st_dev, opened.st_ino)
+
+    def reopen(self) -> None:
+        self.stream.close()
+        self.stream = self._open()
+
+    def doRollover(self) -> None:
+        with self.rollover_lock():
+            if self.stream_is_current():
+                super().doRollover()
+            else:
+                self.reopen()
+                self.rolled_over_elsewhere()
+
+    def rolled_over_elsewhere(self) -> None:
+        pass
+
+
+class SharedRotatingFileHandler(SharedRolloverMixin, RotatingFileHandler):
+    pass
+
+
+class SharedTimedRotatingFileHandler(SharedRolloverMixin, TimedRotatingFileHandler):
+    def rolled_over_elsewhere(self) -> None:
+        # 他のプロセスがローテーションしたため、次の区切りの時刻だけ進める
+        self.rolloverAt = self.computeRollover(int(time.time()))
+
+
+class QueuedFileHandler(logging.Handler):
+    # ログをキューに積むだけで戻り、ファイルへの書き込みとローテーションはバックグラウンドのスレッドが行う
+    # (QueueHandlerを継承するとdictConfigが独自の引数で生成しようとするため、内部で組み合わせる)
+    def __init__(self, filename: str, rotation: str = 'size', max_bytes: int = 10 * 1024 * 1024,
+                 backup_count: int = 5, when: str = 'midnight', queue_size: int = 10000,
+                 encoding: Optional[str] = 'utf-8') -> None:
+        super().__init__()
+        if rotation == 'time':
+            self.target: logging.Handler = SharedTimedRotatingFileHandler(
+                filename, when=when, backupCount=backup_count, encoding=encoding, delay=True)
+        elif rotation == 'size':
+            self.target = SharedRotatingFileHandler(
+                filename, maxBytes=max_bytes, backupCount=backup_count, encoding=encoding, delay=True)
+        else:
+            raise ValueError(f'Unknown log rotation: {rotation}')
+
+        self.queue_size: int = queue_size
+        self.start_listener()
+        _queued_handlers.add(self)
+        # 終了時に書き込みスレッドを止め、キューに残っているログを書き出す
+        atexit.register(self.close)
+
+    def start_listener(self) -> None:
+        # スレッドはforkした子プロセスに引き継がれないため、子プロセスではキューごと作り直す
+        # (親のスレッドが使用中だったキューのロックも引き継がれるため、元のキューは使わない)
+        self.queue: queue.Queue = queue.Queue(self.queue_size)
+        self.dropped: int = 0
+        self.listener: QueueListener = QueueListener(self.queue, self.target)
+        self.listener.start()
+        self.listening: bool = True
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 書式化はこのスレッドで済ませ、別スレッドへ渡せない引数や例外情報は落とす
+        message: str = self.format(record)
+        record = copy.copy(record)
+        record.message = message
+        record.msg = message
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        record.stack_info = None
+        return record
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # キューが溢れた場合はリクエストを待たせずに捨て、件数だけ数える
+        try:
+            self.queue.put_nowait(self.prepare(record))
+        except queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def flush(self) -> None:
+        # キューに残っているログを書き出し終えるまで待つ(テスト・終了処理用)
+        if self.listening:
+            self.queue.join()
+        self.target.flush()
+
+    def close(self) -> None:
+        if self.listening:
+            self.listening = False
+            self.listener.stop()
+        self.target.close()
+        super().close()
+
+
+def _restart_listeners_after_fork() -> None:
+    # gunicornのpreload_appなど、ハンドラーを作った後にforkしたワーカーでも書き込めるようにする
+    for handler in list(_queued_handlers):
+        if handler.listening:
+            handler.start_listener()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_listeners_after_fork)
+
+
+class SamplingFilter(logging.Filter):
+    # 大量に出るログ(SQLなど)を every 件に1件だけ通す。WARNING以上は常に通す
+    def __init__(self, every: int = 100, name: str = '') -> None:
+        super().__init__(name)
+        self.every: int = max(int(every), 1)
+        self._seen: int = 0
+        self._lock: threading.Lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        with self._lock:
+            self._seen += 1
+            return (self._seen - 1) % self.every == 0
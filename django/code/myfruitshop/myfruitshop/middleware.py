@@ -0,0 +1,115 @@
+import json
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import HttpRequest, HttpResponse
+
+logger = logging.getLogger('myfruitshop.requests')
+
+
+class QueryRecorder:
+    # connection.execute_wrapper に渡し、実行したSQL(プレースホルダのまま)と所要時間を記録する
+    def __init__(self) -> None:
+        self.queries: List[Tuple[str, float]] = []
+
+    def __call__(self, execute: Callable, sql: str, params: Any, many: bool, context: Dict[str, Any]) -> Any:
+        started: float = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+    @property
+    def count(self) -> int:
+        return len(self.queries)
+
+    @property
+    def total_time(self) -> float:
+        return sum(duration for _, duration in self.queries)
+
+    def duplicates(self) -> List[Tuple[str, int]]:
+        # 同じSQLが繰り返し実行されている場合はN+1の可能性がある
+        counts: Counter = Counter(sql for sql, _ in self.queries)
+        return [(sql, count) for sql, count in counts.most_common() if count > 1]
+
+
+@contextmanager
+def recording(recorder: QueryRecorder) -> Iterator[QueryRecorder]:
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        yield recorder
+
+
+class RequestMetricsMiddleware:
+    # リクエストごとのクエリ数・DB時間・重複クエリ・ビュー全体の時間を
+    # Server-Timingヘッダーと1行のログに出力する
+    # ASGIでは非同期ビューをスレッドに移さずに呼べるよう、非同期の呼び出しにも対応する
+    sync_capable: bool = True
+    async_capable: bool = True
+
+    def __init__(self, get_response: Callable[[HttpRequest], HttpResponse]) -> None:
+        self.get_response: Callable[[HttpRequest], HttpResponse] = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder: QueryRecorder = QueryRecorder()
+        started: float = time.perf_counter()
+        with recording(recorder):
+            response: HttpResponse = self.get_response(request)
+        return self.finish(request, response, recorder, time.perf_counter() - started)
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        # DB接続はスレッドごとで、非同期のORMはsync_to_asyncのスレッド(リクエスト内では同じスレッド)で
+        # SQLを実行するため、記録用のラッパーもそのスレッドの接続に付け外しする
+        recorder: QueryRecorder = QueryRecorder()
+        started: float = time.perf_counter()
+        stack: ExitStack = ExitStack()
+        await sync_to_async(stack.enter_context)(recording(recorder))
+        try:
+            response: HttpResponse = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.finish(request, response, recorder, time.perf_counter() - started)
+
+    def finish(self, request: HttpRequest, response: HttpResponse, recorder: QueryRecorder,
+               elapsed: float) -> HttpResponse:
+        duplicates: List[Tuple[str, int]] = recorder.duplicates()
+        duplicated: int = sum(count - 1 for _, count in duplicates)
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={recorder.total_time * 1000:.2f};desc="{recorder.count} queries"',
+            f'dup;desc="{duplicated} duplicated"',
+            f'view;dur={elapsed * 1000:.2f}',
+        ])
+
+        record: Dict[str, Any] = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'view_ms': round(elapsed * 1000, 2),
+            'db_ms': round(recorder.total_time * 1000, 2),
+            'queries': recorder.count,
+            'duplicated': duplicated,
+        }
+        if duplicates:
+            record['duplicates'] = [{'sql': sql, 'count': count} for sql, count in duplicates[:5]]
+        logger.info(json.dumps(record, ensure_ascii=False))
+
+        if elapsed * 1000 >= settings.REQUEST_METRICS_SLOW_MS:
+            # 遅いリクエストは実行したクエリを時間の長い順に書き出す
+            slow: Dict[str, Any] = dict(record, slow_queries=[
+                {'sql': sql, 'ms': round(duration * 1000, 2)}
+                for sql, duration in sorted(recorder.queries, key=lambda query: query[1], reverse=True)
+            ])
+            logger.warning(json.dumps(slow, ensure_ascii=False))
+
+        return response
@@ -22,6 +22,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'myfruitshop.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -62,6 +63,21 @@ DATABASES = {
     }
 }
 
+# MySQLを用意せずにローカルで計測・テストする場合は DJANGO_DB_ENGINE=sqlite を指定する
+if os.environ.get('DJANGO_DB_ENGINE') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DJANGO_SQLITE_PATH', os.path.join(BASE_DIR, 'db.sqlite3')),
+        }
+    }
+
+# DB接続をリクエストをまたいで使い回す秒数(0はリクエストごとに切断、Noneは無期限)。
+# 使い回す前に接続が生きているかを確認し、切れていれば張り直す
+CONN_MAX_AGE = os.environ.get('DJANGO_CONN_MAX_AGE', '60')
+DATABASES['default']['CONN_MAX_AGE'] = None if CONN_MAX_AGE == 'none' else int(CONN_MAX_AGE)
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -82,25 +98,128 @@ STATIC_URL = '/static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# MySQLは条件付きインデックス・一意制約に対応していない(該当するものは作成されないだけで問題はない)
+SILENCED_SYSTEM_CHECKS = ['models.W036', 'models.W037']
+
+# 集計結果のキャッシュ。ワーカーなど複数プロセスで販売実績の版番号を共有するため
+# ファイルベースのキャッシュを使う
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+    }
+}
+
+# 販売統計情報のキャッシュ秒数(販売実績の更新時は版番号で無効化される)
+SALES_STATS_CACHE_TIMEOUT = 60 * 60
+
+# キャッシュのヒット・ミスの回数をプロセス内で数え、共有のキャッシュへ加算する間隔(秒)
+SALES_CACHE_STATS_FLUSH_SECONDS = 10
+
+# 販売情報一覧に表示する概算件数のキャッシュ秒数
+SALES_LIST_COUNT_TIMEOUT = 60
+
+# 販売情報一覧の表(テンプレートの断片)のキャッシュ秒数(販売実績の更新時は版番号で無効化される)
+SALES_LIST_FRAGMENT_TIMEOUT = 60 * 60
+
+# CSV一括取り込みで一度にINSERTする件数
+SALES_IMPORT_BATCH_SIZE = 1000
+# このサイズ(バイト)を超えるCSVはバックグラウンドジョブで取り込む
+SALES_IMPORT_ASYNC_THRESHOLD = 1024 * 1024
+# バックグラウンド取り込み用のファイル置き場と読み込み単位
+SALES_IMPORT_DIR = os.path.join(BASE_DIR, 'media', 'imports')
+SALES_IMPORT_CHUNK_SIZE = 1024 * 1024
+# バックグラウンド取り込みで検証に使うプロセス数(1の場合は並列化しない)
+SALES_IMPORT_WORKERS = 1
+# 並列取り込みで1プロセスが一度に検証する範囲の大きさ(バイト)
+SALES_IMPORT_RANGE_BYTES = 8 * 1024 * 1024
+# 処理中のまま進捗がこの秒数途絶えたジョブは、ワーカーが止まったものとして取り消して待機中に戻す
+SALES_IMPORT_STALE_SECONDS = 10 * 60
+# 待機中に戻すのはジョブの確保がこの回数未満の場合だけ(以降は失敗にする)
+SALES_IMPORT_MAX_ATTEMPTS = 3
+
+# 集計APIで一度に返せる区間(時間・日・週・月・年)の数の上限
+SALES_AGGREGATE_MAX_BUCKETS = 1000
+
+# 販売統計情報の売れ筋(果物の順位表)に表示する件数と、APIで指定できる件数の上限
+SALES_LEADERBOARD_SIZE = 5
+SALES_LEADERBOARD_MAX_SIZE = 100
+
+# 販売実績の保管期間(月)。これより前の月の販売実績はarchive_salesで保管用のテーブル(SaleArchive)へ移す
+SALES_RETENTION_MONTHS = 24
+# 論理削除した販売実績は削除から この日数が過ぎたら保管期間内でも移す
+SALES_DELETED_RETENTION_DAYS = 90
+# 保管用のテーブルへ一度に移す件数(1トランザクション)
+SALES_ARCHIVE_BATCH_SIZE = 5000
+# MySQLで販売実績テーブルのパーティションを何ヶ月先まで作っておくか
+SALES_PARTITION_MONTHS_AHEAD = 3
+
+# CSVエクスポートで一度に取得する件数
+SALES_EXPORT_CHUNK_SIZE = 2000
+
+# この時間(ミリ秒)以上かかったリクエストは実行したSQLをログに書き出す
+REQUEST_METRICS_SLOW_MS = 500
+
 LOGIN_REDIRECT_URL = '/'
 LOGIN_URL = '/accounts/login/'
 LOGOUT_REDIRECT_URL = '/accounts/login/'
 
+# ログはキュー経由でバックグラウンドのスレッドが書き込む(リクエストはファイル書き込みを待たない)
+LOG_LEVEL = os.environ.get('DJANGO_LOG_LEVEL', 'INFO')
+# 'size'(LOG_MAX_BYTES ごと)または 'time'(毎日0時)でローテーションする
+LOG_ROTATION = os.environ.get('DJANGO_LOG_ROTATION', 'size')
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+# DJANGO_LOG_SQL=1 のときだけSQLをDEBUGで出力し、その中から LOG_SQL_SAMPLE_EVERY 件に1件を残す
+LOG_SQL = os.environ.get('DJANGO_LOG_SQL') == '1'
+LOG_SQL_SAMPLE_EVERY = 100
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'verbose': {
+            'format': '%(asctime)s %(levelname)s %(name)s %(process)d %(message)s',
+        },
+    },
+    'filters': {
+        'sample_sql': {
+            '()': 'myfruitshop.log_handlers.SamplingFilter',
+            'every': LOG_SQL_SAMPLE_EVERY,
+        },
+    },
     'handlers': {
         'file': {
             'level': 'DEBUG',
-            'class': 'logging.FileHandler',
+            'class': 'myfruitshop.log_handlers.QueuedFileHandler',
             'filename': os.path.join(BASE_DIR, 'debug.log'),
+            'rotation': LOG_ROTATION,
+            'max_bytes': LOG_MAX_BYTES,
+            'backup_count': LOG_BACKUP_COUNT,
+            'formatter': 'verbose',
         },
     },
     'loggers': {
         'django': {
             'handlers': ['file'],
-            'level': 'DEBUG',
+            'level': LOG_LEVEL,
             'propagate': True,
         },
+        'django.db.backends': {
+            'handlers': ['file'],
+            'level': 'DEBUG' if LOG_SQL else 'INFO',
+            'filters': ['sample_sql'],
+            'propagate': False,
+        },
+        'sales': {
+            'handlers': ['file'],
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
+        'myfruitshop.requests': {
+            'handlers': ['file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
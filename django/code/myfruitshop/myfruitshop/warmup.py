@@ -0,0 +1,75 @@
+import os
+import time
+from typing import Callable, Dict, List
+
+from django.conf import settings
+from django.db import connections
+from django.template import TemplateSyntaxError, engines
+from django.urls import get_resolver
+
+from sales.catalog import fruit_catalog
+from sales.prefix_sums import prefix_index
+
+
+def load_urlconf() -> int:
+    # URL定義をたどり、すべてのビューのモジュールを読み込む
+    return len(get_resolver().reverse_dict)
+
+
+def project_template_names() -> List[str]:
+    # プロジェクト内(BASE_DIR配下)のテンプレートディレクトリにあるテンプレート名
+    names: List[str] = []
+    for engine in engines.all():
+        for directory in engine.template_dirs:
+            directory = str(directory)
+            if not directory.startswith(str(settings.BASE_DIR)) or not os.path.isdir(directory):
+                continue
+            for root, _, files in os.walk(directory):
+                names.extend(
+                    os.path.relpath(os.path.join(root, file), directory).replace(os.sep, '/')
+                    for file in files if file.endswith('.html'))
+    return sorted(set(names))
+
+
+def compile_templates() -> int:
+    # テンプレートローダーのキャッシュ(DEBUG=Falseで有効)にコンパイル済みのテンプレートを載せる
+    compiled: int = 0
+    for name in project_template_names():
+        try:
+            engines['django'].get_template(name)
+        except TemplateSyntaxError:
+            continue
+        compiled += 1
+    return compiled
+
+
+def prime_caches() -> int:
+    # 果物カタログと全果物の累計をプロセス内に読み込む
+    prefix_index.series(None)
+    return len(fruit_catalog.all())
+
+
+def check_database() -> int:
+    for connection in connections.all():
+        connection.ensure_connection()
+    return len(connections.all())
+
+
+def warm_up() -> Dict[str, Dict[str, float]]:
+    # ワーカーがリクエストを受ける前の準備。手順ごとの件数と所要時間(ミリ秒)を返す
+    steps: Dict[str, Callable[[], int]] = {
+        'database': check_database,
+        'urls': load_urlconf,
+        'templates': compile_templates,
+        'caches': prime_caches,
+    }
+    report: Dict[str, Dict[str, float]] = {}
+    try:
+        for name, step in steps.items():
+            started: float = time.perf_counter()
+            count: int = step()
+            report[name] = {'count': count, 'ms': round((time.perf_counter() - started) * 1000, 2)}
+    finally:
+        # forkしたワーカー間でDBのソケットを共有しないよう、準備に使った接続は閉じておく
+        connections.close_all()
+    return report
@@ -0,0 +1,174 @@
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone, tzinfo
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from django.db.models import Count, F, QuerySet, Sum
+from django.db.models.functions import Trunc
+
+from .archive import with_archive
+from .models import SalesDailyRollup
+from .rollups import JST
+
+GRANULARITIES: Tuple[str, ...] = ('hour', 'day', 'week', 'month', 'year')
+
+# 集計区間の開始(時間単位はUTCの日時、それ以外は指定タイムゾーンでの日付)
+BucketKey = Union[datetime, date]
+
+
+class TooManyBuckets(ValueError):
+    pass
+
+
+def local_midnight(day: date, tz: tzinfo) -> datetime:
+    return datetime.combine(day, time.min, tzinfo=tz)
+
+
+def add_months(day: date, months: int) -> date:
+    month_index: int = day.year * 12 + day.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def bucket_start(day: date, granularity: str) -> date:
+    if granularity == 'week':
+        # 週はISO週(月曜始まり)。SQLのTruncWeekと同じ
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    if granularity == 'year':
+        return day.replace(month=1, day=1)
+    return day
+
+
+def next_bucket(day: date, granularity: str) -> date:
+    if granularity == 'week':
+        return day + timedelta(days=7)
+    if granularity == 'month':
+        return add_months(day, 1)
+    if granularity == 'year':
+        return date(day.year + 1, 1, 1)
+    return day + timedelta(days=1)
+
+
+def iter_buckets(start: datetime, end: datetime, granularity: str, tz: tzinfo) -> Iterator[BucketKey]:
+    # [start, end) と重なる区間の開始を古い順に返す
+    if granularity == 'hour':
+        # 現地時刻の正時で区切り、UTCで1時間ずつ進める(夏時間の切り替わりでも重複・欠落しない)
+        current: datetime = start.astimezone(tz).replace(minute=0, second=0, microsecond=0)
+        current = current.astimezone(dt_timezone.utc)
+        while current < end:
+            yield current
+            current += timedelta(hours=1)
+        return
+
+    day: date = bucket_start(start.astimezone(tz).date(), granularity)
+    while local_midnight(day, tz) < end:
+        yield day
+        day = next_bucket(day, granularity)
+
+
+def bucket_list(start: datetime, end: datetime, granularity: str, tz: tzinfo, limit: int) -> List[BucketKey]:
+    buckets: List[BucketKey] = []
+    for bucket in iter_buckets(start, end, granularity, tz):
+        if len(buckets) >= limit:
+            raise TooManyBuckets(f'区間の数が上限({limit})を超えています。期間を短くするか粒度を大きくしてください。')
+        buckets.append(bucket)
+    return buckets
+
+
+def is_jst(tz: tzinfo) -> bool:
+    return str(tz) == str(JST)
+
+
+class SalesAggregate:
+    # 任意の期間・粒度・タイムゾーンで販売実績を集計する。
+    # 日本時間の日単位以上で日付の境界に揃っている場合は日次集計テーブルを、それ以外は販売実績をSQLで集計する
+    def __init__(self, start: datetime, end: datetime, granularity: str, tz: tzinfo,
+                 fruit: Optional[str] = None, limit: int = 1000) -> None:
+        self.start: datetime = start
+        self.end: datetime = end
+        self.granularity: str = granularity
+        self.tz: tzinfo = tz
+        self.fruit: Optional[str] = fruit
+        self.buckets: List[BucketKey] = bucket_list(start, end, granularity, tz, limit)
+
+    @property
+    def uses_rollup(self) -> bool:
+        return (
+            self.granularity != 'hour'
+            and is_jst(self.tz)
+            and self.start == local_midnight(self.start.astimezone(JST).date(), JST)
+            and self.end == local_midnight(self.end.astimezone(JST).date(), JST)
+        )
+
+    def rollup_rows(self) -> QuerySet:
+        rows: QuerySet = SalesDailyRollup.objects.filter(
+            day__gte=self.start.astimezone(JST).date(), day__lt=self.end.astimezone(JST).date())
+        if self.fruit:
+            rows = rows.filter(fruit__name=self.fruit)
+        bucket: Any = F('day') if self.granularity == 'day' else Trunc('day', self.granularity)
+        return (
+            rows.annotate(bucket=bucket)
+            .values('bucket', 'fruit__name')
+            .annotate(amount=Sum('total_amount'), quantity=Sum('quantity'), count=Sum('sale_count'))
+            .order_by('bucket', 'fruit__name')
+        )
+
+    def sale_rows(self) -> QuerySet:
+        # 保管済みの販売実績も含める(同じ区間・果物の行が2つになることがあり、as_jsonで合算する)
+        def build(sales: QuerySet) -> QuerySet:
+            rows: QuerySet = sales.filter(is_active=True, sale_date__gte=self.start, sale_date__lt=self.end)
+            if self.fruit:
+                rows = rows.filter(fruit__name=self.fruit)
+            return (
+                rows.annotate(bucket=Trunc('sale_date', self.granularity, tzinfo=self.tz))
+                .values('bucket', 'fruit__name')
+                .annotate(amount=Sum('total_amount'), quantity=Sum('quantity'), count=Count('id'))
+                .order_by()
+            )
+
+        return with_archive(build).order_by('bucket', 'fruit__name')
+
+    def bucket_key(self, value: Union[datetime, date]) -> BucketKey:
+        if self.granularity == 'hour':
+            return value.astimezone(dt_timezone.utc)
+        if isinstance(value, datetime):
+            return value.astimezone(self.tz).date()
+        return value
+
+    def bucket_label(self, key: BucketKey) -> str:
+        if self.granularity == 'hour':
+            return key.astimezone(self.tz).isoformat()
+        return local_midnight(key, self.tz).isoformat()
+
+    def as_json(self) -> Dict[str, Any]:
+        empty: Dict[str, int] = {'amount': 0, 'quantity': 0, 'count': 0}
+        buckets: Dict[BucketKey, Dict[str, Any]] = {
+            key: dict(empty, start=self.bucket_label(key), fruits=[]) for key in self.buckets}
+        total: Dict[str, int] = dict(empty)
+
+        fruits: Dict[Tuple[BucketKey, str], Dict[str, Any]] = {}
+        rows: QuerySet = self.rollup_rows() if self.uses_rollup else self.sale_rows()
+        for row in rows:
+            key: BucketKey = self.bucket_key(row['bucket'])
+            bucket: Optional[Dict[str, Any]] = buckets.get(key)
+            if bucket is None:
+                continue
+            figures: Dict[str, int] = {name: int(row[name]) for name in empty}
+            fruit: Optional[Dict[str, Any]] = fruits.get((key, row['fruit__name']))
+            if fruit is None:
+                fruit = fruits[(key, row['fruit__name'])] = dict(empty, fruit=row['fruit__name'])
+                bucket['fruits'].append(fruit)
+            for name, value in figures.items():
+                fruit[name] += value
+                bucket[name] += value
+                total[name] += value
+
+        return {
+            'from': self.start.astimezone(self.tz).isoformat(),
+            'to': self.end.astimezone(self.tz).isoformat(),
+            'granularity': self.granularity,
+            'tz': str(self.tz),
+            'fruit': self.fruit,
+            'source': 'rollup' if self.uses_rollup else 'sales',
+            'total': total,
+            'buckets': list(buckets.values()),
+        }
@@ -4,3 +4,18 @@ from django.apps import AppConfig
 class SalesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'sales'
+
+    def ready(self) -> None:
+        # 果物マスタの変更を各プロセスの果物カタログへ知らせる
+        from django.db.models.signals import post_delete, post_save
+
+        from .catalog import fruit_changed
+        from .models import Fruit, FruitPriceHistory
+        from .price_history import record_price_change
+
+        # 単価の変更は履歴に残し、履歴の変更もカタログ(単価の履歴を含む)へ知らせる
+        post_save.connect(record_price_change, sender=Fruit, dispatch_uid='sales_fruit_price_history')
+        post_save.connect(fruit_changed, sender=FruitPriceHistory, dispatch_uid='sales_price_history_save')
+        post_delete.connect(fruit_changed, sender=FruitPriceHistory, dispatch_uid='sales_price_history_delete')
+        post_save.connect(fruit_changed, sender=Fruit, dispatch_uid='sales_fruit_catalog_save')
+        post_delete.connect(fruit_changed, sender=Fruit, dispatch_uid='sales_fruit_catalog_delete')
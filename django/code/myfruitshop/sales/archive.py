@@ -0,0 +1,65 @@
+from datetime import datetime
+from typing import Any, Callable, List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, QuerySet
+
+from .caching import bump_sales_version
+from .models import Sale, SaleArchive
+from .pagination import forget_sale_count
+
+# 保管先へそのまま移す列(主キーは元のIDのまま)
+ARCHIVE_FIELDS: Tuple[str, ...] = (
+    'id', 'fruit_id', 'quantity', 'total_amount', 'sale_date', 'created_at', 'updated_at', 'is_active', 'import_batch',
+)
+
+
+class ArchiveResult(NamedTuple):
+    archived: int
+    batches: int
+
+
+def archivable_sales(before: datetime, deleted_before: Optional[datetime] = None) -> QuerySet:
+    # 販売日時がbeforeより前の販売実績と、deleted_beforeより前に論理削除された販売実績
+    condition: Q = Q(sale_date__lt=before)
+    if deleted_before is not None:
+        condition |= Q(is_active=False, updated_at__lt=deleted_before)
+    return Sale.objects.filter(condition)
+
+
+class SaleArchiver:
+    # 販売実績を保管先のテーブルへ一定件数ずつ移す。1バッチを1トランザクションで行い、
+    # 長いロックやトランザクションを作らない。日次集計・累計は移す前と変わらないため更新しない
+    def __init__(self, batch_size: Optional[int] = None) -> None:
+        self.batch_size: int = batch_size or settings.SALES_ARCHIVE_BATCH_SIZE
+
+    def archive_batch(self, sales: QuerySet) -> int:
+        with transaction.atomic():
+            rows: List[Tuple[Any, ...]] = list(
+                sales.order_by('pk').select_for_update().values_list(*ARCHIVE_FIELDS)[:self.batch_size])
+            if not rows:
+                return 0
+            SaleArchive.objects.bulk_create([SaleArchive(**dict(zip(ARCHIVE_FIELDS, row))) for row in rows])
+            Sale.objects.filter(pk__in=[row[0] for row in rows]).delete()
+            # 販売情報一覧のキャッシュ(件数・表の断片)を作り直させる
+            transaction.on_commit(bump_sales_version)
+            transaction.on_commit(forget_sale_count)
+        return len(rows)
+
+    def run(self, sales: QuerySet) -> ArchiveResult:
+        archived: int = 0
+        batches: int = 0
+        while True:
+            moved: int = self.archive_batch(sales)
+            if moved:
+                archived += moved
+                batches += 1
+            if moved < self.batch_size:
+                return ArchiveResult(archived, batches)
+
+
+def with_archive(build: Callable[[QuerySet], QuerySet]) -> QuerySet:
+    # 販売実績と保管済みの販売実績に同じ集計を行い、UNION ALLで1回のクエリにまとめる。
+    # 両方のテーブルに同じキーの行があると2行になるため、呼び出し側で合算する
+    return build(Sale.objects.all()).union(build(SaleArchive.objects.all()), all=True)
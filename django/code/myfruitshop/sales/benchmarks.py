@@ -0,0 +1,320 @@
+import asyncio
+import http.client
+import math
+import statistics
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.db.models import QuerySet
+from django.test import AsyncClient, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .catalog import fruit_catalog
+from .importer import SALE_DATE_FORMAT
+from .models import Fruit, Sale
+from .pagination import encode_cursor
+from .rollups import RollupKey, jst_day
+from .seeding import generate_sales
+
+# 画面ごとのSQLクエリ数の上限(セッションとユーザーの取得2件を含む、キャッシュが空の状態)
+QUERY_BUDGETS: Dict[str, int] = {
+    # 月別・日別・売れ筋(今日・今週・今月)・全体の累計
+    'sales_aggregate': 8,
+    'sales_aggregate_cached': 2,
+    'sales_list_first': 5,
+    'sales_list_deep_page': 5,
+    'sales_list_deep_cursor': 5,
+    # 表の断片がキャッシュにある場合は一覧を読まない
+    'sales_list_first_cached': 2,
+    'sales_list_deep_cursor_cached': 2,
+    'fruit_list': 3,
+}
+
+
+def csv_import_query_budget(rows: int, keys: int, batch_size: int, series: int) -> int:
+    # 認証・カタログ・一覧の再表示・セーブポイント分 + バッチごとのINSERT + 集計行ごとのUPDATE/INSERT
+    # + 累計の系列(果物ごと・全果物)ごとの作り直し
+    return 12 + math.ceil(rows / batch_size) + 2 * keys + series * 6 + math.ceil(2 * keys / 1000)
+
+
+class Measurement(NamedTuple):
+    name: str
+    status_code: int
+    queries: int
+    budget: int
+    timings: List[float]
+
+    @property
+    def over_budget(self) -> bool:
+        return self.queries > self.budget
+
+    def as_report(self) -> Dict[str, float]:
+        milliseconds: List[float] = [timing * 1000 for timing in self.timings]
+        return {
+            'status_code': self.status_code,
+            'queries': self.queries,
+            'budget': self.budget,
+            'min_ms': round(min(milliseconds), 2),
+            'median_ms': round(statistics.median(milliseconds), 2),
+            'max_ms': round(max(milliseconds), 2),
+        }
+
+
+def percentile(sorted_values: List[float], percent: float) -> float:
+    # 最近順位法(nearest-rank)によるパーセンタイル
+    index: int = max(math.ceil(percent / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+class LoadResult(NamedTuple):
+    # 同時接続数ごとの負荷試験の結果。timingsは1リクエストごとの応答時間(秒)
+    server: str
+    path: str
+    concurrency: int
+    timings: List[float]
+    errors: int
+    elapsed: float
+
+    def as_report(self) -> Dict[str, Any]:
+        milliseconds: List[float] = sorted(timing * 1000 for timing in self.timings)
+        return {
+            'server': self.server,
+            'path': self.path,
+            'concurrency': self.concurrency,
+            'requests': len(self.timings),
+            'errors': self.errors,
+            'requests_per_second': round(len(self.timings) / self.elapsed, 1) if self.elapsed else None,
+            'p50_ms': round(percentile(milliseconds, 50), 2),
+            'p95_ms': round(percentile(milliseconds, 95), 2),
+            'p99_ms': round(percentile(milliseconds, 99), 2),
+            'max_ms': round(milliseconds[-1], 2),
+        }
+
+
+def consume(response: Any) -> int:
+    # ストリーミングの応答は本文を最後まで読んだところまでを応答時間に含める
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+async def aconsume(response: Any) -> int:
+    if response.streaming:
+        return sum([len(chunk) async for chunk in response.streaming_content])
+    return len(response.content)
+
+
+def wsgi_load(path: str, session_key: str, concurrency: int, requests: int) -> LoadResult:
+    # WSGIの経路: スレッドごとのテストクライアント(WSGIHandler)から同時にリクエストする。
+    # 開発サーバーやgunicornのスレッドワーカーと同じく、1リクエストが1スレッドを占有する
+    local: threading.local = threading.local()
+    errors: List[int] = []
+
+    def call() -> float:
+        if not hasattr(local, 'client'):
+            local.client = Client()
+            local.client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+        started: float = time.perf_counter()
+        response: Any = local.client.get(path)
+        consume(response)
+        elapsed: float = time.perf_counter() - started
+        if response.status_code >= 400:
+            errors.append(response.status_code)
+        return elapsed
+
+    started: float = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        timings: List[float] = list(executor.map(lambda _: call(), range(requests)))
+    return LoadResult('wsgi', path, concurrency, timings, len(errors), time.perf_counter() - started)
+
+
+async def asgi_load(path: str, session_key: str, concurrency: int, requests: int) -> LoadResult:
+    # ASGIの経路: ASGIHandlerを使うAsyncClientから、同時接続数だけのタスクを同じイベントループで動かす
+    client: AsyncClient = AsyncClient()
+    client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+    semaphore: asyncio.Semaphore = asyncio.Semaphore(concurrency)
+    errors: List[int] = []
+
+    async def call() -> float:
+        async with semaphore:
+            started: float = time.perf_counter()
+            response: Any = await client.get(path)
+            await aconsume(response)
+            elapsed: float = time.perf_counter() - started
+            if response.status_code >= 400:
+                errors.append(response.status_code)
+            return elapsed
+
+    started: float = time.perf_counter()
+    timings: List[float] = list(await asyncio.gather(*(call() for _ in range(requests))))
+    return LoadResult('asgi', path, concurrency, timings, len(errors), time.perf_counter() - started)
+
+
+def http_load(label: str, base_url: str, path: str, session_key: str, concurrency: int, requests: int) -> LoadResult:
+    # 起動済みのサーバー(runserver・gunicornなど)にHTTPで負荷をかける。
+    # スレッドごとに1本の接続をKeep-Aliveで使い回し、サーバーに切られたら張り直す
+    url = urlsplit(base_url)
+    headers: Dict[str, str] = {'Cookie': f'{settings.SESSION_COOKIE_NAME}={session_key}'}
+    local: threading.local = threading.local()
+    errors: List[int] = []
+
+    def call() -> float:
+        started: float = time.perf_counter()
+        for attempt in range(2):
+            if getattr(local, 'connection', None) is None:
+                local.connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+            try:
+                local.connection.request('GET', path, headers=headers)
+                response: http.client.HTTPResponse = local.connection.getresponse()
+                response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                local.connection.close()
+                local.connection = None
+                if attempt:
+                    errors.append(0)
+                    return time.perf_counter() - started
+        if response.status >= 400 or response.getheader('Connection', '').lower() == 'close':
+            if response.status >= 400:
+                errors.append(response.status)
+            local.connection.close()
+            local.connection = None
+        return time.perf_counter() - started
+
+    started: float = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        timings: List[float] = list(executor.map(lambda _: call(), range(requests)))
+    return LoadResult(label, path, concurrency, timings, len(errors), time.perf_counter() - started)
+
+
+class MemoryUse(NamedTuple):
+    # 読み込みにかかった時間と、読み込んだ結果が保持しているメモリ・読み込み中の最大メモリ(バイト)
+    name: str
+    rows: int
+    seconds: float
+    retained: int
+    peak: int
+
+    def as_report(self, per_rows: int = 1_000_000) -> Dict[str, Any]:
+        scale: float = per_rows / self.rows if self.rows else 0.0
+        return {
+            'rows': self.rows,
+            'seconds': round(self.seconds, 3),
+            'retained_bytes': self.retained,
+            'peak_bytes': self.peak,
+            'bytes_per_row': round(self.retained / self.rows, 1) if self.rows else None,
+            f'retained_mb_per_{per_rows}_rows': round(self.retained * scale / 2 ** 20, 1),
+            f'peak_mb_per_{per_rows}_rows': round(self.peak * scale / 2 ** 20, 1),
+        }
+
+
+def measure_memory(name: str, load: Callable[[], Any]) -> Tuple[Any, MemoryUse]:
+    # tracemallocでPythonのオブジェクトが確保したメモリを数える(DBドライバーのCのバッファは含まない)
+    tracemalloc.start()
+    try:
+        started: float = time.perf_counter()
+        result: Any = load()
+        seconds: float = time.perf_counter() - started
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, MemoryUse(name, len(result), seconds, retained, peak)
+
+
+def sample_csv(fruits: List[Fruit], rows: int, start: date, end: date, seed: int = 0) -> bytes:
+    lines: List[str] = [
+        f'{sale.fruit.name},{sale.quantity},{sale.total_amount},'
+        f'{timezone.localtime(sale.sale_date).strftime(SALE_DATE_FORMAT)}'
+        for sale in generate_sales(fruits, rows, start, end, seed)
+    ]
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def csv_rollup_keys(fruits: List[Fruit], rows: int, start: date, end: date, seed: int = 0) -> Set[RollupKey]:
+    # CSVの日時は分単位に丸められるため、丸めた後の日付で数える
+    return {
+        (jst_day(sale.sale_date.replace(second=0)), sale.fruit.pk)
+        for sale in generate_sales(fruits, rows, start, end, seed)
+    }
+
+
+class ViewBenchmark:
+    # 同じ手順で画面を呼び出し、応答時間とSQLクエリ数を計測する(テストとbench_viewsコマンドで共用)
+    def __init__(self, client: Client, repeat: int = 5) -> None:
+        self.client: Client = client
+        self.repeat: int = repeat
+
+    def measure(self, name: str, call: Callable[[], object], budget: int, cold: bool = True) -> Measurement:
+        timings: List[float] = []
+        queries: int = 0
+        status_code: int = 0
+        if not cold:
+            call()
+        for _ in range(self.repeat):
+            if cold:
+                # 集計・件数・果物カタログのキャッシュを捨てて毎回DBから読む
+                cache.clear()
+                fruit_catalog.invalidate()
+            # クエリログは上限(9000件)で古いものから捨てられるため、計測前に空にしておく
+            connection.queries_log.clear()
+            with CaptureQueriesContext(connection) as captured:
+                started: float = time.perf_counter()
+                response = call()
+                timings.append(time.perf_counter() - started)
+            queries = max(queries, len(captured))
+            status_code = response.status_code
+        return Measurement(name, status_code, queries, budget, timings)
+
+    def get(self, url: str) -> Callable[[], object]:
+        return lambda: self.client.get(url)
+
+    def views(self) -> List[Measurement]:
+        sales: QuerySet = Sale.objects.filter(is_active=True).order_by('-sale_date', '-id')
+        total: int = sales.count()
+        list_url: str = reverse('sales_combined')
+        middle: Optional[Sale] = sales[total // 2] if total else None
+        deep_cursor_url: str = f"{list_url}?cursor={encode_cursor('next', middle)}"
+
+        return [
+            self.measure('sales_aggregate', self.get(reverse('sales_aggregate')),
+                         QUERY_BUDGETS['sales_aggregate']),
+            self.measure('sales_aggregate_cached', self.get(reverse('sales_aggregate')),
+                         QUERY_BUDGETS['sales_aggregate_cached'], cold=False),
+            self.measure('sales_list_first', self.get(list_url), QUERY_BUDGETS['sales_list_first']),
+            self.measure('sales_list_deep_page', self.get(f'{list_url}?page={max(total // 20, 1)}'),
+                         QUERY_BUDGETS['sales_list_deep_page']),
+            self.measure('sales_list_deep_cursor', self.get(deep_cursor_url), QUERY_BUDGETS['sales_list_deep_cursor']),
+            self.measure('sales_list_first_cached', self.get(list_url), QUERY_BUDGETS['sales_list_first_cached'],
+                         cold=False),
+            self.measure('sales_list_deep_cursor_cached', self.get(deep_cursor_url),
+                         QUERY_BUDGETS['sales_list_deep_cursor_cached'], cold=False),
+            self.measure('fruit_list', self.get(reverse('fruit')), QUERY_BUDGETS['fruit_list']),
+        ]
+
+    def csv_import(self, fruits: List[Fruit], rows: int, start: date, end: date,
+                   batch_size: int, seed: int = 0) -> Measurement:
+        content: bytes = sample_csv(fruits, rows, start, end, seed)
+        keys: Set[RollupKey] = csv_rollup_keys(fruits, rows, start, end, seed)
+        series: int = len({fruit_id for _, fruit_id in keys}) + 1
+
+        def upload() -> object:
+            # 計測のたびに件数が変わらないよう、取り込んだ内容はロールバックする
+            with transaction.atomic(), override_settings(
+                    SALES_IMPORT_ASYNC_THRESHOLD=len(content), SALES_IMPORT_BATCH_SIZE=batch_size):
+                response = self.client.post(reverse('sales_combined'), {
+                    'csv_file': SimpleUploadedFile('bench.csv', content, content_type='text/csv')})
+                transaction.set_rollback(True)
+            return response
+
+        return self.measure('csv_import', upload, csv_import_query_budget(rows, len(keys), batch_size, series))
@@ -0,0 +1,116 @@
+from collections import defaultdict
+from datetime import date, datetime
+from typing import DefaultDict, Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from django.db import transaction
+from django.db.models import F, Q, QuerySet
+from django.utils import timezone
+
+from .catalog import fruit_catalog
+from .models import Fruit, Sale
+from .rollups import RollupDeltas, SaleFigures, apply_deltas, day_bounds
+
+# 一括操作の種類
+BULK_ACTIONS: Dict[str, str] = {
+    'delete': '論理削除',
+    'restore': '復元',
+    'correct': '果物・個数の訂正',
+}
+
+# 1回のUPDATEで対象にするIDの数
+BULK_UPDATE_CHUNK_SIZE: int = 1000
+
+
+class BulkResult(NamedTuple):
+    action: str
+    matched: int
+    updated: int
+
+
+def select_sales(ids: Sequence[int] = (), start: Optional[date] = None, end: Optional[date] = None,
+                 fruit_name: str = '', import_batch: str = '') -> QuerySet:
+    # 指定された条件(ID・日本時間の期間・果物・取り込みID)をすべて満たす販売実績
+    condition: Q = day_bounds(start, end)
+    if ids:
+        condition &= Q(pk__in=ids)
+    if fruit_name:
+        condition &= Q(fruit__name=fruit_name)
+    if import_batch:
+        condition &= Q(import_batch=import_batch)
+    return Sale.objects.filter(condition)
+
+
+def chunks(ids: List[int]) -> List[List[int]]:
+    return [ids[i:i + BULK_UPDATE_CHUNK_SIZE] for i in range(0, len(ids), BULK_UPDATE_CHUNK_SIZE)]
+
+
+class SaleBulkUpdater:
+    # 選択した販売実績を1件ずつ保存せず、UPDATE文でまとめて更新する。
+    # 対象行を1回のSELECT ... FOR UPDATEで読み、更新前後の値の差分を同じトランザクションで集計に反映する
+    def __init__(self, sales: QuerySet) -> None:
+        self.sales: QuerySet = sales
+
+    def locked_figures(self, sales: QuerySet) -> List[Tuple[int, SaleFigures]]:
+        rows: QuerySet = sales.select_for_update().order_by('pk').values_list(
+            'pk', 'sale_date', 'fruit_id', 'total_amount', 'quantity', 'is_active')
+        return [(pk, SaleFigures(sale_date, fruit_id, total_amount, quantity, is_active))
+                for pk, sale_date, fruit_id, total_amount, quantity, is_active in rows]
+
+    def run(self, action: str, fruit: Optional[Fruit] = None, quantity: Optional[int] = None) -> BulkResult:
+        if action not in BULK_ACTIONS:
+            raise ValueError(f'Unknown bulk action: {action}')
+        if action == 'correct' and fruit is None and quantity is None:
+            raise ValueError('Correction requires a fruit or a quantity.')
+
+        with transaction.atomic():
+            if action == 'correct':
+                targets: List[Tuple[int, SaleFigures]] = self.locked_figures(self.sales)
+                updated: int = self.correct(targets, fruit, quantity)
+            else:
+                # 論理削除は有効な行だけ、復元は削除済みの行だけを対象にする
+                targets = self.locked_figures(self.sales.filter(is_active=action == 'delete'))
+                updated = self.set_active(targets, action == 'restore')
+        return BulkResult(action, len(targets), updated)
+
+    def set_active(self, targets: List[Tuple[int, SaleFigures]], is_active: bool) -> int:
+        deltas: RollupDeltas = RollupDeltas()
+        for _, figures in targets:
+            deltas.add(figures._replace(is_active=True), sign=1 if is_active else -1)
+
+        updated: int = 0
+        now: datetime = timezone.now()
+        for ids in chunks([pk for pk, _ in targets]):
+            updated += Sale.objects.filter(pk__in=ids).update(is_active=is_active, updated_at=now)
+        if deltas:
+            apply_deltas(deltas)
+        return updated
+
+    def correct(self, targets: List[Tuple[int, SaleFigures]], fruit: Optional[Fruit], quantity: Optional[int]) -> int:
+        # 売り上げは訂正後の果物の販売日時点の単価 x 個数で計算し直す(単品の編集画面と同じ)
+        fruit_ids: Set[int] = {fruit.pk} if fruit is not None else {figures.fruit_id for _, figures in targets}
+        current_prices: Dict[int, int] = dict(Fruit.objects.filter(pk__in=fruit_ids).values_list('pk', 'price'))
+
+        deltas: RollupDeltas = RollupDeltas()
+        by_price: DefaultDict[Tuple[int, int], List[int]] = defaultdict(list)
+        for pk, before in targets:
+            fruit_id: int = fruit.pk if fruit is not None else before.fruit_id
+            price: int = fruit_catalog.price_at(fruit_id, before.sale_date, current_prices[fruit_id])
+            new_quantity: int = quantity if quantity is not None else before.quantity
+            deltas.add(before, sign=-1)
+            deltas.add(before._replace(fruit_id=fruit_id, quantity=new_quantity, total_amount=new_quantity * price))
+            by_price[(fruit_id, price)].append(pk)
+
+        # 訂正後の(果物, 単価)ごとに、IDをまとめてUPDATEする
+        updated: int = 0
+        now: datetime = timezone.now()
+        for (fruit_id, price), pks in sorted(by_price.items()):
+            values: Dict[str, object] = {'fruit_id': fruit_id, 'updated_at': now}
+            if quantity is not None:
+                values.update(quantity=quantity, total_amount=quantity * price)
+            else:
+                values['total_amount'] = F('quantity') * price
+            for ids in chunks(pks):
+                updated += Sale.objects.filter(pk__in=ids).update(**values)
+        if deltas:
+            apply_deltas(deltas)
+        return updated
@@ -0,0 +1,130 @@
+import threading
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Iterable
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+SALES_VERSION_KEY: str = 'sales:data_version'
+CACHE_STATS_NAMES_KEY: str = 'sales:cache_stats:names'
+
+
+def sales_data_version() -> int:
+    # キャッシュが消えても古い版番号と衝突しないよう、初期値は現在時刻(ミリ秒)にする
+    version: Any = cache.get(SALES_VERSION_KEY)
+    if version is None:
+        cache.add(SALES_VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(SALES_VERSION_KEY)
+    return version
+
+
+def bump_sales_version() -> None:
+    # 販売実績が変わったら版番号を進め、以前の版のキャッシュを参照されないようにする
+    try:
+        cache.incr(SALES_VERSION_KEY)
+    except ValueError:
+        sales_data_version()
+
+
+class CacheStatsBuffer:
+    # ヒット・ミスの回数はプロセス内で数え、一定時間(SALES_CACHE_STATS_FLUSH_SECONDS)ごとに共有のキャッシュへまとめて加算する。
+    # キャッシュを参照するたびにキャッシュへ書き込まないため、表示の速さに影響しない
+    def __init__(self) -> None:
+        self._lock: threading.Lock = threading.Lock()
+        self._counts: Counter = Counter()
+        self._flushed_at: float = time.monotonic()
+
+    def add(self, name: str, kind: str) -> bool:
+        # 加算すべき時間が経っていればTrueを返す(呼び出し元がflushする)
+        with self._lock:
+            self._counts[(name, kind)] += 1
+            return time.monotonic() - self._flushed_at >= settings.SALES_CACHE_STATS_FLUSH_SECONDS
+
+    def flush(self) -> None:
+        with self._lock:
+            counts: Counter = self._counts
+            self._counts = Counter()
+            self._flushed_at = time.monotonic()
+        if not counts:
+            return
+
+        names: set = cache.get(CACHE_STATS_NAMES_KEY) or set()
+        new_names: set = {name for name, _ in counts} - names
+        if new_names:
+            cache.set(CACHE_STATS_NAMES_KEY, names | new_names, None)
+        for (name, kind), value in counts.items():
+            stats_key: str = f'sales:cache_stats:{name}:{kind}'
+            if not cache.add(stats_key, value, None):
+                try:
+                    cache.incr(stats_key, value)
+                except ValueError:
+                    cache.set(stats_key, value, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._counts = Counter()
+            self._flushed_at = time.monotonic()
+
+
+stats_buffer: CacheStatsBuffer = CacheStatsBuffer()
+
+
+def _count(name: str, kind: str) -> None:
+    if stats_buffer.add(name, kind):
+        stats_buffer.flush()
+
+
+async def _acount(name: str, kind: str) -> None:
+    if stats_buffer.add(name, kind):
+        await sync_to_async(stats_buffer.flush)()
+
+
+def version_key(name: str, key_parts: Iterable[Any]) -> str:
+    parts: str = ':'.join(str(part) for part in key_parts)
+    return f'sales:{name}:v{sales_data_version()}:{parts}'
+
+
+def cached_by_version(name: str, key_parts: Iterable[Any], builder: Callable[[], Any], timeout: int = None) -> Any:
+    # 販売実績の版番号をキーに含めてキャッシュし、ヒット・ミスの回数を数える
+    key: str = version_key(name, key_parts)
+    value: Any = cache.get(key)
+    if value is not None:
+        _count(name, 'hits')
+        return value
+
+    _count(name, 'misses')
+    value = builder()
+    cache.set(key, value, settings.SALES_STATS_CACHE_TIMEOUT if timeout is None else timeout)
+    return value
+
+
+async def acached_by_version(name: str, key_parts: Iterable[Any], builder: Callable[[], Awaitable[Any]],
+                             timeout: int = None) -> Any:
+    # cached_by_versionの非同期版。キーはcached_by_versionと共通で、builderはコルーチンを返す関数
+    key: str = await sync_to_async(version_key)(name, key_parts)
+    value: Any = await cache.aget(key)
+    if value is not None:
+        await _acount(name, 'hits')
+        return value
+
+    await _acount(name, 'misses')
+    value = await builder()
+    await cache.aset(key, value, settings.SALES_STATS_CACHE_TIMEOUT if timeout is None else timeout)
+    return value
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    # このプロセスで数えた分は加算してから読む(他のプロセスの分は最大でSALES_CACHE_STATS_FLUSH_SECONDS遅れる)
+    stats_buffer.flush()
+    stats: Dict[str, Dict[str, Any]] = {}
+    for name in sorted(cache.get(CACHE_STATS_NAMES_KEY) or set()):
+        hits: int = cache.get(f'sales:cache_stats:{name}:hits', 0)
+        misses: int = cache.get(f'sales:cache_stats:{name}:misses', 0)
+        stats[name] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / (hits + misses) if hits + misses else None,
+        }
+    return {'version': sales_data_version(), 'caches': stats}
@@ -0,0 +1,126 @@
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Fruit
+from .price_history import PriceTable, load_price_table, price_at
+
+CATALOG_VERSION_KEY: str = 'sales:fruit_catalog_version'
+
+
+class CatalogFruit(NamedTuple):
+    id: int
+    name: str
+    folded_name: str
+    price: int
+
+    def as_model(self) -> Fruit:
+        # 保存済みの果物として扱えるインスタンスを返す(外部キーへの代入用)
+        fruit: Fruit = Fruit(id=self.id, name=self.name, price=self.price, is_active=True)
+        fruit._state.adding = False
+        return fruit
+
+
+def catalog_version() -> int:
+    version: Any = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version() -> None:
+    # 果物マスタの更新をコミット後に各プロセスのカタログへ知らせる
+    def bump() -> None:
+        try:
+            cache.incr(CATALOG_VERSION_KEY)
+        except ValueError:
+            catalog_version()
+
+    transaction.on_commit(bump)
+
+
+def fruit_changed(sender: Any, **kwargs: Any) -> None:
+    # 同じプロセス内では次の参照ですぐに読み直す(他プロセスへはコミット後に版番号で知らせる)
+    fruit_catalog.invalidate()
+    bump_catalog_version()
+
+
+class FruitCatalog:
+    # 有効な果物と全果物の単価の履歴をプロセス内に保持し、版番号が変わったときだけDBから読み直す
+    def __init__(self) -> None:
+        self._lock: threading.Lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._by_id: Dict[int, CatalogFruit] = {}
+        self._by_name: Dict[str, CatalogFruit] = {}
+        self._by_folded_name: Dict[str, CatalogFruit] = {}
+        self._prices: PriceTable = {}
+
+    def _refresh(self) -> None:
+        version: int = catalog_version()
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            fruits: List[CatalogFruit] = [
+                CatalogFruit(pk, name, name.casefold(), price)
+                for pk, name, price in Fruit.objects.filter(is_active=True).order_by('id').values_list(
+                    'id', 'name', 'price')
+            ]
+            self._by_id = {fruit.id: fruit for fruit in fruits}
+            self._by_name = {fruit.name: fruit for fruit in fruits}
+            self._by_folded_name = {fruit.folded_name: fruit for fruit in fruits}
+            self._prices = load_price_table()
+            self._version = version
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._version = None
+
+    def all(self) -> List[CatalogFruit]:
+        self._refresh()
+        return list(self._by_id.values())
+
+    def get(self, pk: Any) -> Optional[CatalogFruit]:
+        self._refresh()
+        try:
+            return self._by_id.get(int(pk))
+        except (TypeError, ValueError):
+            return None
+
+    def by_name(self, name: str, ignore_case: bool = False) -> Optional[CatalogFruit]:
+        self._refresh()
+        if ignore_case:
+            return self._by_folded_name.get(name.casefold())
+        return self._by_name.get(name)
+
+    def prices(self) -> Dict[str, Tuple[int, int]]:
+        # CSV取り込み用の 果物名 -> (果物ID, 単価)
+        self._refresh()
+        return {name: (fruit.id, fruit.price) for name, fruit in self._by_name.items()}
+
+    def price_table(self) -> PriceTable:
+        # CSV取り込み用の 果物ID -> 単価の履歴(読み取り専用として扱う)
+        self._refresh()
+        return self._prices
+
+    def price_at(self, fruit_id: int, moment: Optional[datetime], default: int) -> int:
+        # 販売日時時点の単価(二分探索のみでDBには問い合わせない)
+        self._refresh()
+        return price_at(self._prices, fruit_id, moment, default)
+
+    def choices(self) -> List[Tuple[Any, str]]:
+        return [('', '---------')] + [(fruit.id, fruit.name) for fruit in self.all()]
+
+
+fruit_catalog: FruitCatalog = FruitCatalog()
+
+
+def fruit_choices() -> List[Tuple[Any, str]]:
+    # フォームの選択肢用(フィールドの複製時にカタログ自体が複製されないよう関数で渡す)
+    return fruit_catalog.choices()
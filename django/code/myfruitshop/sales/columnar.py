@@ -0,0 +1,262 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import date, datetime, tzinfo
+from itertools import compress
+from typing import Any, DefaultDict, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from django.db.models import Count, QuerySet, Sum
+from django.db.models.functions import TruncDate
+
+from .aggregates import BucketKey, iter_buckets, local_midnight
+
+# values_listで一度に読み込む行数
+COLUMN_CHUNK_SIZE: int = 10_000
+
+# 列名 -> 型コード(すべて8バイトの整数)
+COLUMN_TYPES: Dict[str, str] = {
+    'epochs': 'q',  # 販売日時(日次集計は日本時間の日付の0時)のUNIX時間(秒)
+    'fruit_ids': 'q',
+    'quantities': 'q',
+    'amounts': 'q',
+    'counts': 'q',  # 件数(販売実績は1、日次集計はsale_count)
+}
+
+# 8バイトの整数の最小値(空の列の「直前の販売日時」)
+MIN_EPOCH: int = -(2 ** 63)
+
+# 集計結果: グループのキー -> [売り上げ, 個数, 件数]
+GroupTotals = Dict[Tuple[int, ...], List[int]]
+
+
+class SalesColumns:
+    # 販売実績・日次集計をモデルのインスタンスにせず、列ごとの型付き配列で保持する。
+    # 果物名は果物IDごとに1つだけ保持する(辞書による符号化)。
+    # epoch_sortedは販売日時の列が昇順かどうか(昇順なら期間の絞り込み・区間分けを二分探索で行う)
+    def __init__(self) -> None:
+        for name, typecode in COLUMN_TYPES.items():
+            setattr(self, name, array(typecode))
+        self.fruit_names: Dict[int, str] = {}
+        self.epoch_sorted: bool = True
+
+    def __len__(self) -> int:
+        return len(self.epochs)
+
+    @property
+    def nbytes(self) -> int:
+        # 列の配列が使うメモリ(果物名の辞書は除く)
+        return sum(column.itemsize * len(column) for column in self.columns())
+
+    def columns(self) -> List[array]:
+        return [getattr(self, name) for name in COLUMN_TYPES]
+
+    def append_sales(self, rows: Iterable[Tuple[Any, ...]]) -> None:
+        # (ID, 販売日時, 果物ID, 果物名, 個数, 売り上げ) の行を列に追加する
+        last: int = self.epochs[-1] if self.epochs else MIN_EPOCH
+        for _, sale_date, fruit_id, fruit_name, quantity, amount in rows:
+            epoch: int = int(sale_date.timestamp())
+            if epoch < last:
+                self.epoch_sorted = False
+            last = epoch
+            self.epochs.append(epoch)
+            self.fruit_ids.append(fruit_id)
+            self.quantities.append(quantity)
+            self.amounts.append(amount)
+            self.counts.append(1)
+            self.fruit_names.setdefault(fruit_id, fruit_name)
+
+    def append_rollups(self, rows: Iterable[Tuple[Any, ...]], tz: tzinfo) -> None:
+        # (日付, 果物ID, 果物名, 個数, 売り上げ, 件数) の行を列に追加する。日付はその日の0時とする
+        midnights: Dict[date, int] = {}
+        last: int = self.epochs[-1] if self.epochs else MIN_EPOCH
+        for day, fruit_id, fruit_name, quantity, amount, count in rows:
+            epoch: Optional[int] = midnights.get(day)
+            if epoch is None:
+                epoch = midnights[day] = int(local_midnight(day, tz).timestamp())
+            if epoch < last:
+                self.epoch_sorted = False
+            last = epoch
+            self.epochs.append(epoch)
+            self.fruit_ids.append(fruit_id)
+            self.quantities.append(quantity)
+            self.amounts.append(amount)
+            self.counts.append(count)
+            self.fruit_names.setdefault(fruit_id, fruit_name)
+
+    def select(self, mask: Sequence[bool]) -> 'SalesColumns':
+        # maskが真の行だけを持つ新しい列を返す(行の順序は変わらない)
+        selected: SalesColumns = SalesColumns()
+        for name, typecode in COLUMN_TYPES.items():
+            setattr(selected, name, array(typecode, compress(getattr(self, name), mask)))
+        selected.fruit_names = self.fruit_names
+        selected.epoch_sorted = self.epoch_sorted
+        return selected
+
+    def slice(self, start: int, stop: int) -> 'SalesColumns':
+        # [start, stop) 行目の新しい列を返す
+        sliced: SalesColumns = SalesColumns()
+        for name in COLUMN_TYPES:
+            setattr(sliced, name, getattr(self, name)[start:stop])
+        sliced.fruit_names = self.fruit_names
+        sliced.epoch_sorted = self.epoch_sorted
+        return sliced
+
+    def sorted_by_epoch(self) -> 'SalesColumns':
+        # 販売日時の昇順に並べた列。すでに昇順ならそのまま返す。
+        # 並べ替えは行数 x log(行数) かかるため、同じ列を何度も絞り込む・集計する場合に使う
+        if self.epoch_sorted:
+            return self
+        order: List[int] = sorted(range(len(self)), key=self.epochs.__getitem__)
+        ordered: SalesColumns = SalesColumns()
+        for name, typecode in COLUMN_TYPES.items():
+            column: array = getattr(self, name)
+            setattr(ordered, name, array(typecode, [column[index] for index in order]))
+        ordered.fruit_names = self.fruit_names
+        return ordered
+
+    def between(self, start: datetime, end: datetime) -> 'SalesColumns':
+        # [start, end) の行。販売日時が昇順なら二分探索で範囲を切り出す
+        low: int = int(start.timestamp())
+        high: int = int(end.timestamp())
+        if not self.epoch_sorted:
+            return self.select([low <= epoch < high for epoch in self.epochs])
+        first: int = bisect_left(self.epochs, low)
+        return self.slice(first, bisect_left(self.epochs, high, first))
+
+    def for_fruits(self, fruit_ids: Iterable[int]) -> 'SalesColumns':
+        wanted: Set[int] = set(fruit_ids)
+        return self.select([fruit_id in wanted for fruit_id in self.fruit_ids])
+
+    def bucket_bounds(self, edges: Sequence[int]) -> List[int]:
+        # 区間の境界(UNIX時間の昇順)ごとに、昇順の販売日時の列で境界以上となる最初の行番号を二分探索で求める。
+        # i番目の区間の行は [bounds[i], bounds[i + 1]) になる
+        if not self.epoch_sorted:
+            raise ValueError('bucket_bounds requires columns sorted by epoch')
+        return [bisect_left(self.epochs, edge) for edge in edges]
+
+    def bucket_codes(self, edges: Sequence[int]) -> array:
+        # 区間の境界(UNIX時間の昇順、最後は終了)で各行の区間番号を求める。範囲外の行は-1
+        last: int = len(edges) - 1
+        if not self.epoch_sorted:
+            codes: array = array('l')
+            for epoch in self.epochs:
+                index: int = bisect_right(edges, epoch) - 1
+                codes.append(index if 0 <= index < last else -1)
+            return codes
+        # 昇順なら区間の境界の行番号を二分探索し、区間番号を区間の行数だけ並べる
+        bounds: List[int] = self.bucket_bounds(edges)
+        codes = array('l', [-1]) * bounds[0]
+        for code, (start, stop) in enumerate(zip(bounds, bounds[1:])):
+            codes.extend(array('l', [code]) * (stop - start))
+        codes.extend(array('l', [-1]) * (len(self) - bounds[-1]))
+        return codes
+
+    def group_sum(self, *keys: Sequence[int]) -> GroupTotals:
+        # キーの列(区間番号・果物IDなど)の組ごとに売り上げ・個数・件数を合計する。キーに-1を含む行は除く
+        totals: DefaultDict[Tuple[int, ...], List[int]] = defaultdict(lambda: [0, 0, 0])
+        for key, amount, quantity, count in zip(zip(*keys), self.amounts, self.quantities, self.counts):
+            if -1 in key:
+                continue
+            figures: List[int] = totals[key]
+            figures[0] += amount
+            figures[1] += quantity
+            figures[2] += count
+        return dict(totals)
+
+    def group_by_bucket(self, edges: Sequence[int], by_fruit: bool = True) -> GroupTotals:
+        # 区間(と果物)ごとに合計する。キーは (区間番号, 果物ID)、by_fruitがFalseなら (区間番号,)。
+        # 販売日時が昇順なら区間の行を二分探索で切り出し、範囲外の行は読まない
+        if not self.epoch_sorted:
+            codes: array = self.bucket_codes(edges)
+            return self.group_sum(codes, self.fruit_ids) if by_fruit else self.group_sum(codes)
+        bounds: List[int] = self.bucket_bounds(edges)
+        totals: GroupTotals = {}
+        for code, (start, stop) in enumerate(zip(bounds, bounds[1:])):
+            if start == stop:
+                continue
+            if not by_fruit:
+                totals[(code,)] = [sum(self.amounts[start:stop]), sum(self.quantities[start:stop]),
+                                   sum(self.counts[start:stop])]
+                continue
+            for key, amount, quantity, count in zip(
+                    self.fruit_ids[start:stop], self.amounts[start:stop],
+                    self.quantities[start:stop], self.counts[start:stop]):
+                figures: Optional[List[int]] = totals.get((code, key))
+                if figures is None:
+                    totals[(code, key)] = [amount, quantity, count]
+                else:
+                    figures[0] += amount
+                    figures[1] += quantity
+                    figures[2] += count
+        return totals
+
+
+def calendar_edges(start: datetime, end: datetime, granularity: str, tz: tzinfo) -> Tuple[List[BucketKey], array]:
+    # [start, end) と重なる区間の開始と、各区間の境界のUNIX時間(区間数 + 1個)
+    buckets: List[BucketKey] = list(iter_buckets(start, end, granularity, tz))
+    edges: array = array('q')
+    for bucket in buckets:
+        moment: datetime = bucket if granularity == 'hour' else local_midnight(bucket, tz)
+        edges.append(max(int(moment.timestamp()), int(start.timestamp())))
+    edges.append(int(end.timestamp()))
+    return buckets, edges
+
+
+def chunk_query(queryset: QuerySet, fields: Sequence[str], chunk_size: int, last_pk: Optional[int]) -> QuerySet:
+    chunk: QuerySet = queryset.order_by('pk')
+    if last_pk is not None:
+        chunk = chunk.filter(pk__gt=last_pk)
+    return chunk.values_list('pk', *fields)[:chunk_size]
+
+
+def iter_chunks(queryset: QuerySet, fields: Sequence[str], chunk_size: int) -> Iterable[List[Tuple[Any, ...]]]:
+    # 主キーの範囲で区切ってvalues_listを繰り返す(MySQLでも結果全体をDBドライバーに保持させない)
+    last_pk: Optional[int] = None
+    while True:
+        rows: List[Tuple[Any, ...]] = list(chunk_query(queryset, fields, chunk_size, last_pk))
+        yield rows
+        if len(rows) < chunk_size:
+            return
+        last_pk = rows[-1][0]
+
+
+SALE_FIELDS: Tuple[str, ...] = ('sale_date', 'fruit_id', 'fruit__name', 'quantity', 'total_amount')
+ROLLUP_FIELDS: Tuple[str, ...] = ('day', 'fruit_id', 'fruit__name', 'quantity', 'total_amount', 'sale_count')
+
+
+def load_sales(queryset: QuerySet, chunk_size: int = COLUMN_CHUNK_SIZE) -> SalesColumns:
+    # 販売実績(件数が多い)は主キーの範囲ごとに読み込む
+    columns: SalesColumns = SalesColumns()
+    for rows in iter_chunks(queryset, SALE_FIELDS, chunk_size):
+        columns.append_sales(rows)
+    return columns
+
+
+def rollup_rows(queryset: QuerySet) -> QuerySet:
+    # 日次集計(日付 x 果物で一意)は(日付, 果物)のインデックスの順に読む
+    return queryset.order_by('day', 'fruit_id').values_list(*ROLLUP_FIELDS)
+
+
+def local_day_rows(queryset: QuerySet, tz: tzinfo) -> QuerySet:
+    # 日本時間以外では、販売実績をDBでそのタイムゾーンの日付 x 果物ごとに集計する(日次集計と同じ列の並び)。
+    # 夏時間の切り替わる日もDBのタイムゾーン変換で正しい日付になる。
+    # 保管済みの販売実績とUNIONできるよう並び順は指定しない(同じキーの行はgroup_sumで合算される)
+    return (
+        queryset.annotate(local_day=TruncDate('sale_date', tzinfo=tz))
+        .values('local_day', 'fruit_id', 'fruit__name')
+        .annotate(quantity_sum=Sum('quantity'), amount_sum=Sum('total_amount'), sale_count=Count('id'))
+        .order_by()
+        .values_list('local_day', 'fruit_id', 'fruit__name', 'quantity_sum', 'amount_sum', 'sale_count')
+    )
+
+
+def load_rollups(rows: QuerySet, tz: tzinfo, chunk_size: int = COLUMN_CHUNK_SIZE) -> SalesColumns:
+    columns: SalesColumns = SalesColumns()
+    columns.append_rollups(rows.iterator(chunk_size=chunk_size), tz)
+    return columns
+
+
+async def aload_rollups(rows: QuerySet, tz: tzinfo) -> SalesColumns:
+    columns: SalesColumns = SalesColumns()
+    columns.append_rollups([row async for row in rows], tz)
+    return columns
@@ -0,0 +1,73 @@
+import csv
+from datetime import datetime
+from typing import Any, AsyncIterator, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+
+from .importer import SALE_DATE_FORMAT
+
+
+class Echo:
+    # csv.writerの出力をそのまま返す擬似バッファ
+    def write(self, value: str) -> str:
+        return value
+
+
+EXPORT_COLUMNS: Tuple[str, ...] = ('pk', 'sale_date', 'fruit__name', 'quantity', 'total_amount')
+
+
+def export_chunk(queryset: QuerySet, last: Optional[Tuple[datetime, int]], chunk_size: int) -> QuerySet:
+    # (sale_date, id)がlastより後の行をchunk_size件取得するクエリ
+    if last is not None:
+        queryset = queryset.filter(Q(sale_date__gte=last[0]), Q(sale_date__gt=last[0]) | Q(pk__gt=last[1]))
+    return queryset[:chunk_size]
+
+
+def export_row(sale_date: datetime, fruit_name: str, quantity: int, total_amount: int) -> List[Any]:
+    return [fruit_name, quantity, total_amount, timezone.localtime(sale_date).strftime(SALE_DATE_FORMAT)]
+
+
+def export_sales_csv(queryset: QuerySet, chunk_size: Optional[int] = None) -> Iterator[str]:
+    # BulkSaleFormで取り込める4列(果物, 個数, 売り上げ, 販売日時)のCSVを1行ずつ返す。
+    # MySQLのドライバは結果を全件クライアントに読み込むため、(sale_date, id)の範囲で
+    # chunk_size件ずつ区切って取得し、どのDBでもメモリ使用量を一定に保つ
+    chunk_size = chunk_size or settings.SALES_EXPORT_CHUNK_SIZE
+    writer: Any = csv.writer(Echo())
+    queryset = queryset.order_by('sale_date', 'id')
+    last: Optional[Tuple[datetime, int]] = None
+
+    while True:
+        fetched: int = 0
+        for pk, sale_date, *values in export_chunk(queryset, last, chunk_size).values_list(
+            *EXPORT_COLUMNS
+        ).iterator(chunk_size=chunk_size):
+            fetched += 1
+            last = (sale_date, pk)
+            yield writer.writerow(export_row(sale_date, *values))
+
+        if fetched < chunk_size:
+            return
+
+
+async def aexport_sales_csv(queryset: QuerySet, chunk_size: Optional[int] = None) -> AsyncIterator[str]:
+    # export_sales_csvの非同期版(ASGIのStreamingHttpResponse用)。チャンクの区切り方は同じ
+    chunk_size = chunk_size or settings.SALES_EXPORT_CHUNK_SIZE
+    writer: Any = csv.writer(Echo())
+    queryset = queryset.order_by('sale_date', 'id')
+    last: Optional[Tuple[datetime, int]] = None
+
+    while True:
+        fetched: int = 0
+        # Django 4.2ではvalues_list()のaiterator()がイベントループ上でSQLを実行してしまうため、values()で読む
+        async for row in export_chunk(queryset, last, chunk_size).values(*EXPORT_COLUMNS).aiterator(
+            chunk_size=chunk_size
+        ):
+            pk, sale_date, *values = [row[column] for column in EXPORT_COLUMNS]
+            fetched += 1
+            last = (sale_date, pk)
+            yield writer.writerow(export_row(sale_date, *values))
+
+        if fetched < chunk_size:
+            return
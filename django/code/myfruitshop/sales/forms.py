@@ -1,7 +1,53 @@
+from datetime import date, datetime, time, timedelta, tzinfo
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
 from django import forms
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from .models import Sale, Fruit
-from typing import Dict, Any, Union
+from .aggregates import GRANULARITIES
+from .bulk import BULK_ACTIONS
+from .catalog import CatalogFruit, fruit_catalog, fruit_choices
+from typing import Dict, Any, List, Optional, Union
+
+
+class CatalogFruitField(forms.ChoiceField):
+    # 果物カタログから選択肢と値を解決し、DBへの問い合わせを行わない
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, choices=fruit_choices, **kwargs)
+        self.extra_fruit: Optional[Fruit] = None
+
+    def valid_value(self, value: Any) -> bool:
+        return self.resolve(value) is not None
+
+    def resolve(self, value: Any) -> Optional[Fruit]:
+        if self.extra_fruit is not None and str(self.extra_fruit.pk) == str(value):
+            return self.extra_fruit
+        fruit: Optional[CatalogFruit] = fruit_catalog.get(value)
+        return fruit.as_model() if fruit is not None else None
+
+    def to_python(self, value: Any) -> Optional[Fruit]:
+        if value in self.empty_values:
+            return None
+        return value
+
+    def validate(self, value: Any) -> None:
+        if value in self.empty_values:
+            if self.required:
+                raise ValidationError(self.error_messages['required'], code='required')
+            return
+        if not self.valid_value(value):
+            raise ValidationError(
+                self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value})
+
+    def clean(self, value: Any) -> Optional[Fruit]:
+        value = super().clean(value)
+        return self.resolve(value) if value not in self.empty_values else None
+
+    def allow_fruit(self, fruit: Fruit) -> None:
+        # 削除済みの果物を持つ販売情報を編集する場合に、その果物も選択できるようにする
+        self.extra_fruit = fruit
+        self.choices = list(self.choices) + [(fruit.pk, fruit.name)]
 
 class FruitForm(forms.ModelForm):
     class Meta:
@@ -20,16 +66,27 @@ class FruitForm(forms.ModelForm):
             errors.extend(self.errors['__all__'])
         return errors
 
-class SaleAddForm(forms.ModelForm):
-    class Meta:
-        model = Sale
-        fields = ['fruit', 'quantity', 'sale_date']
+class CatalogFruitFormMixin:
+    # fruitはMeta.fieldsに含めず、モデル検証での存在確認クエリを避ける
+    field_order = ['fruit', 'quantity', 'total_amount', 'sale_date']
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        if self.instance.fruit_id is not None:
+            self.initial.setdefault('fruit', self.instance.fruit_id)
+
+    def assign_fruit(self, fruit: Optional[Fruit]) -> None:
+        if fruit is not None:
+            self.instance.fruit = fruit
 
-        # クエリセットをis_active=Trueにフィルタリング
-        self.fields['fruit'].queryset = Fruit.objects.filter(is_active=True)
+
+class SaleAddForm(CatalogFruitFormMixin, forms.ModelForm):
+    # 選択肢は有効な果物(果物カタログ)のみ
+    fruit = CatalogFruitField()
+
+    class Meta:
+        model = Sale
+        fields = ['quantity', 'sale_date']
 
     def clean(self) -> Dict[str, Any]:
         cleaned_data = super().clean()
@@ -37,57 +94,205 @@ class SaleAddForm(forms.ModelForm):
         quantity = cleaned_data.get('quantity')
 
         # Fruitが存在するか確認
-        try:
-            fruit_instance = Fruit.objects.get(name=fruit)
-        except Fruit.DoesNotExist:
+        if fruit is None or fruit_catalog.get(fruit.pk) is None:
             raise forms.ValidationError('Selected fruit does not exist.')
+        self.assign_fruit(fruit)
 
         return cleaned_data
 
-class SaleCombinedForm(forms.ModelForm):
+class SaleCombinedForm(CatalogFruitFormMixin, forms.ModelForm):
+    fruit = CatalogFruitField()
     total_amount = forms.DecimalField()
 
     class Meta:
         model = Sale
-        fields = ['fruit', 'quantity', 'total_amount', 'sale_date']
+        fields = ['quantity', 'total_amount', 'sale_date']
 
     def clean(self) -> Dict[str, Union[str, int, float]]:
         cleaned_data = super().clean()
         fruit = cleaned_data.get('fruit')
         quantity = cleaned_data.get('quantity')
 
-        if not Fruit.objects.filter(name=fruit).exists():
+        if fruit is None:
             raise forms.ValidationError('Selected fruit does not exist.')
+        self.assign_fruit(fruit)
 
         if 'total_amount' in cleaned_data:
-            current_price = fruit.price
-            total_amount = quantity * current_price
+            # 販売日時点の単価(単価の履歴から求める)で確かめる
+            sale_price = fruit_catalog.price_at(fruit.pk, cleaned_data.get('sale_date'), fruit.price)
+            total_amount = quantity * sale_price
             if cleaned_data.get('total_amount') != total_amount:
                 raise forms.ValidationError(
-                    'Total amount does not match the current price.')
+                    'Total amount does not match the price at the sale date.')
 
         return cleaned_data
 
 class BulkSaleForm(forms.Form):
     csv_file = forms.FileField()
 
-class SaleEditForm(forms.ModelForm):
+class SaleExportForm(forms.Form):
+    ACTIVE_CHOICES = [
+        ('active', '有効のみ'),
+        ('inactive', '削除済みのみ'),
+        ('all', 'すべて'),
+    ]
+
+    start = forms.DateField(required=False)
+    end = forms.DateField(required=False)
+    fruit = forms.CharField(required=False)
+    active = forms.ChoiceField(choices=ACTIVE_CHOICES, required=False)
+
+class SaleBulkForm(forms.Form):
+    # 対象はID(カンマ・空白区切り)・日本時間の期間・果物名・取り込みIDの組み合わせで選ぶ
+    action = forms.ChoiceField(choices=list(BULK_ACTIONS.items()))
+    ids = forms.CharField(required=False)
+    start = forms.DateField(required=False)
+    end = forms.DateField(required=False)
+    fruit = forms.CharField(required=False)
+    import_batch = forms.CharField(required=False, max_length=32)
+    # 訂正後の値(訂正のときだけ使う)。果物は有効な果物から選ぶ
+    new_fruit = CatalogFruitField(required=False)
+    quantity = forms.IntegerField(required=False, min_value=1)
+
+    def clean_ids(self) -> List[int]:
+        value: str = self.cleaned_data.get('ids') or ''
+        try:
+            return sorted({int(item) for item in value.replace(',', ' ').split()})
+        except ValueError:
+            raise forms.ValidationError('IDは整数で入力してください。')
+
+    def clean(self) -> Dict[str, Any]:
+        cleaned_data = super().clean()
+        if not any(cleaned_data.get(name) for name in ('ids', 'start', 'end', 'fruit', 'import_batch')):
+            # 条件なしで全件を更新しないようにする
+            raise forms.ValidationError('対象の条件を1つ以上指定してください。')
+        start: Optional[date] = cleaned_data.get('start')
+        end: Optional[date] = cleaned_data.get('end')
+        if start is not None and end is not None and start > end:
+            raise forms.ValidationError('終了日は開始日以降にしてください。')
+        if cleaned_data.get('action') == 'correct' and cleaned_data.get('new_fruit') is None \
+                and cleaned_data.get('quantity') is None:
+            raise forms.ValidationError('訂正後の果物または個数を指定してください。')
+        return cleaned_data
+
+class SalesRangeForm(forms.Form):
+    # 日本時間の日付。省略した側は期間の制限なし
+    start = forms.DateField(required=False)
+    end = forms.DateField(required=False)
+    fruit = forms.CharField(required=False)
+
+    def clean(self) -> Dict[str, Any]:
+        cleaned_data = super().clean()
+        start: Optional[date] = cleaned_data.get('start')
+        end: Optional[date] = cleaned_data.get('end')
+        if start is not None and end is not None and start > end:
+            raise forms.ValidationError('終了日は開始日以降にしてください。')
+        return cleaned_data
+
+
+class TimeZoneForm(forms.Form):
+    # IANAのタイムゾーン名(例: America/New_York)。省略時はsettings.TIME_ZONE
+    tz = forms.CharField(required=False)
+
+    def clean_tz(self) -> tzinfo:
+        name: str = self.cleaned_data.get('tz') or settings.TIME_ZONE
+        try:
+            return ZoneInfo(name)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise forms.ValidationError('タイムゾーンが不正です。')
+
+
+class SalesLeaderboardForm(TimeZoneForm):
+    # 期間は現地の日付(両端を含む)。省略した側は期間の制限なし
+    start = forms.DateField(required=False)
+    end = forms.DateField(required=False)
+    k = forms.IntegerField(required=False, min_value=1)
+
+    def clean_k(self) -> int:
+        k: Optional[int] = self.cleaned_data.get('k')
+        if k is None:
+            return settings.SALES_LEADERBOARD_SIZE
+        if k > settings.SALES_LEADERBOARD_MAX_SIZE:
+            raise forms.ValidationError(f'件数は{settings.SALES_LEADERBOARD_MAX_SIZE}以下にしてください。')
+        return k
+
+    def clean(self) -> Dict[str, Any]:
+        cleaned_data = super().clean()
+        start: Optional[date] = cleaned_data.get('start')
+        end: Optional[date] = cleaned_data.get('end')
+        if start is not None and end is not None and start > end:
+            raise forms.ValidationError('終了日は開始日以降にしてください。')
+        return cleaned_data
+
+
+class SalesAggregateForm(TimeZoneForm):
+    # 期間は日付(YYYY-MM-DD)または日時(ISO 8601)。日付だけの終了日はその日を含む
+    start = forms.CharField()
+    end = forms.CharField()
+    granularity = forms.ChoiceField(choices=[(name, name) for name in GRANULARITIES], required=False)
+    fruit = forms.CharField(required=False)
+
+    def clean_granularity(self) -> str:
+        return self.cleaned_data.get('granularity') or 'day'
+
+    def clean(self) -> Dict[str, Any]:
+        cleaned_data = super().clean()
+        tz: Optional[tzinfo] = cleaned_data.get('tz')
+        if tz is None or 'start' not in cleaned_data or 'end' not in cleaned_data:
+            return cleaned_data
+
+        try:
+            start: datetime = self.parse_moment(cleaned_data['start'], tz, inclusive_end=False)
+            end: datetime = self.parse_moment(cleaned_data['end'], tz, inclusive_end=True)
+        except ValueError:
+            raise forms.ValidationError('期間の形式が不正です。')
+        if start >= end:
+            raise forms.ValidationError('終了は開始より後にしてください。')
+
+        cleaned_data['start'] = start
+        cleaned_data['end'] = end
+        return cleaned_data
+
+    @staticmethod
+    def parse_moment(value: str, tz: tzinfo, inclusive_end: bool) -> datetime:
+        if len(value) == 10:
+            day: date = date.fromisoformat(value)
+            if inclusive_end:
+                day += timedelta(days=1)
+            return datetime.combine(day, time.min, tzinfo=tz)
+        moment: datetime = datetime.fromisoformat(value)
+        return moment.replace(tzinfo=tz) if moment.tzinfo is None else moment
+
+
+class SaleEditForm(CatalogFruitFormMixin, forms.ModelForm):
+    fruit = CatalogFruitField()
+
     class Meta:
         model = Sale
-        fields = ['fruit', 'quantity', 'sale_date']
+        fields = ['quantity', 'sale_date']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # 編集対象の果物が削除済みの場合のみDBから取得して選択肢に加える
+        fruit_id: Optional[int] = self.instance.fruit_id
+        if fruit_id is not None and fruit_catalog.get(fruit_id) is None:
+            self.fields['fruit'].allow_fruit(self.instance.fruit)
 
     def clean(self) -> Dict[str, Any]:
         cleaned_data = super().clean()
         fruit = cleaned_data.get('fruit')
         quantity = cleaned_data.get('quantity')
 
-        if not Fruit.objects.filter(name=fruit).exists():
+        if fruit is None:
             raise forms.ValidationError('Selected fruit does not exist.')
+        self.assign_fruit(fruit)
 
         if 'total_amount' in cleaned_data:
-            current_price = fruit.price
-            total_amount = quantity * current_price
+            # 販売日時点の単価(単価の履歴から求める)で確かめる
+            sale_price = fruit_catalog.price_at(fruit.pk, cleaned_data.get('sale_date'), fruit.price)
+            total_amount = quantity * sale_price
             if cleaned_data.get('total_amount') != total_amount:
-                raise forms.ValidationError('Total amount does not match the current price.')
+                raise forms.ValidationError('Total amount does not match the price at the sale date.')
 
         return cleaned_data
@@ -0,0 +1,68 @@
+from typing import Optional
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import Sale, SaleArchive, SalesGrandTotal
+from .prefix_sums import ZERO, RangeTotal
+
+# 累計の行は常にこの主キーの1行だけ
+GRAND_TOTAL_PK: int = 1
+
+
+def grand_total() -> RangeTotal:
+    # 累計の1行だけを読む
+    row: Optional[tuple] = SalesGrandTotal.objects.filter(pk=GRAND_TOTAL_PK).values_list(
+        'total_amount', 'quantity', 'active_count').first()
+    return RangeTotal(*row) if row else ZERO
+
+
+async def agrand_total() -> RangeTotal:
+    row: Optional[tuple] = await SalesGrandTotal.objects.filter(pk=GRAND_TOTAL_PK).values_list(
+        'total_amount', 'quantity', 'active_count').afirst()
+    return RangeTotal(*row) if row else ZERO
+
+
+def compute_grand_total() -> RangeTotal:
+    # 販売実績テーブルと保管済みの販売実績から有効な販売実績の合計を求める
+    total: RangeTotal = ZERO
+    for model in (Sale, SaleArchive):
+        row: dict = model.objects.filter(is_active=True).aggregate(
+            amount=Sum('total_amount'), qty=Sum('quantity'), count=Count('id'))
+        total += RangeTotal(row['amount'] or 0, row['qty'] or 0, row['count'])
+    return total
+
+
+def lock_grand_total() -> None:
+    # 累計の行をコミットまでロックする(日次集計・累計を作り直す間、販売実績の書き込みを待たせる)
+    list(SalesGrandTotal.objects.select_for_update().filter(pk=GRAND_TOTAL_PK).values_list('pk'))
+
+
+def rebuild_grand_total() -> RangeTotal:
+    total: RangeTotal = compute_grand_total()
+    SalesGrandTotal.objects.update_or_create(pk=GRAND_TOTAL_PK, defaults={
+        'total_amount': total.amount, 'quantity': total.quantity, 'active_count': total.count})
+    return total
+
+
+def add_to_grand_total(delta: RangeTotal) -> None:
+    # 呼び出し元のトランザクション内でF式による加算を行う。更新した行はコミットまでロックされるため、
+    # 増減が0の場合も更新し、続く日次集計・累計の更新を販売実績の書き込みどうしで直列化する。
+    # 行がまだない場合は、変更を反映済みの販売実績テーブルから作る
+    increments: dict = {
+        'total_amount': F('total_amount') + delta.amount,
+        'quantity': F('quantity') + delta.quantity,
+        'active_count': F('active_count') + delta.count,
+        'updated_at': timezone.now(),
+    }
+    if SalesGrandTotal.objects.filter(pk=GRAND_TOTAL_PK).update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            total: RangeTotal = compute_grand_total()
+            SalesGrandTotal.objects.create(pk=GRAND_TOTAL_PK, total_amount=total.amount, quantity=total.quantity,
+                                           active_count=total.count)
+    except IntegrityError:
+        # 別の書き込みが同時に行を作った場合(その行にこの変更は含まれない)は、その行に加算する
+        SalesGrandTotal.objects.filter(pk=GRAND_TOTAL_PK).update(**increments)
@@ -0,0 +1,198 @@
+import uuid
+from collections import Counter
+from datetime import datetime, tzinfo
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from .catalog import fruit_catalog
+from .models import Sale
+from .price_history import PriceSchedule, PriceTable
+from .rollups import RollupDeltas, SaleFigures, apply_deltas
+
+# CSVの日付形式
+SALE_DATE_FORMAT: str = "%Y-%m-%d %H:%M"
+
+# 取り込めなかった行の理由
+REJECT_REASONS: Dict[str, str] = {
+    'column_count': '列数が不正',
+    'unknown_fruit': '存在しない果物',
+    'invalid_number': '個数・売り上げが不正',
+    'invalid_date': '日付の形式が不正',
+    'amount_mismatch': '売り上げが単価と一致しない',
+}
+
+
+def new_import_batch() -> str:
+    return uuid.uuid4().hex
+
+
+class ImportResult:
+    def __init__(self, import_batch: str = '') -> None:
+        self.imported: int = 0
+        self.rejected: Counter = Counter()
+        # 登録した販売実績のSale.import_batch(取り込み単位での一括操作に使う)
+        self.import_batch: str = import_batch
+
+    @property
+    def processed(self) -> int:
+        return self.imported + self.rejected_total
+
+    @property
+    def rejected_total(self) -> int:
+        return sum(self.rejected.values())
+
+    @property
+    def rejected_items(self) -> List[Tuple[str, int]]:
+        # テンプレート表示用に(理由, 件数)の一覧を返す
+        return [(REJECT_REASONS[reason], count) for reason, count in sorted(self.rejected.items())]
+
+
+# 果物名 -> (果物ID, 単価)
+FruitPrices = Dict[str, Tuple[int, int]]
+
+
+class ParsedSale(NamedTuple):
+    fruit_id: int
+    quantity: int
+    total_amount: int
+    sale_date: datetime
+
+
+def fruit_price_snapshot() -> FruitPrices:
+    # 有効な果物マスタはプロセス内の果物カタログから取得する
+    return fruit_catalog.prices()
+
+
+def parse_row(row: List[str], fruits: FruitPrices, tzinfo: tzinfo,
+              prices: Optional[PriceTable] = None) -> Tuple[Optional[ParsedSale], Optional[str]]:
+    # DBにアクセスせずに1行を検証する(別プロセスからも呼び出される)。
+    # 単価の履歴(prices)があれば販売日時点の単価で、なければ現在の単価で売り上げを確かめる
+    if len(row) != 4:
+        # 期待される数の値が含まれていない場合の処理
+        return None, 'column_count'
+
+    fruit_name, quantity, total_amount, sale_date = row
+
+    fruit: Optional[Tuple[int, int]] = fruits.get(fruit_name)
+    if fruit is None:
+        return None, 'unknown_fruit'
+    fruit_id, price = fruit
+
+    try:
+        quantity_value: int = int(quantity)
+        total_amount_value: int = int(total_amount)
+    except ValueError:
+        return None, 'invalid_number'
+    if quantity_value <= 0:
+        return None, 'invalid_number'
+
+    try:
+        parsed_date: datetime = datetime.strptime(sale_date, SALE_DATE_FORMAT).replace(tzinfo=tzinfo)
+    except ValueError:
+        return None, 'invalid_date'
+
+    schedule: Optional[PriceSchedule] = prices.get(fruit_id) if prices is not None else None
+    if schedule is not None:
+        price = schedule.at(parsed_date)
+    if total_amount_value != quantity_value * price:
+        return None, 'amount_mismatch'
+
+    return ParsedSale(fruit_id, quantity_value, total_amount_value, parsed_date), None
+
+
+class SaleCsvImporter:
+    def __init__(self, batch_size: Optional[int] = None, import_batch: Optional[str] = None) -> None:
+        self.batch_size: int = batch_size or settings.SALES_IMPORT_BATCH_SIZE
+        self.import_batch: str = import_batch or new_import_batch()
+        self.fruits: FruitPrices = fruit_price_snapshot()
+        self.prices: PriceTable = fruit_catalog.price_table()
+        self.tzinfo: tzinfo = timezone.get_current_timezone()
+
+    def validate_row(self, row: List[str]) -> Tuple[Optional[Sale], Optional[str]]:
+        parsed, reason = parse_row(row, self.fruits, self.tzinfo, self.prices)
+        if parsed is None:
+            return None, reason
+        return Sale(**parsed._asdict(), import_batch=self.import_batch), None
+
+    def batches(self, rows: Iterable[List[str]], result: ImportResult) -> Iterator[List[Sale]]:
+        # 検証済みの行をbatch_size件ずつ返す。不正な行は理由ごとに数える
+        batch: List[Sale] = []
+        for row in rows:
+            sale, reason = self.validate_row(row)
+            if sale is None:
+                result.rejected[reason] += 1
+                continue
+
+            batch.append(sale)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+
+        if batch:
+            yield batch
+
+    def run(self, rows: Iterable[List[str]]) -> ImportResult:
+        result: ImportResult = ImportResult(self.import_batch)
+        deltas: RollupDeltas = RollupDeltas()
+
+        # 取り込みと日次集計の更新を同一トランザクションで行う
+        with transaction.atomic():
+            for batch in self.batches(rows, result):
+                self.save_batch(batch, deltas, result)
+            apply_deltas(deltas)
+
+        return result
+
+    def run_in_batches(
+        self, rows: Iterable[List[str]], on_batch: Optional[Callable[[ImportResult], None]] = None
+    ) -> ImportResult:
+        # バッチごとにコミットし、進捗を呼び出し元に通知する(バックグラウンド取り込み用)
+        result: ImportResult = ImportResult(self.import_batch)
+
+        for batch in self.batches(rows, result):
+            with transaction.atomic():
+                deltas: RollupDeltas = RollupDeltas()
+                self.save_batch(batch, deltas, result)
+                apply_deltas(deltas)
+            if on_batch is not None:
+                on_batch(result)
+
+        if on_batch is not None:
+            on_batch(result)
+        return result
+
+    def save_batch(self, batch: List[Sale], deltas: RollupDeltas, result: ImportResult) -> None:
+        Sale.objects.bulk_create(batch)
+        for sale in batch:
+            deltas.add(SaleFigures.of(sale))
+        result.imported += len(batch)
+
+
+def discard_import_batch(import_batch: str, batch_size: Optional[int] = None) -> int:
+    # 途中で失敗した取り込みで登録済みの販売実績を削除し、日次集計・累計から差し引く。
+    # 取り込みと同じ件数ずつ1トランザクションで行い、同じファイルを取り込み直せるようにする
+    if not import_batch:
+        raise ValueError('import_batch is required.')
+    batch_size = batch_size or settings.SALES_IMPORT_BATCH_SIZE
+    sales: QuerySet = Sale.objects.filter(import_batch=import_batch)
+    discarded: int = 0
+    while True:
+        with transaction.atomic():
+            rows: List[Tuple[int, SaleFigures]] = [
+                (pk, SaleFigures(sale_date, fruit_id, total_amount, quantity, is_active))
+                for pk, sale_date, fruit_id, total_amount, quantity, is_active in sales.select_for_update()
+                .order_by('pk').values_list('pk', 'sale_date', 'fruit_id', 'total_amount', 'quantity', 'is_active')
+                [:batch_size]]
+            if not rows:
+                return discarded
+            deltas: RollupDeltas = RollupDeltas()
+            for _, figures in rows:
+                deltas.add(figures, sign=-1)
+            Sale.objects.filter(pk__in=[pk for pk, _ in rows]).delete()
+            if deltas:
+                apply_deltas(deltas)
+        discarded += len(rows)
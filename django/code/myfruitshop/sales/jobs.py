@@ -0,0 +1,148 @@
+import csv
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db.models import F, Q, QuerySet
+from django.utils import timezone
+
+from .importer import ImportResult, SaleCsvImporter, discard_import_batch
+from .models import ImportJob
+from .parallel_import import ParallelSaleImporter
+
+logger = logging.getLogger(__name__)
+
+
+class JobLost(Exception):
+    # 進捗が途絶えたとみなされ、ジョブが別のワーカーに取り戻された
+    pass
+
+
+class ByteCountingReader:
+    # ファイルを行単位で読み込みつつ、処理済みのバイト数を数える
+    def __init__(self, file: BinaryIO, encoding: str = 'utf-8') -> None:
+        self.file: BinaryIO = file
+        self.encoding: str = encoding
+        self.bytes_read: int = 0
+
+    def __iter__(self) -> Iterator[str]:
+        for line in self.file:
+            self.bytes_read += len(line)
+            yield line.decode(self.encoding)
+
+
+def enqueue_import(uploaded_file: UploadedFile, user: Optional[object] = None) -> ImportJob:
+    # アップロードされたファイルをディスクに書き出してジョブを登録する
+    os.makedirs(settings.SALES_IMPORT_DIR, exist_ok=True)
+    file_path: str = os.path.join(settings.SALES_IMPORT_DIR, f'{uuid.uuid4().hex}.csv')
+    with open(file_path, 'wb') as destination:
+        for chunk in uploaded_file.chunks():
+            destination.write(chunk)
+
+    return ImportJob.objects.create(
+        file_path=file_path,
+        file_size=os.path.getsize(file_path),
+        created_by=user if getattr(user, 'is_authenticated', False) else None,
+    )
+
+
+def claim_next_job() -> Optional[ImportJob]:
+    # 条件付きUPDATEで待機中のジョブを1件確保する(複数ワーカーでも重複しない)
+    for job_id in ImportJob.objects.filter(status=ImportJob.STATUS_QUEUED).order_by('created_at', 'id').values_list('id', flat=True)[:10]:
+        now: datetime = timezone.now()
+        claimed: int = ImportJob.objects.filter(pk=job_id, status=ImportJob.STATUS_QUEUED).update(
+            status=ImportJob.STATUS_RUNNING, started_at=now, heartbeat_at=now, attempts=F('attempts') + 1)
+        if claimed:
+            return ImportJob.objects.get(pk=job_id)
+    return None
+
+
+def claimed_job(job: ImportJob) -> QuerySet:
+    # このワーカーが確保したままのジョブ(取り戻されていれば空)
+    return ImportJob.objects.filter(pk=job.pk, status=ImportJob.STATUS_RUNNING, attempts=job.attempts)
+
+
+def discard_job_sales(job: ImportJob) -> bool:
+    # コミット済みのバッチを取り消し、同じファイルを取り込み直しても二重に登録されないようにする
+    try:
+        discarded: int = discard_import_batch(job.import_batch)
+    except Exception:
+        logger.exception('Import job %s: failed to discard imported sales.', job.pk)
+        return False
+    logger.warning('Import job %s: discarded %d imported sales (%s).', job.pk, discarded, job.import_batch)
+    return True
+
+
+def run_job(job: ImportJob) -> ImportJob:
+    try:
+        with open(job.file_path, 'rb', buffering=settings.SALES_IMPORT_CHUNK_SIZE) as file:
+            source: ByteCountingReader = ByteCountingReader(file)
+
+            def report_chunk_progress(result: ImportResult, bytes_processed: int) -> None:
+                # 進捗の書き込みがハートビートを兼ねる。取り戻されていたら以降のバッチは書き込まない
+                updated: int = claimed_job(job).update(
+                    bytes_processed=bytes_processed,
+                    rows_imported=result.imported,
+                    rows_rejected=result.rejected_total,
+                    rejected_reasons=dict(result.rejected),
+                    heartbeat_at=timezone.now(),
+                )
+                if not updated:
+                    raise JobLost(f'Import job {job.pk} was taken over.')
+
+            def report_progress(result: ImportResult) -> None:
+                report_chunk_progress(result, source.bytes_read)
+
+            if settings.SALES_IMPORT_WORKERS > 1:
+                # 複数プロセスで検証し、このプロセスでまとめて書き込む
+                ParallelSaleImporter(settings.SALES_IMPORT_WORKERS, import_batch=job.import_batch).run(
+                    job.file_path, on_chunk=report_chunk_progress, atomic=False)
+            else:
+                SaleCsvImporter(import_batch=job.import_batch).run_in_batches(csv.reader(source), on_batch=report_progress)
+
+        if not claimed_job(job).update(status=ImportJob.STATUS_DONE, finished_at=timezone.now()):
+            raise JobLost(f'Import job {job.pk} was taken over.')
+        os.remove(job.file_path)
+    except JobLost:
+        # 取り戻したワーカーが取り消した後にコミットしたバッチも残さない(ジョブの状態は変えない)
+        logger.warning('Import job %s was taken over after its progress stalled.', job.pk)
+        discard_job_sales(job)
+    except Exception as error:
+        logger.exception('Import job %s failed.', job.pk)
+        failed: int = claimed_job(job).update(
+            status=ImportJob.STATUS_FAILED, error=str(error), finished_at=timezone.now())
+        if discard_job_sales(job) and failed:
+            ImportJob.objects.filter(pk=job.pk).update(rows_imported=0)
+
+    job.refresh_from_db()
+    return job
+
+
+def recover_stale_jobs() -> List[int]:
+    # 処理中のまま進捗がSALES_IMPORT_STALE_SECONDS途絶えたジョブ(ワーカーが強制終了された場合など)を取り戻す。
+    # コミット済みのバッチを取り消し、確保がSALES_IMPORT_MAX_ATTEMPTS回未満なら待機中に戻し、それ以外は失敗にする
+    now: datetime = timezone.now()
+    deadline: datetime = now - timedelta(seconds=settings.SALES_IMPORT_STALE_SECONDS)
+    stale: QuerySet = ImportJob.objects.filter(status=ImportJob.STATUS_RUNNING).filter(
+        Q(heartbeat_at__lt=deadline) | Q(heartbeat_at__isnull=True, started_at__lt=deadline))
+    recovered: List[int] = []
+    for job in stale:
+        retry: bool = job.attempts < settings.SALES_IMPORT_MAX_ATTEMPTS and os.path.exists(job.file_path)
+        fields: Dict[str, Any] = dict(bytes_processed=0, rows_imported=0, rows_rejected=0, rejected_reasons={})
+        if retry:
+            fields.update(status=ImportJob.STATUS_QUEUED, started_at=None, heartbeat_at=None)
+        else:
+            fields.update(status=ImportJob.STATUS_FAILED, finished_at=now,
+                          error=f'ワーカーが{settings.SALES_IMPORT_STALE_SECONDS}秒以上応答しなかったため中断しました。')
+        # 同時に取り戻そうとしたワーカーや、遅れて進捗を書き込んだ元のワーカーとは条件付きUPDATEで競合を避ける
+        if not claimed_job(job).filter(heartbeat_at=job.heartbeat_at).update(**fields):
+            continue
+        logger.warning('Import job %s stalled since %s; %s.', job.pk, job.heartbeat_at or job.started_at,
+                       'requeued' if retry else 'marked failed')
+        discard_job_sales(job)
+        recovered.append(job.pk)
+    return recovered
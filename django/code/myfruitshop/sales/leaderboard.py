@@ -0,0 +1,155 @@
+import heapq
+from datetime import date, timedelta, tzinfo
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.db.models import Count, OuterRef, QuerySet, Subquery, Sum
+
+from .aggregates import is_jst, local_midnight
+from .archive import with_archive
+from .catalog import catalog_version
+from .models import Fruit, SalesDailyRollup, SalesPrefixSum
+
+# 並べ替えの基準(売り上げ順・個数順)
+LEADERBOARD_METRICS: Tuple[str, ...] = ('amount', 'quantity')
+
+# 日本時間でこの日数以上の期間は、日次集計ではなく果物ごとの累計の差で求める
+PREFIX_MIN_DAYS: int = 14
+
+# 順位表の期間: 名前 -> 表示名
+LEADERBOARD_WINDOWS: Dict[str, str] = {
+    'today': '今日',
+    'week': '今週',
+    'month': '今月',
+}
+
+
+class FruitRank(NamedTuple):
+    fruit_id: int
+    fruit: str
+    amount: int
+    quantity: int
+    count: int
+
+
+# 基準 -> 上位の果物(多い順)
+Leaderboard = Dict[str, List[FruitRank]]
+
+
+def window_bounds(today: date) -> Dict[str, Tuple[date, date]]:
+    # 今日・今週(月曜始まり)・今月の開始日と終了日(両端を含む)
+    return {
+        'today': (today, today),
+        'week': (today - timedelta(days=today.weekday()), today),
+        'month': (today.replace(day=1), today),
+    }
+
+
+def uses_prefix_sums(start_day: Optional[date], end_day: Optional[date], tz: tzinfo) -> bool:
+    if not is_jst(tz):
+        return False
+    return start_day is None or end_day is None or (end_day - start_day).days + 1 >= PREFIX_MIN_DAYS
+
+
+def cumulative(day: Optional[date], field: str) -> Subquery:
+    # 果物ごとのday(日本時間)までの累計(販売のあった最後の日の行)。(果物, 日付)のインデックスで1行だけ読む
+    rows: QuerySet = SalesPrefixSum.objects.filter(fruit_id=OuterRef('pk'))
+    if day is not None:
+        rows = rows.filter(day__lte=day)
+    return Subquery(rows.order_by('-day').values(field)[:1])
+
+
+def prefix_fruit_totals(start_day: Optional[date], end_day: Optional[date]) -> Iterator[Tuple[Any, ...]]:
+    # 長い期間は果物ごとに「終了日の累計 - 開始前日の累計」を求める(期間の長さによらず果物数 x 6回の索引の参照)
+    fields: Tuple[str, ...] = ('total_amount', 'quantity', 'sale_count')
+    before: Optional[date] = None if start_day is None else start_day - timedelta(days=1)
+    annotations: Dict[str, Subquery] = {f'end_{field}': cumulative(end_day, field) for field in fields}
+    if before is not None:
+        annotations.update({f'before_{field}': cumulative(before, field) for field in fields})
+    rows: QuerySet = Fruit.objects.annotate(**annotations).values_list('pk', 'name', *annotations)
+    for row in rows.iterator():
+        ends: Tuple[Any, ...] = row[2:5]
+        befores: Tuple[Any, ...] = row[5:8] if before is not None else (0, 0, 0)
+        totals: List[int] = [(end or 0) - (start or 0) for end, start in zip(ends, befores)]
+        if totals[2] > 0:
+            yield (row[0], row[1], *totals)
+
+
+def grouped_by_fruit(rows: QuerySet, count: Any) -> QuerySet:
+    return (
+        rows.values('fruit_id', 'fruit__name')
+        .annotate(amount_sum=Sum('total_amount'), quantity_sum=Sum('quantity'), sale_count_sum=count)
+        .order_by()
+        .values_list('fruit_id', 'fruit__name', 'amount_sum', 'quantity_sum', 'sale_count_sum')
+    )
+
+
+def fruit_totals(start_day: Optional[date], end_day: Optional[date], tz: tzinfo) -> QuerySet:
+    # 期間(現地の日付、両端を含む)の果物ごとの合計をDBで集計する。
+    # 日本時間は日次集計(日数 x 果物の行)を、それ以外は販売実績を現地の0時の範囲で集計する
+    if is_jst(tz):
+        rows: QuerySet = SalesDailyRollup.objects.all()
+        if start_day is not None:
+            rows = rows.filter(day__gte=start_day)
+        if end_day is not None:
+            rows = rows.filter(day__lte=end_day)
+        return grouped_by_fruit(rows, Sum('sale_count'))
+
+    def build(sales: QuerySet) -> QuerySet:
+        sales = sales.filter(is_active=True)
+        if start_day is not None:
+            sales = sales.filter(sale_date__gte=local_midnight(start_day, tz))
+        if end_day is not None:
+            sales = sales.filter(sale_date__lt=local_midnight(end_day + timedelta(days=1), tz))
+        return grouped_by_fruit(sales, Count('id'))
+
+    # 保管済みの販売実績も含める(同じ果物の行が2つになることがあるため、merge_fruit_rowsで合算する)
+    return with_archive(build)
+
+
+def merge_fruit_rows(rows: Iterable[Tuple[Any, ...]]) -> Iterator[Tuple[Any, ...]]:
+    # 果物IDごとに合算する
+    merged: Dict[int, List[Any]] = {}
+    for fruit_id, name, amount, quantity, count in rows:
+        totals: Optional[List[Any]] = merged.get(fruit_id)
+        if totals is None:
+            merged[fruit_id] = [fruit_id, name, amount, quantity, count]
+        else:
+            totals[2] += amount
+            totals[3] += quantity
+            totals[4] += count
+    return (tuple(totals) for totals in merged.values())
+
+
+def top_k(rows: Iterable[Tuple[Any, ...]], k: int) -> Leaderboard:
+    # 果物ごとの合計を1回だけ読み、基準ごとに大きさkのヒープで上位を残す(O(果物数 x log k))。
+    # 同じ値の場合は果物IDの小さい順
+    heaps: Dict[str, List[Tuple[int, int, FruitRank]]] = {metric: [] for metric in LEADERBOARD_METRICS}
+    for row in rows:
+        rank: FruitRank = FruitRank(*row)
+        for metric, heap in heaps.items():
+            entry: Tuple[int, int, FruitRank] = (getattr(rank, metric), -rank.fruit_id, rank)
+            if len(heap) < k:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+    return {metric: [entry[2] for entry in sorted(heap, reverse=True)] for metric, heap in heaps.items()}
+
+
+def leaderboard_key(tz: tzinfo, start_day: Optional[date], end_day: Optional[date], k: int) -> List[Any]:
+    # 販売実績の版番号付きキャッシュのキー(期間ごと)。果物名を含むため果物カタログの版も含める
+    return [str(tz), start_day, end_day, k, catalog_version()]
+
+
+def leaderboard(start_day: Optional[date], end_day: Optional[date], tz: tzinfo, k: int) -> Leaderboard:
+    if uses_prefix_sums(start_day, end_day, tz):
+        return top_k(prefix_fruit_totals(start_day, end_day), k)
+    rows: Iterable[Tuple[Any, ...]] = fruit_totals(start_day, end_day, tz).iterator()
+    return top_k(rows if is_jst(tz) else merge_fruit_rows(rows), k)
+
+
+async def aleaderboard(start_day: Optional[date], end_day: Optional[date], tz: tzinfo, k: int) -> Leaderboard:
+    if uses_prefix_sums(start_day, end_day, tz):
+        return await sync_to_async(leaderboard)(start_day, end_day, tz, k)
+    rows: List[Tuple[Any, ...]] = [row async for row in fruit_totals(start_day, end_day, tz)]
+    return top_k(rows if is_jst(tz) else merge_fruit_rows(rows), k)
@@ -0,0 +1,58 @@
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import connection
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from sales.aggregates import add_months, local_midnight
+from sales.archive import ArchiveResult, SaleArchiver, archivable_sales
+from sales.partitions import add_sale_partitions, drop_sale_partitions, is_partitionable, sale_partitions
+from sales.rollups import JST
+
+
+class Command(BaseCommand):
+    help = ('保管期間を過ぎた販売実績(論理削除済みを含む)を保管用のテーブル(SaleArchive)へ一定件数ずつ移します。'
+            'MySQLでは月ごとのパーティションを先の月まで作り、空になった古いパーティションを削除します。'
+            '日次集計・累計は変わらないため、保管した期間の集計もそのまま表示されます。')
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--retention-months', type=int, default=settings.SALES_RETENTION_MONTHS,
+                            help='販売実績テーブルに残す月数(今月を含まない)')
+        parser.add_argument('--deleted-retention-days', type=int, default=settings.SALES_DELETED_RETENTION_DAYS,
+                            help='論理削除した販売実績を残す日数(負の値で保管期間と同じ扱い)')
+        parser.add_argument('--batch-size', type=int, default=settings.SALES_ARCHIVE_BATCH_SIZE,
+                            help='1トランザクションで移す件数')
+        parser.add_argument('--partitions-ahead', type=int, default=settings.SALES_PARTITION_MONTHS_AHEAD,
+                            help='MySQLで何ヶ月先までパーティションを作っておくか')
+        parser.add_argument('--dry-run', action='store_true', help='移す件数を表示するだけで何も変更しません。')
+
+    def handle(self, *args, **options) -> None:
+        if options['retention_months'] < 1:
+            raise CommandError('--retention-months には1以上を指定してください。')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size には1以上を指定してください。')
+
+        now: datetime = timezone.now()
+        this_month: date = now.astimezone(JST).date().replace(day=1)
+        # 保管期間の始まり(日本時間の月初)。日次集計の日付の境界と揃える
+        horizon: date = add_months(this_month, -options['retention_months'])
+        deleted_before: Optional[datetime] = (
+            now - timedelta(days=options['deleted_retention_days']) if options['deleted_retention_days'] >= 0 else None)
+        sales: QuerySet = archivable_sales(local_midnight(horizon, JST), deleted_before)
+
+        if options['dry_run']:
+            self.stdout.write(f'{horizon} より前の販売実績と論理削除済みの販売実績 {sales.count()} 件が対象です。')
+            return
+
+        result: ArchiveResult = SaleArchiver(options['batch_size']).run(sales)
+        self.stdout.write(self.style.SUCCESS(
+            f'{result.archived} 件の販売実績を保管用のテーブルへ移しました({result.batches} バッチ)。'))
+
+        if not is_partitionable(connection) or not sale_partitions(connection):
+            return
+        added: List[str] = add_sale_partitions(connection, add_months(this_month, options['partitions_ahead']))
+        dropped: List[str] = drop_sale_partitions(connection, horizon)
+        self.stdout.write(f"パーティションを追加: {', '.join(added) or 'なし'} / 削除: {', '.join(dropped) or 'なし'}")
@@ -0,0 +1,62 @@
+import asyncio
+import json
+from typing import Any, Dict, List, Tuple
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from sales.benchmarks import asgi_load, wsgi_load
+
+# 計測する画面: 名前 -> (WSGIで呼ぶ同期版, ASGIで呼ぶ非同期版)
+VIEWS: Dict[str, Tuple[str, str]] = {
+    'aggregate': ('sales_aggregate', 'sales_aggregate_async'),
+    'list': ('sales_combined', 'sales_combined_async'),
+    'export': ('sales_export', 'sales_export_async'),
+}
+
+
+class Command(BaseCommand):
+    help = ('売り上げ集計・販売情報一覧・CSVエクスポートについて、同期版をWSGI(スレッド)で、'
+            '非同期版をASGI(イベントループ)で同時に呼び出し、スループットと応答時間のパーセンタイルを比較します。')
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32], help='同時接続数')
+        parser.add_argument('--requests', type=int, default=200, help='同時接続数・画面ごとのリクエスト数')
+        parser.add_argument('--views', nargs='+', choices=sorted(VIEWS), default=sorted(VIEWS),
+                            help='計測する画面')
+        parser.add_argument('--output', default='bench_asgi.json', help='結果を書き出すJSONファイル')
+
+    def handle(self, *args, **options) -> None:
+        user: User = User.objects.get_or_create(username='bench-user')[0]
+        client: Client = Client()
+        client.force_login(user)
+        session_key: str = client.cookies[settings.SESSION_COOKIE_NAME].value
+
+        results: List[Dict[str, Any]] = []
+        for name in options['views']:
+            sync_path: str = reverse(VIEWS[name][0])
+            async_path: str = reverse(VIEWS[name][1])
+            # 初回のキャッシュ作成やカタログの読み込みを計測から外す
+            client.get(sync_path)
+            for concurrency in sorted(set(options['concurrency'])):
+                for result in (wsgi_load(sync_path, session_key, concurrency, options['requests']),
+                               asyncio.run(asgi_load(async_path, session_key, concurrency, options['requests']))):
+                    report: Dict[str, Any] = dict(result.as_report(), view=name)
+                    results.append(report)
+                    self.stdout.write(
+                        f"{name:<10} {result.server:<5} c={concurrency:<4} "
+                        f"rps={report['requests_per_second']:>8} p50={report['p50_ms']:>8.2f}ms "
+                        f"p95={report['p95_ms']:>8.2f}ms p99={report['p99_ms']:>8.2f}ms errors={result.errors}")
+
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump({'database': connection.vendor, 'requests': options['requests'], 'results': results},
+                      file, indent=2, sort_keys=True)
+            file.write('\n')
+        self.stdout.write(f"結果を {options['output']} に書き出しました。")
+
+        if any(report['errors'] for report in results):
+            raise CommandError('エラーになったリクエストがあります。')
@@ -0,0 +1,84 @@
+import json
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import connection
+from django.db.models import Count, QuerySet, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from sales.benchmarks import measure_memory
+from sales.columnar import SALE_FIELDS, SalesColumns, calendar_edges, load_sales
+from sales.aggregates import local_midnight
+from sales.models import Sale
+from sales.rollups import JST
+from sales.seeding import SEED_FRUIT_PREFIX, seed_sales
+
+
+class Command(BaseCommand):
+    help = ('販売実績を列の配列(SalesColumns)・values_listのタプル・モデルのインスタンスとして読み込んだときの'
+            'メモリ使用量と、月 x 果物の集計時間を比較します。計測用のDB(例: DJANGO_DB_ENGINE=sqlite)で実行してください。')
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--rows', type=int, default=1_000_000, help='計測する販売実績の件数(不足分は生成します)')
+        parser.add_argument('--model-rows', type=int, default=100_000,
+                            help='タプル・モデルのインスタンスで読み込む件数(100万件あたりに換算して比較します)')
+        parser.add_argument('--fruits', type=int, default=50, help='生成する果物の種類数')
+        parser.add_argument('--days', type=int, default=365, help='販売日を散らばらせる日数(今日まで)')
+        parser.add_argument('--output', default='bench_columnar.json', help='結果を書き出すJSONファイル')
+
+    def handle(self, *args, **options) -> None:
+        existing: int = Sale.objects.count()
+        if existing < options['rows']:
+            if Sale.objects.exclude(fruit__name__startswith=SEED_FRUIT_PREFIX).exists():
+                raise CommandError('計測用でない販売実績があります。計測用のDBで実行してください。')
+            end: date = timezone.now().astimezone(JST).date()
+            seed_sales(options['fruits'], options['rows'] - existing, end - timedelta(days=options['days'] - 1), end,
+                       seed=existing)
+
+        sales: QuerySet = Sale.objects.filter(is_active=True)
+        columns, columnar = measure_memory('columns', lambda: load_sales(sales))
+        sample: QuerySet = sales.order_by('pk')[:options['model_rows']]
+        _, tuples = measure_memory('values_list', lambda: list(sample.values_list('pk', *SALE_FIELDS)))
+        _, models = measure_memory('models', lambda: list(sample.select_related('fruit')))
+
+        results: Dict[str, Any] = {
+            'database': connection.vendor,
+            'memory': {use.name: use.as_report() for use in (columnar, tuples, models)},
+            'column_nbytes': columns.nbytes,
+            'group_by_month_fruit': self.group_by_timings(columns),
+        }
+        for use in (columnar, tuples, models):
+            report: Dict[str, Any] = use.as_report()
+            self.stdout.write(
+                f"{use.name:<12} rows={use.rows:>9} load={use.seconds:8.2f}s bytes/row={report['bytes_per_row']:>7} "
+                f"retained/1M={report['retained_mb_per_1000000_rows']:>8}MB peak/1M={report['peak_mb_per_1000000_rows']:>8}MB")
+        timings: Dict[str, Any] = results['group_by_month_fruit']
+        self.stdout.write(f"group by month x fruit: columns={timings['columns'] * 1000:.1f}ms "
+                          f"sql={timings['sql'] * 1000:.1f}ms groups={timings['groups']}")
+
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+            file.write('\n')
+        self.stdout.write(f"結果を {options['output']} に書き出しました。")
+
+    def group_by_timings(self, columns: SalesColumns) -> Dict[str, Any]:
+        # 読み込み済みの列での月 x 果物の集計と、同じ集計のSQL(GROUP BY)の時間
+        today: date = timezone.now().astimezone(JST).date()
+        start: datetime = local_midnight((today - timedelta(days=400)).replace(day=1), JST)
+        end: datetime = local_midnight(today + timedelta(days=1), JST)
+
+        started: float = time.perf_counter()
+        _, edges = calendar_edges(start, end, 'month', JST)
+        columns.group_by_bucket(edges)
+        columnar: float = time.perf_counter() - started
+
+        started = time.perf_counter()
+        rows: List[Dict[str, Any]] = list(
+            Sale.objects.filter(is_active=True, sale_date__gte=start, sale_date__lt=end)
+            .annotate(month=TruncMonth('sale_date', tzinfo=JST)).values('month', 'fruit_id')
+            .annotate(amount=Sum('total_amount'), quantity=Sum('quantity'), count=Count('id')).order_by())
+        sql: float = time.perf_counter() - started
+        return {'columns': round(columnar, 4), 'sql': round(sql, 4), 'groups': len(rows)}
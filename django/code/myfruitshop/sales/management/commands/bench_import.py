@@ -0,0 +1,79 @@
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandParser
+
+from sales.importer import FruitPrices, SALE_DATE_FORMAT
+from sales.parallel_import import ParallelSaleImporter
+from sales.price_history import PriceSchedule, PriceTable
+
+SAMPLE_START: datetime = datetime(2023, 1, 1)
+
+
+def sample_price_table(fruits: FruitPrices, changes: int) -> PriceTable:
+    # 1年の間に果物ごとにchanges回、単価が変わったものとする
+    tzinfo: ZoneInfo = ZoneInfo(settings.TIME_ZONE)
+    return {
+        fruit_id: PriceSchedule(
+            (SAMPLE_START.replace(tzinfo=tzinfo) + timedelta(days=365 * step / (changes + 1)), price + step * 10)
+            for step in range(changes + 1))
+        for fruit_id, price in fruits.values()
+    }
+
+
+def write_sample_csv(path: str, rows: int, fruits: FruitPrices, seed: int = 0,
+                     prices: Optional[PriceTable] = None) -> None:
+    # 一部に不正な行を含む取り込み用CSVを生成する(単価の履歴があれば販売日時点の単価で売り上げを計算する)
+    rng: random.Random = random.Random(seed)
+    names: List[str] = list(fruits)
+    tzinfo: ZoneInfo = ZoneInfo(settings.TIME_ZONE)
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        for index in range(rows):
+            name: str = rng.choice(names)
+            quantity: int = rng.randint(1, 20)
+            sale_date: datetime = SAMPLE_START + timedelta(minutes=rng.randrange(365 * 24 * 60))
+            fruit_id, price = fruits[name]
+            if prices is not None:
+                price = prices[fruit_id].at(sale_date.replace(tzinfo=tzinfo))
+            total_amount: int = quantity * price
+            if index % 100 == 0:
+                total_amount += 1
+            file.write(f'{name},{quantity},{total_amount},{sale_date.strftime(SALE_DATE_FORMAT)}\n')
+
+
+class Command(BaseCommand):
+    help = 'CSV取り込みの検証処理をプロセス数ごとに計測し、1秒あたりの行数を表示します。'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--rows', type=int, default=1_000_000, help='生成する行数')
+        parser.add_argument('--fruits', type=int, default=50, help='果物の種類数')
+        parser.add_argument('--workers', type=int, nargs='+', default=None,
+                            help='計測するプロセス数(既定: 1 2 4 CPU数)')
+        parser.add_argument('--price-changes', type=int, default=0,
+                            help='果物ごとの単価の変更回数(1以上なら販売日時点の単価で検証する)')
+
+    def handle(self, *args, **options) -> None:
+        workers_list: List[int] = options['workers'] or sorted({1, 2, 4, os.cpu_count() or 1})
+        fruits: FruitPrices = {f'fruit-{index}': (index + 1, 100 + index * 10) for index in range(options['fruits'])}
+        prices: Optional[PriceTable] = None
+        if options['price_changes']:
+            prices = sample_price_table(fruits, options['price_changes'])
+
+        with tempfile.TemporaryDirectory() as directory:
+            path: str = os.path.join(directory, 'bench.csv')
+            write_sample_csv(path, options['rows'], fruits, prices=prices)
+            self.stdout.write(f"rows={options['rows']} size={os.path.getsize(path)} bytes "
+                              f"price_changes={options['price_changes']}")
+
+            for workers in workers_list:
+                importer: ParallelSaleImporter = ParallelSaleImporter(workers, fruits=fruits, prices=prices)
+                started: float = time.perf_counter()
+                rows: int = sum(len(chunk) + sum(chunk.rejected.values()) for chunk in importer.validate(path))
+                elapsed: float = time.perf_counter() - started
+                self.stdout.write(f'workers={workers:>3} elapsed={elapsed:7.2f}s rows/sec={rows / elapsed:,.0f}')
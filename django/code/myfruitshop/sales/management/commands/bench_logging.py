@@ -0,0 +1,86 @@
+import copy
+import logging
+import logging.config
+import os
+import statistics
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+
+def synchronous_config(path: str) -> Dict[str, Any]:
+    # 以前の設定: djangoロガー全体(SQLを含む)をDEBUGで同期的なFileHandlerに書き込む
+    return {
+        'version': 1,
+        'disable_existing_loggers': False,
+        'handlers': {
+            'file': {'level': 'DEBUG', 'class': 'logging.FileHandler', 'filename': path},
+        },
+        'loggers': {
+            'django': {'handlers': ['file'], 'level': 'DEBUG', 'propagate': True},
+        },
+    }
+
+
+def queued_config(path: str, sample_every: int = 1, sql: bool = True) -> Dict[str, Any]:
+    # 現在の設定(QueuedFileHandler)。sql=True はSQLをDEBUGで出力する場合(DJANGO_LOG_SQL=1)
+    config: Dict[str, Any] = copy.deepcopy(settings.LOGGING)
+    config['handlers']['file']['filename'] = path
+    config['filters']['sample_sql']['every'] = sample_every
+    config['loggers']['django.db.backends']['level'] = 'DEBUG' if sql else 'INFO'
+    return config
+
+
+class Command(BaseCommand):
+    help = 'ログ設定ごとに画面の応答時間を計測し、同期書き込みとキュー経由の書き込みを比較します。'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--requests', type=int, default=200, help='設定ごとのリクエスト数')
+        parser.add_argument('--path', default=None, help='計測する画面のパス(既定: 販売情報一覧)')
+
+    def handle(self, *args, **options) -> None:
+        user: User = User.objects.get_or_create(username='bench-user')[0]
+        client: Client = Client()
+        client.force_login(user)
+        path: str = options['path'] or reverse('sales_combined')
+
+        with tempfile.TemporaryDirectory() as directory:
+            variants: Dict[str, Callable[[str], Dict[str, Any]]] = {
+                'sync_file_debug': synchronous_config,
+                'queued': queued_config,
+                'queued_sampled': lambda log_path: queued_config(log_path, settings.LOG_SQL_SAMPLE_EVERY),
+                'queued_default': lambda log_path: queued_config(log_path, sql=False),
+            }
+            # SQLのログはDEBUG=Falseでは出力されないため、計測中は強制的に出力させる
+            connection.force_debug_cursor = True
+            try:
+                for name, build in variants.items():
+                    log_path: str = os.path.join(directory, f'{name}.log')
+                    # dictConfigは既存ロガーのフィルターを外さないため、前の設定の間引きを外しておく
+                    logging.getLogger('django.db.backends').filters.clear()
+                    logging.config.dictConfig(build(log_path))
+                    client.get(path)
+
+                    timings: List[float] = []
+                    for _ in range(options['requests']):
+                        started: float = time.perf_counter()
+                        client.get(path)
+                        timings.append((time.perf_counter() - started) * 1000)
+
+                    # キューに残ったログを書き出してからファイルの大きさを測る
+                    logging.shutdown()
+                    timings.sort()
+                    self.stdout.write(
+                        f'{name:<16} median={statistics.median(timings):7.2f}ms '
+                        f'p95={timings[int(len(timings) * 0.95) - 1]:7.2f}ms '
+                        f'log={os.path.getsize(log_path) if os.path.exists(log_path) else 0:>10,} bytes')
+            finally:
+                connection.force_debug_cursor = False
+                logging.config.dictConfig(settings.LOGGING)
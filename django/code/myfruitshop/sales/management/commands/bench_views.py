@@ -0,0 +1,117 @@
+import json
+import platform
+import subprocess
+import time
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import connection, transaction
+from django.db.models import Model
+from django.test import Client
+from django.utils import timezone
+
+from sales.benchmarks import Measurement, ViewBenchmark
+from sales.caching import bump_sales_version
+from sales.models import Fruit, Sale, SaleArchive, SalesDailyRollup, SalesGrandTotal, SalesPrefixSum
+from sales.rollups import JST
+from sales.seeding import seed_fruits, seed_sales
+
+BENCH_USERNAME: str = 'bench-user'
+
+# --resetで空にするテーブル(販売実績・保管済みの販売実績と、そこから作る集計すべて)
+RESET_MODELS: Tuple[Type[Model], ...] = (Sale, SaleArchive, SalesDailyRollup, SalesPrefixSum, SalesGrandTotal)
+
+
+def reset_sales() -> None:
+    with transaction.atomic():
+        for model in RESET_MODELS:
+            model.objects.all().delete()
+        transaction.on_commit(bump_sales_version)
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('販売実績の件数ごとに主要な画面の応答時間とSQLクエリ数を計測し、JSONで出力します。'
+            '計測用のDB(例: DJANGO_DB_ENGINE=sqlite)で実行してください。')
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                            help='計測する販売実績の件数(少ない順に追加で生成します)')
+        parser.add_argument('--fruits', type=int, default=50, help='果物の種類数')
+        parser.add_argument('--days', type=int, default=365, help='販売日を散らばらせる日数(今日まで)')
+        parser.add_argument('--repeat', type=int, default=5, help='画面ごとの計測回数')
+        parser.add_argument('--import-rows', type=int, default=10_000, help='CSV取り込みで計測する行数')
+        parser.add_argument('--import-batch-size', type=int, default=1000, help='CSV取り込みのバッチサイズ')
+        parser.add_argument('--seed', type=int, default=0, help='乱数の種')
+        parser.add_argument('--output', default='bench_views.json', help='結果を書き出すJSONファイル')
+        parser.add_argument('--reset', action='store_true',
+                            help='既存の販売実績・保管済みの販売実績と、日次集計・累計をすべて削除してから計測します。')
+
+    def handle(self, *args, **options) -> None:
+        sizes: List[int] = sorted(set(options['sizes']))
+        if any(model.objects.exists() for model in RESET_MODELS):
+            if not options['reset']:
+                raise CommandError('販売実績または集計が既に存在します。計測用のDBで --reset を指定して実行してください。')
+            reset_sales()
+
+        end: date = timezone.now().astimezone(JST).date()
+        start: date = end - timedelta(days=options['days'] - 1)
+        user: User = User.objects.get_or_create(username=BENCH_USERNAME)[0]
+        client: Client = Client()
+        client.force_login(user)
+        bench: ViewBenchmark = ViewBenchmark(client, options['repeat'])
+        fruits: List[Fruit] = seed_fruits(options['fruits'], options['seed'])
+
+        results: List[Dict[str, Any]] = []
+        failures: List[str] = []
+        seeded: int = 0
+        for size in sizes:
+            # 前の件数との差分だけを追加で生成する
+            started: float = time.perf_counter()
+            seeded += seed_sales(options['fruits'], size - seeded, start, end, seed=options['seed'] + size)
+            seed_seconds: float = time.perf_counter() - started
+
+            measurements: List[Measurement] = bench.views() + [
+                bench.csv_import(fruits, options['import_rows'], start, end,
+                                 options['import_batch_size'], seed=options['seed'] - 1)]
+            results.append({
+                'rows': size,
+                'seed_seconds': round(seed_seconds, 2),
+                'scenarios': {measurement.name: measurement.as_report() for measurement in measurements},
+            })
+            for measurement in measurements:
+                self.stdout.write(
+                    f'rows={size:>9,} {measurement.name:<24} queries={measurement.queries:>4}/{measurement.budget:<4} '
+                    f"median={measurement.as_report()['median_ms']:>9.2f}ms")
+                if measurement.over_budget:
+                    failures.append(f'rows={size} {measurement.name}: {measurement.queries} > {measurement.budget}')
+                if measurement.status_code >= 400:
+                    failures.append(f'rows={size} {measurement.name}: status {measurement.status_code}')
+
+        report: Dict[str, Any] = {
+            'revision': git_revision(),
+            'database': connection.vendor,
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'fruits': options['fruits'],
+            'repeat': options['repeat'],
+            'import_rows': options['import_rows'],
+            'results': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+            file.write('\n')
+        self.stdout.write(f"結果を {options['output']} に書き出しました。")
+
+        if failures:
+            raise CommandError('クエリ数の上限を超えた、またはエラーになった画面があります:\n' + '\n'.join(failures))
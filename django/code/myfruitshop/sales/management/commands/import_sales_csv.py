@@ -0,0 +1,31 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from sales.importer import ImportResult
+from sales.parallel_import import ParallelSaleImporter
+
+
+class Command(BaseCommand):
+    help = 'サーバー上のCSVファイルを複数プロセスで検証して取り込みます(月末の一括取り込み用)。'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('path', help='取り込むCSVファイル')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='検証に使うプロセス数')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='一度にINSERTする件数')
+
+    def handle(self, *args, **options) -> None:
+        if not os.path.exists(options['path']):
+            raise CommandError(f"ファイルが見つかりません: {options['path']}")
+
+        started: float = time.perf_counter()
+        result: ImportResult = ParallelSaleImporter(options['workers'], options['batch_size']).run(options['path'])
+        elapsed: float = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{result.imported} 件登録しました({result.processed / elapsed:.0f} 行/秒、取り込みID: {result.import_batch})。'))
+        for reason, count in result.rejected_items:
+            self.stdout.write(f'  {reason}: {count} 件')
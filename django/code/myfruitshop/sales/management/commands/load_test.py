@@ -0,0 +1,59 @@
+import json
+from typing import Any, Dict, List
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.test import Client
+from django.urls import reverse
+
+from sales.benchmarks import LoadResult, http_load
+
+
+class Command(BaseCommand):
+    help = ('起動済みのサーバーにHTTPで同時にリクエストし、スループットと応答時間のパーセンタイルを計測します。'
+            'runserverとgunicornなど、起動方法ごとの比較に使います(サーバーと同じDBを指定して実行してください)。')
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000', help='計測するサーバーのURL')
+        parser.add_argument('--label', default='server', help='結果に付ける名前(例: runserver, gunicorn)')
+        parser.add_argument('--paths', nargs='+', default=None,
+                            help='計測するパス(既定: 売り上げ集計・販売情報一覧・果物一覧)')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32], help='同時接続数')
+        parser.add_argument('--requests', type=int, default=500, help='同時接続数・パスごとのリクエスト数')
+        parser.add_argument('--output', default=None, help='結果を追記するJSONファイル')
+
+    def handle(self, *args, **options) -> None:
+        # 計測用ユーザーのセッションをDBに作り、そのCookieでリクエストする
+        client: Client = Client()
+        client.force_login(User.objects.get_or_create(username='bench-user')[0])
+        session_key: str = client.cookies[settings.SESSION_COOKIE_NAME].value
+        paths: List[str] = options['paths'] or [reverse('sales_aggregate'), reverse('sales_combined'), reverse('fruit')]
+
+        reports: List[Dict[str, Any]] = []
+        for path in paths:
+            # 初回のキャッシュ作成を計測から外す
+            http_load(options['label'], options['base_url'], path, session_key, 1, 1)
+            for concurrency in sorted(set(options['concurrency'])):
+                result: LoadResult = http_load(options['label'], options['base_url'], path, session_key,
+                                               concurrency, options['requests'])
+                report: Dict[str, Any] = result.as_report()
+                reports.append(report)
+                self.stdout.write(
+                    f"{options['label']:<10} {path:<28} c={concurrency:<4} "
+                    f"rps={report['requests_per_second']:>8} p50={report['p50_ms']:>8.2f}ms "
+                    f"p95={report['p95_ms']:>8.2f}ms p99={report['p99_ms']:>8.2f}ms errors={result.errors}")
+
+        if options['output']:
+            try:
+                with open(options['output'], encoding='utf-8') as file:
+                    existing: List[Dict[str, Any]] = json.load(file)
+            except FileNotFoundError:
+                existing = []
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(existing + reports, file, indent=2, sort_keys=True)
+                file.write('\n')
+            self.stdout.write(f"結果を {options['output']} に追記しました。")
+
+        if any(report['errors'] for report in reports):
+            raise CommandError('エラーになったリクエストがあります。')
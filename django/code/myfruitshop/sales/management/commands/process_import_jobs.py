@@ -0,0 +1,36 @@
+import time
+from typing import Optional
+
+from django.core.management.base import BaseCommand, CommandParser
+
+from sales.jobs import claim_next_job, recover_stale_jobs, run_job
+from sales.models import ImportJob
+
+
+class Command(BaseCommand):
+    help = '待機中のCSV取り込みジョブを順に処理します。進捗が途絶えた処理中のジョブは取り消して待機中に戻します。'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--once', action='store_true',
+                            help='待機中のジョブを処理し終えたら終了します。')
+        parser.add_argument('--interval', type=float, default=2.0,
+                            help='ジョブがないときの待機秒数')
+
+    def handle(self, *args, **options) -> None:
+        try:
+            while True:
+                # 強制終了などで止まったワーカーのジョブを先に待機中へ戻す
+                for job_id in recover_stale_jobs():
+                    self.stdout.write(f'job={job_id} recovered')
+                job: Optional[ImportJob] = claim_next_job()
+                if job is None:
+                    if options['once']:
+                        return
+                    time.sleep(options['interval'])
+                    continue
+
+                job = run_job(job)
+                self.stdout.write(
+                    f'job={job.pk} status={job.status} imported={job.rows_imported} rejected={job.rows_rejected}')
+        except KeyboardInterrupt:
+            self.stdout.write('停止しました。')
@@ -0,0 +1,49 @@
+from datetime import date
+from typing import Dict, Optional
+
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import transaction
+
+from sales.caching import bump_sales_version
+from sales.grand_total import lock_grand_total
+from sales.models import SalesPrefixSum
+from sales.prefix_sums import PrefixKey, RangeTotal, expected_prefix_sums, rebuild_prefix_sums, stored_prefix_sums
+
+
+class Command(BaseCommand):
+    help = '日次集計(SalesDailyRollup)から期間合計用の累計(SalesPrefixSum)を再構築・検証します。'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--from', dest='start_day', type=date.fromisoformat,
+                            help='この日(日本時間, YYYY-MM-DD)以降の累計だけを作り直します。')
+        parser.add_argument('--check', action='store_true',
+                            help='書き込みは行わず、差分のある行だけを表示します。')
+
+    def handle(self, *args, **options) -> None:
+        if options['check']:
+            expected: Dict[PrefixKey, RangeTotal] = expected_prefix_sums()
+            actual: Dict[PrefixKey, RangeTotal] = stored_prefix_sums()
+            mismatches: int = 0
+            for key in sorted(set(expected) | set(actual), key=lambda key: (key[0] or 0, key[1])):
+                if expected.get(key) != actual.get(key):
+                    mismatches += 1
+                    self.stdout.write(f"{key[1]} fruit={key[0] or 'all'}: "
+                                      f'expected={expected.get(key)} actual={actual.get(key)}')
+            # 同じ(果物, 日付)の行が重複していると、辞書では1行にまとまるため行数で確かめる
+            duplicates: int = SalesPrefixSum.objects.count() - len(actual)
+            if duplicates:
+                mismatches += duplicates
+                self.stdout.write(f'{duplicates} 行が同じ果物・日付の行と重複しています。')
+            if mismatches:
+                self.stdout.write(self.style.WARNING(f'{mismatches} 件の差分があります。'))
+            else:
+                self.stdout.write(self.style.SUCCESS('差分はありません。'))
+            return
+
+        start_day: Optional[date] = options['start_day']
+        with transaction.atomic():
+            # 作り直す間に登録された販売実績の加算が失われないよう、書き込みを待たせる
+            lock_grand_total()
+            count: int = rebuild_prefix_sums(start_day)
+        bump_sales_version()
+        self.stdout.write(self.style.SUCCESS(f'{count} 行の累計を再構築しました。'))
@@ -0,0 +1,39 @@
+from datetime import date
+from typing import Dict, Optional, Tuple
+
+from django.core.management.base import BaseCommand, CommandParser
+
+from sales.rollups import RollupKey, compute_rollup, rebuild_rollup, stored_rollup
+
+
+class Command(BaseCommand):
+    help = '販売実績(Sale)から日次集計テーブル(SalesDailyRollup)を再構築・検証します。'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--from', dest='start_day', type=date.fromisoformat,
+                            help='対象期間の開始日(日本時間, YYYY-MM-DD)')
+        parser.add_argument('--to', dest='end_day', type=date.fromisoformat,
+                            help='対象期間の終了日(日本時間, YYYY-MM-DD)')
+        parser.add_argument('--check', action='store_true',
+                            help='書き込みは行わず、差分のある行だけを表示します。')
+
+    def handle(self, *args, **options) -> None:
+        start_day: Optional[date] = options['start_day']
+        end_day: Optional[date] = options['end_day']
+
+        if options['check']:
+            expected: Dict[RollupKey, Tuple[int, int, int]] = compute_rollup(start_day, end_day)
+            actual: Dict[RollupKey, Tuple[int, int, int]] = stored_rollup(start_day, end_day)
+            mismatches: int = 0
+            for key in sorted(set(expected) | set(actual)):
+                if expected.get(key) != actual.get(key):
+                    mismatches += 1
+                    self.stdout.write(f'{key[0]} fruit={key[1]}: expected={expected.get(key)} actual={actual.get(key)}')
+            if mismatches:
+                self.stdout.write(self.style.WARNING(f'{mismatches} 件の差分があります。'))
+            else:
+                self.stdout.write(self.style.SUCCESS('差分はありません。'))
+            return
+
+        count: int = rebuild_rollup(start_day, end_day)
+        self.stdout.write(self.style.SUCCESS(f'{count} 行の日次集計を再構築しました。'))
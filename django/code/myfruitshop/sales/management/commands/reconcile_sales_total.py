@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandParser
+
+from sales.caching import bump_sales_version
+from sales.grand_total import compute_grand_total, grand_total, rebuild_grand_total
+from sales.prefix_sums import RangeTotal
+
+
+class Command(BaseCommand):
+    help = '全体の累計(SalesGrandTotal)を販売実績テーブルと照合します。'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--fix', action='store_true',
+                            help='差分がある場合に販売実績テーブルの値で累計を書き換えます。')
+
+    def handle(self, *args, **options) -> None:
+        expected: RangeTotal = compute_grand_total()
+        actual: RangeTotal = grand_total()
+        if expected == actual:
+            self.stdout.write(self.style.SUCCESS(
+                f'差分はありません。(金額 {actual.amount} / 個数 {actual.quantity} / 件数 {actual.count})'))
+            return
+
+        self.stdout.write(f'expected={expected} actual={actual}')
+        if not options['fix']:
+            self.stdout.write(self.style.WARNING('累計に差分があります。--fix で修正できます。'))
+            return
+
+        rebuild_grand_total()
+        bump_sales_version()
+        self.stdout.write(self.style.SUCCESS('累計を修正しました。'))
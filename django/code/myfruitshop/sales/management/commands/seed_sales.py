@@ -0,0 +1,35 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from sales.seeding import seed_sales
+
+
+class Command(BaseCommand):
+    help = '計測・動作確認用に、果物と販売実績を乱数の種から再現可能な形で生成します。'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--fruits', type=int, default=50, help='果物の種類数')
+        parser.add_argument('--sales', type=int, default=10_000, help='生成する販売実績の件数')
+        parser.add_argument('--from', dest='start_day', type=date.fromisoformat, default=date(2023, 1, 1),
+                            help='販売日の開始日(日本時間, YYYY-MM-DD)')
+        parser.add_argument('--to', dest='end_day', type=date.fromisoformat, default=date(2023, 12, 31),
+                            help='販売日の終了日(日本時間, YYYY-MM-DD)')
+        parser.add_argument('--seed', type=int, default=0, help='乱数の種')
+        parser.add_argument('--inactive-ratio', type=float, default=0.0, help='削除済みにする割合(0〜1)')
+        parser.add_argument('--batch-size', type=int, default=5000, help='一度に登録する件数')
+
+    def handle(self, *args, **options) -> None:
+        if options['end_day'] < options['start_day']:
+            raise CommandError('--to には --from 以降の日付を指定してください。')
+        if options['fruits'] < 1:
+            raise CommandError('--fruits には1以上を指定してください。')
+
+        started: float = time.perf_counter()
+        created: int = seed_sales(
+            options['fruits'], options['sales'], options['start_day'], options['end_day'],
+            seed=options['seed'], inactive_ratio=options['inactive_ratio'], batch_size=options['batch_size'])
+        elapsed: float = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['fruits']} 種類の果物と {created} 件の販売実績を生成しました({elapsed:.1f}秒)。"))
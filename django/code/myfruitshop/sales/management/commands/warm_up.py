@@ -0,0 +1,14 @@
+import json
+from typing import Dict
+
+from django.core.management.base import BaseCommand
+
+from myfruitshop.warmup import warm_up
+
+
+class Command(BaseCommand):
+    help = 'URL定義の読み込み・テンプレートのコンパイル・果物カタログの読み込みを行い、手順ごとの所要時間を表示します。'
+
+    def handle(self, *args, **options) -> None:
+        report: Dict[str, Dict[str, float]] = warm_up()
+        self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
@@ -0,0 +1,55 @@
+# Generated by Django 4.2 on 2026-10-18 11:27
+
+from zoneinfo import ZoneInfo
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+
+
+def populate_rollup(apps, schema_editor):
+    # 既存の販売実績から日次集計を作成する
+    Sale = apps.get_model('sales', 'Sale')
+    SalesDailyRollup = apps.get_model('sales', 'SalesDailyRollup')
+    rows = (
+        Sale.objects.filter(is_active=True)
+        .annotate(day=TruncDate('sale_date', tzinfo=ZoneInfo('Asia/Tokyo')))
+        .values('day', 'fruit_id')
+        .annotate(amount=Sum('total_amount'), qty=Sum('quantity'), count=Count('id'))
+        .order_by()
+    )
+    SalesDailyRollup.objects.bulk_create(
+        [
+            SalesDailyRollup(day=row['day'], fruit_id=row['fruit_id'], total_amount=row['amount'],
+                             quantity=row['qty'], sale_count=row['count'])
+            for row in rows.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0005_sale_is_active'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('total_amount', models.BigIntegerField(default=0)),
+                ('quantity', models.BigIntegerField(default=0)),
+                ('sale_count', models.IntegerField(default=0)),
+                ('fruit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sales.fruit')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='salesdailyrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'fruit'), name='sales_rollup_day_fruit_uniq'),
+        ),
+        migrations.RunPython(populate_rollup, migrations.RunPython.noop),
+    ]
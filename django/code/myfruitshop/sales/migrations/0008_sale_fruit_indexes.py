@@ -0,0 +1,29 @@
+# Generated by Django 4.2 on 2026-10-18 11:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0007_importjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fruit',
+            index=models.Index(fields=['name', 'is_active'], name='fruit_name_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['is_active', 'sale_date'], name='sale_active_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['sale_date'], name='sale_active_only_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['fruit', 'sale_date'], name='sale_fruit_date_idx'),
+        ),
+    ]
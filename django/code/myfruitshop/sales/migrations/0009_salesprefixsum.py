@@ -0,0 +1,54 @@
+# Generated by Django 4.2 on 2026-10-18 11:51
+
+from django.db import migrations, models
+from django.db.models import Sum
+import django.db.models.deletion
+
+
+def populate_prefix_sums(apps, schema_editor):
+    # 日次集計から果物ごと・全果物の累計を作成する
+    SalesDailyRollup = apps.get_model('sales', 'SalesDailyRollup')
+    SalesPrefixSum = apps.get_model('sales', 'SalesPrefixSum')
+    fruit_ids = [None, *SalesDailyRollup.objects.values_list('fruit_id', flat=True).distinct().order_by('fruit_id')]
+    for fruit_id in fruit_ids:
+        rows = SalesDailyRollup.objects.all() if fruit_id is None else SalesDailyRollup.objects.filter(fruit_id=fruit_id)
+        amount = quantity = count = 0
+        prefix_sums = []
+        for row in rows.values('day').annotate(
+                amount=Sum('total_amount'), qty=Sum('quantity'), count=Sum('sale_count')).order_by('day').iterator():
+            amount += row['amount']
+            quantity += row['qty']
+            count += row['count']
+            prefix_sums.append(SalesPrefixSum(day=row['day'], fruit_id=fruit_id, total_amount=amount,
+                                              quantity=quantity, sale_count=count))
+        SalesPrefixSum.objects.bulk_create(prefix_sums, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0008_sale_fruit_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesPrefixSum',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('total_amount', models.BigIntegerField(default=0)),
+                ('quantity', models.BigIntegerField(default=0)),
+                ('sale_count', models.BigIntegerField(default=0)),
+                ('fruit', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='sales.fruit')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='salesprefixsum',
+            constraint=models.UniqueConstraint(fields=('fruit', 'day'), name='sales_prefix_fruit_day_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='salesprefixsum',
+            constraint=models.UniqueConstraint(condition=models.Q(('fruit__isnull', True)), fields=('day',), name='sales_prefix_all_day_uniq'),
+        ),
+        migrations.RunPython(populate_prefix_sums, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2 on 2026-10-18 11:55
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_grand_total(apps, schema_editor):
+    # 有効な販売実績から累計の1行を作成する
+    Sale = apps.get_model('sales', 'Sale')
+    SalesGrandTotal = apps.get_model('sales', 'SalesGrandTotal')
+    row = Sale.objects.filter(is_active=True).aggregate(
+        amount=Sum('total_amount'), qty=Sum('quantity'), count=Count('id'))
+    SalesGrandTotal.objects.create(pk=1, total_amount=row['amount'] or 0, quantity=row['qty'] or 0,
+                                   active_count=row['count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0009_salesprefixsum'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesGrandTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_amount', models.BigIntegerField(default=0)),
+                ('quantity', models.BigIntegerField(default=0)),
+                ('active_count', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(populate_grand_total, migrations.RunPython.noop),
+    ]
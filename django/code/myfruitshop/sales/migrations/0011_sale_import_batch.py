@@ -0,0 +1,22 @@
+# Generated by Django 4.2 on 2026-10-18 12:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0010_salesgrandtotal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sale',
+            name='import_batch',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['import_batch'], name='sale_import_batch_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2 on 2026-10-18 12:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_price_history(apps, schema_editor):
+    # 既存の果物は登録日時から現在の単価だったものとして履歴の最初の行を作成する
+    Fruit = apps.get_model('sales', 'Fruit')
+    FruitPriceHistory = apps.get_model('sales', 'FruitPriceHistory')
+    FruitPriceHistory.objects.bulk_create([
+        FruitPriceHistory(fruit_id=pk, price=price, effective_from=created_at)
+        for pk, price, created_at in Fruit.objects.values_list('id', 'price', 'created_at').iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0011_sale_import_batch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FruitPriceHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.PositiveIntegerField()),
+                ('effective_from', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('fruit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_history', to='sales.fruit')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='fruitpricehistory',
+            constraint=models.UniqueConstraint(fields=('fruit', 'effective_from'), name='fruit_price_fruit_from_uniq'),
+        ),
+        migrations.RunPython(populate_price_history, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,111 @@
+# Generated by Django 4.2 on 2026-10-18 12:44
+
+from datetime import date, datetime, time, timezone as dt_timezone
+from zoneinfo import ZoneInfo
+
+from django.db import migrations, models
+from django.db.models import Min
+from django.utils import timezone
+import django.db.models.deletion
+
+# このマイグレーションの時点のパーティションの定義(sales.partitionsを変えても、適用済みの環境と同じ結果にする)
+JST = ZoneInfo('Asia/Tokyo')
+SALE_TABLE = 'sales_sale'
+MAXVALUE_PARTITION = 'pmax'
+# 今月から何ヶ月先までパーティションを作るか(以降はarchive_salesが作る)
+PARTITION_MONTHS_AHEAD = 3
+
+
+def add_months(day, months):
+    month_index = day.year * 12 + day.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_definitions(first, last):
+    # 日本時間の月ごとに、翌月1日0時(UTC)未満の販売日時を受ける。最初の月はそれより前の販売日時も受ける
+    definitions = []
+    month = first
+    while month <= last:
+        upper = datetime.combine(add_months(month, 1), time.min, tzinfo=JST).astimezone(dt_timezone.utc)
+        definitions.append(f"PARTITION p{month:%Y%m} VALUES LESS THAN ('{upper:%Y-%m-%d %H:%M:%S}')")
+        month = add_months(month, 1)
+    definitions.append(f'PARTITION {MAXVALUE_PARTITION} VALUES LESS THAN (MAXVALUE)')
+    return ', '.join(definitions)
+
+
+def fetch_names(cursor, sql):
+    cursor.execute(sql, [SALE_TABLE])
+    return [row[0] for row in cursor.fetchall()]
+
+
+def is_partitioned(cursor):
+    return bool(fetch_names(
+        cursor,
+        'SELECT PARTITION_NAME FROM information_schema.PARTITIONS '
+        'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL'))
+
+
+def partition_sales(apps, schema_editor):
+    # MySQLだけ、販売実績テーブルを最初の販売日時の月から数ヶ月先までの月ごとのパーティションに分ける。
+    # パーティション化したテーブルは外部キーを持てず、主キーに販売日時を含める必要がある。
+    # 外部キーはDjangoがアプリ側で扱うため、DBの制約だけを外す
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    Sale = apps.get_model('sales', 'Sale')
+    this_month = timezone.now().astimezone(JST).date().replace(day=1)
+    oldest = Sale.objects.aggregate(oldest=Min('sale_date'))['oldest']
+    first = oldest.astimezone(JST).date().replace(day=1) if oldest else this_month
+    with schema_editor.connection.cursor() as cursor:
+        if is_partitioned(cursor):
+            return
+        foreign_keys = fetch_names(
+            cursor,
+            'SELECT CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS '
+            'WHERE CONSTRAINT_SCHEMA = DATABASE() AND TABLE_NAME = %s')
+        for name in foreign_keys:
+            cursor.execute(f'ALTER TABLE {SALE_TABLE} DROP FOREIGN KEY {name}')
+        cursor.execute(f'ALTER TABLE {SALE_TABLE} DROP PRIMARY KEY, ADD PRIMARY KEY (id, sale_date)')
+        cursor.execute(f'ALTER TABLE {SALE_TABLE} PARTITION BY RANGE COLUMNS(sale_date) '
+                       f'({partition_definitions(first, add_months(this_month, PARTITION_MONTHS_AHEAD))})')
+
+
+def unpartition_sales(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        if not is_partitioned(cursor):
+            return
+        cursor.execute(f'ALTER TABLE {SALE_TABLE} REMOVE PARTITIONING')
+        cursor.execute(f'ALTER TABLE {SALE_TABLE} DROP PRIMARY KEY, ADD PRIMARY KEY (id)')
+        cursor.execute(f'ALTER TABLE {SALE_TABLE} ADD CONSTRAINT sales_sale_fruit_id_fk '
+                       f'FOREIGN KEY (fruit_id) REFERENCES sales_fruit (id)')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0012_fruitpricehistory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SaleArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('quantity', models.PositiveIntegerField()),
+                ('total_amount', models.PositiveIntegerField()),
+                ('sale_date', models.DateTimeField()),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('is_active', models.BooleanField(default=True)),
+                ('import_batch', models.CharField(blank=True, default='', max_length=32)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('fruit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='sales.fruit')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='salearchive',
+            index=models.Index(fields=['is_active', 'sale_date'], name='sale_archive_active_date_idx'),
+        ),
+        migrations.RunPython(partition_sales, unpartition_sales),
+    ]
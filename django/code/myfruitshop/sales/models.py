@@ -1,4 +1,8 @@
+from typing import Any, Dict, Optional
+
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
 class Fruit(models.Model):
     name: str = models.CharField(max_length=255)
@@ -7,9 +11,29 @@ class Fruit(models.Model):
     updated_at: models.DateTimeField = models.DateTimeField(auto_now=True)
     is_active: bool = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['name', 'is_active'], name='fruit_name_active_idx'),
+        ]
+
     def __str__(self) -> str:
         return self.name
 
+class FruitPriceHistory(models.Model):
+    # 果物の単価の履歴。effective_from以降はpriceが適用される(最初の行より前は最初の単価とみなす)
+    fruit: models.ForeignKey = models.ForeignKey(Fruit, on_delete=models.CASCADE, related_name='price_history')
+    price: int = models.PositiveIntegerField()
+    effective_from: models.DateTimeField = models.DateTimeField()
+    created_at: models.DateTimeField = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['fruit', 'effective_from'], name='fruit_price_fruit_from_uniq'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.fruit_id} - {self.price} - {self.effective_from}"
+
 class Sale(models.Model):
     fruit: models.ForeignKey = models.ForeignKey(Fruit, on_delete=models.CASCADE)
     quantity: int = models.PositiveIntegerField()
@@ -18,6 +42,186 @@ class Sale(models.Model):
     created_at: models.DateTimeField = models.DateTimeField(auto_now_add=True)
     updated_at: models.DateTimeField = models.DateTimeField(auto_now=True)
     is_active: bool = models.BooleanField(default=True)
+    # CSV取り込みの単位ごとの識別子(画面・コマンドでの登録は空)。取り込み単位での一括操作に使う
+    import_batch: str = models.CharField(max_length=32, blank=True, default='')
+
+    class Meta:
+        indexes = [
+            # 一覧・集計(有効な販売実績を販売日時で絞り込み・並び替え)
+            models.Index(fields=['is_active', 'sale_date'], name='sale_active_date_idx'),
+            # SQLite/PostgreSQLではis_active=Trueが「WHERE is_active」として発行され、
+            # 上の複合インデックスを使えないため部分インデックスも用意する(MySQLでは作成されない)
+            models.Index(fields=['sale_date'], condition=models.Q(is_active=True), name='sale_active_only_date_idx'),
+            # 果物ごとの期間検索
+            models.Index(fields=['fruit', 'sale_date'], name='sale_fruit_date_idx'),
+            # 取り込み単位での一括操作
+            models.Index(fields=['import_batch'], name='sale_import_batch_idx'),
+        ]
 
     def __str__(self) -> str:
         return f"{self.fruit.name} - {self.quantity} units - {self.sale_date}"
+
+
+class SaleArchive(models.Model):
+    # 保管期間を過ぎて販売実績テーブルから移した販売実績(論理削除済みを含む)。
+    # 主キーは元のSaleのIDのまま。日次集計・累計には移す前の値が残っている
+    id: int = models.BigIntegerField(primary_key=True)
+    fruit: models.ForeignKey = models.ForeignKey(Fruit, on_delete=models.CASCADE)
+    quantity: int = models.PositiveIntegerField()
+    total_amount: int = models.PositiveIntegerField()
+    sale_date: models.DateTimeField = models.DateTimeField()
+    created_at: models.DateTimeField = models.DateTimeField()
+    updated_at: models.DateTimeField = models.DateTimeField()
+    is_active: bool = models.BooleanField(default=True)
+    import_batch: str = models.CharField(max_length=32, blank=True, default='')
+    archived_at: models.DateTimeField = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # 日次集計の再構築・日本時間以外の集計(有効な販売実績を販売日時で絞り込み)
+            models.Index(fields=['is_active', 'sale_date'], name='sale_archive_active_date_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.fruit_id} - {self.quantity} units - {self.sale_date} (archived)"
+
+class SalesDailyRollup(models.Model):
+    # 日本時間の日付 x 果物ごとの有効な販売実績の集計
+    day: models.DateField = models.DateField()
+    fruit: models.ForeignKey = models.ForeignKey(Fruit, on_delete=models.CASCADE)
+    total_amount: int = models.BigIntegerField(default=0)
+    quantity: int = models.BigIntegerField(default=0)
+    sale_count: int = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'fruit'], name='sales_rollup_day_fruit_uniq'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.day} - {self.fruit_id} - {self.total_amount}"
+
+
+class SalesPrefixSum(models.Model):
+    # 果物ごと(fruit=NULLは全果物)の、その日(日本時間)までの有効な販売実績の累計。
+    # 販売のあった日だけ行を持ち、期間の合計は「終了日の累計 - 開始前日の累計」で求める
+    day: models.DateField = models.DateField()
+    fruit: models.ForeignKey = models.ForeignKey(Fruit, on_delete=models.CASCADE, null=True)
+    total_amount: int = models.BigIntegerField(default=0)
+    quantity: int = models.BigIntegerField(default=0)
+    sale_count: int = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['fruit', 'day'], name='sales_prefix_fruit_day_uniq'),
+            # NULLは一意制約で重複とみなされないため、全果物の系列は別に制約を設ける(MySQLでは作成されないため、
+            # 更新は全体の累計の行のロックで直列化する。rollups.apply_deltasを参照)
+            models.UniqueConstraint(fields=['day'], condition=models.Q(fruit__isnull=True),
+                                    name='sales_prefix_all_day_uniq'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.day} - {self.fruit_id or 'all'} - {self.total_amount}"
+
+
+class SalesGrandTotal(models.Model):
+    # 有効な販売実績全体の累計を1行で保持する(pk=1の1行だけ)
+    total_amount: int = models.BigIntegerField(default=0)
+    quantity: int = models.BigIntegerField(default=0)
+    active_count: int = models.BigIntegerField(default=0)
+    updated_at: models.DateTimeField = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"{self.total_amount} - {self.quantity} - {self.active_count}"
+
+
+class ImportJob(models.Model):
+    STATUS_QUEUED: str = 'queued'
+    STATUS_RUNNING: str = 'running'
+    STATUS_DONE: str = 'done'
+    STATUS_FAILED: str = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, '待機中'),
+        (STATUS_RUNNING, '処理中'),
+        (STATUS_DONE, '完了'),
+        (STATUS_FAILED, '失敗'),
+    ]
+
+    status: str = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    file_path: str = models.CharField(max_length=500)
+    file_size: int = models.BigIntegerField(default=0)
+    bytes_processed: int = models.BigIntegerField(default=0)
+    rows_imported: int = models.BigIntegerField(default=0)
+    rows_rejected: int = models.BigIntegerField(default=0)
+    rejected_reasons: dict = models.JSONField(default=dict)
+    error: str = models.TextField(blank=True)
+    created_by: models.ForeignKey = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at: models.DateTimeField = models.DateTimeField(auto_now_add=True)
+    started_at: models.DateTimeField = models.DateTimeField(null=True, blank=True)
+    finished_at: models.DateTimeField = models.DateTimeField(null=True, blank=True)
+    # 処理中のワーカーが進捗を書き込んだ最後の日時(止まったワーカーのジョブを見つけるため)
+    heartbeat_at: models.DateTimeField = models.DateTimeField(null=True, blank=True)
+    # ワーカーがこのジョブを確保した回数
+    attempts: int = models.PositiveIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f"ImportJob {self.pk} - {self.status}"
+
+    @property
+    def import_batch(self) -> str:
+        # このジョブで登録した販売実績のSale.import_batch。
+        # 止まったワーカーから取り戻して再実行する場合は、前回の分と区別するため回数を付ける
+        if self.attempts <= 1:
+            return f'job-{self.pk}'
+        return f'job-{self.pk}-{self.attempts}'
+
+    @property
+    def rows_processed(self) -> int:
+        return self.rows_imported + self.rows_rejected
+
+    @property
+    def elapsed_seconds(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        end: Any = self.finished_at or timezone.now()
+        return max((end - self.started_at).total_seconds(), 0.0)
+
+    @property
+    def throughput(self) -> Optional[float]:
+        # 1秒あたりの処理行数
+        elapsed: float = self.elapsed_seconds
+        if not elapsed:
+            return None
+        return self.rows_processed / elapsed
+
+    @property
+    def eta_seconds(self) -> Optional[float]:
+        # 処理済みバイト数の速度から残り時間を見積もる
+        if self.status == self.STATUS_DONE:
+            return 0.0
+        elapsed: float = self.elapsed_seconds
+        if self.status != self.STATUS_RUNNING or not elapsed or not self.bytes_processed:
+            return None
+        bytes_per_second: float = self.bytes_processed / elapsed
+        return max(self.file_size - self.bytes_processed, 0) / bytes_per_second
+
+    def as_status(self) -> Dict[str, Any]:
+        return {
+            'id': self.pk,
+            'status': self.status,
+            'file_size': self.file_size,
+            'bytes_processed': self.bytes_processed,
+            'rows_processed': self.rows_processed,
+            'rows_imported': self.rows_imported,
+            'rows_rejected': self.rows_rejected,
+            'rejected_reasons': self.rejected_reasons,
+            'throughput': self.throughput,
+            'eta_seconds': self.eta_seconds,
+            'error': self.error,
+            'attempts': self.attempts,
+            'import_batch': self.import_batch,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
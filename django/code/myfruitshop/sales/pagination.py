@@ -0,0 +1,153 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Q, QuerySet, Sum
+from django.utils.functional import cached_property
+
+from .models import Sale, SalesDailyRollup
+from .rollups import jst_day
+
+ACTIVE_SALES_COUNT_KEY: str = 'sales:active_count'
+
+
+def first_sale_query() -> QuerySet:
+    # 一覧に残っている最も古い有効な販売実績の販売日時(インデックスの先頭の1件)
+    return Sale.objects.filter(is_active=True).order_by('sale_date').values_list('sale_date', flat=True)[:1]
+
+
+def rollup_count_query(first_sale: Optional[datetime]) -> QuerySet:
+    # 日次集計は保管済みの販売実績も数えるため、一覧に残っている最も古い販売日以降の日だけを合計する
+    # (保管は日本時間の日単位で行う)
+    if first_sale is None:
+        return SalesDailyRollup.objects.none()
+    return SalesDailyRollup.objects.filter(day__gte=jst_day(first_sale))
+
+
+def approximate_sale_count() -> int:
+    # 有効な販売実績の件数を日次集計から求め、一定時間キャッシュする(COUNT(*)を避ける)
+    count: Optional[int] = cache.get(ACTIVE_SALES_COUNT_KEY)
+    if count is None:
+        first_sale: Optional[datetime] = first_sale_query().first()
+        count = rollup_count_query(first_sale).aggregate(count=Sum('sale_count'))['count'] or 0
+        cache.set(ACTIVE_SALES_COUNT_KEY, count, settings.SALES_LIST_COUNT_TIMEOUT)
+    return count
+
+
+async def aapproximate_sale_count() -> int:
+    count: Optional[int] = await cache.aget(ACTIVE_SALES_COUNT_KEY)
+    if count is None:
+        first_sale: Optional[datetime] = await first_sale_query().afirst()
+        count = (await rollup_count_query(first_sale).aaggregate(count=Sum('sale_count')))['count'] or 0
+        await cache.aset(ACTIVE_SALES_COUNT_KEY, count, settings.SALES_LIST_COUNT_TIMEOUT)
+    return count
+
+
+def forget_sale_count() -> None:
+    cache.delete(ACTIVE_SALES_COUNT_KEY)
+
+
+class CachedCountPaginator(Paginator):
+    # ページ番号方式でも正確なCOUNT(*)の代わりにキャッシュした件数を使う
+    @cached_property
+    def count(self) -> int:
+        return approximate_sale_count()
+
+
+def encode_cursor(direction: str, sale: Optional[Sale] = None) -> str:
+    payload: Dict[str, Any] = {'r': direction}
+    if sale is not None:
+        payload.update({'d': sale.sale_date.isoformat(), 'i': sale.pk})
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Optional[Dict[str, Any]]:
+    try:
+        payload: Dict[str, Any] = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if payload['r'] != 'last':
+            payload['d'] = datetime.fromisoformat(payload['d'])
+            payload['i'] = int(payload['i'])
+        return payload
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        return None
+
+
+class KeysetPage:
+    is_keyset: bool = True
+
+    def __init__(self, object_list: List[Sale], has_next: bool, has_previous: bool) -> None:
+        self.object_list: List[Sale] = object_list
+        self.has_next: bool = has_next
+        self.has_previous: bool = has_previous
+
+    def __iter__(self) -> Iterator[Sale]:
+        return iter(self.object_list)
+
+    def __len__(self) -> int:
+        return len(self.object_list)
+
+    @property
+    def next_cursor(self) -> Optional[str]:
+        return encode_cursor('next', self.object_list[-1]) if self.has_next else None
+
+    @property
+    def previous_cursor(self) -> Optional[str]:
+        return encode_cursor('prev', self.object_list[0]) if self.has_previous else None
+
+    @property
+    def last_cursor(self) -> str:
+        return encode_cursor('last')
+
+    @cached_property
+    def count(self) -> int:
+        return approximate_sale_count()
+
+
+class KeysetPaginator:
+    # (sale_date, id)の降順に並んだ一覧を、カーソル位置からの範囲読み込みでページングする
+    def __init__(self, queryset: QuerySet, per_page: int) -> None:
+        self.queryset: QuerySet = queryset
+        self.per_page: int = per_page
+
+    def page_query(self, cursor: Optional[str]) -> Tuple[str, QuerySet]:
+        # カーソルから(方向, 1件多めに読む範囲のクエリ)を求める。前方向と最後のページは逆順に読む
+        limit: int = self.per_page + 1
+        payload: Optional[Dict[str, Any]] = decode_cursor(cursor) if cursor else None
+        if payload is None:
+            return 'first', self.queryset[:limit]
+        if payload['r'] == 'last':
+            return 'last', self.queryset.reverse()[:limit]
+
+        sale_date: datetime = payload['d']
+        pk: int = payload['i']
+        if payload['r'] == 'prev':
+            return 'prev', self.queryset.filter(
+                Q(sale_date__gte=sale_date), Q(sale_date__gt=sale_date) | Q(pk__gt=pk)).reverse()[:limit]
+        # sale_date <= d の範囲条件を加えてインデックスの範囲検索にする
+        return 'next', self.queryset.filter(
+            Q(sale_date__lte=sale_date), Q(sale_date__lt=sale_date) | Q(pk__lt=pk))[:limit]
+
+    def build_page(self, direction: str, rows: List[Sale]) -> KeysetPage:
+        more: bool = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == 'first':
+            return KeysetPage(rows, more, False)
+        if direction == 'next':
+            return KeysetPage(rows, more, True)
+        rows.reverse()
+        if direction == 'prev':
+            return KeysetPage(rows, True, more)
+        return KeysetPage(rows, False, more)
+
+    def get_page(self, cursor: Optional[str]) -> KeysetPage:
+        direction, rows = self.page_query(cursor)
+        return self.build_page(direction, list(rows))
+
+    async def aget_page(self, cursor: Optional[str]) -> KeysetPage:
+        direction, rows = self.page_query(cursor)
+        return self.build_page(direction, [sale async for sale in rows])
@@ -0,0 +1,165 @@
+import csv
+import io
+import os
+from array import array
+from collections import Counter, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime, timezone as dt_timezone
+from typing import Callable, Deque, Iterator, List, NamedTuple, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.db import transaction
+
+from .catalog import fruit_catalog
+from .importer import FruitPrices, ImportResult, fruit_price_snapshot, new_import_batch, parse_row
+from .models import Sale
+from .price_history import PriceTable
+from .rollups import RollupDeltas, SaleFigures, apply_deltas
+
+# ワーカープロセスごとに保持する果物単価のスナップショット
+_worker_fruits: FruitPrices = {}
+_worker_prices: Optional[PriceTable] = None
+_worker_tzinfo: Optional[ZoneInfo] = None
+
+ByteRange = Tuple[int, int]
+
+
+class ChunkResult(NamedTuple):
+    # プロセス間の受け渡しを軽くするため、検証済みの行は型付き配列の列で返す
+    fruit_ids: array
+    quantities: array
+    total_amounts: array
+    timestamps: array
+    rejected: Counter
+    size: int
+
+    def __len__(self) -> int:
+        return len(self.fruit_ids)
+
+    def to_sales(self, import_batch: str = '', start: int = 0, stop: Optional[int] = None) -> List[Sale]:
+        # start〜stop行目だけをモデルのインスタンスにする(範囲全体を一度に作らない)
+        rows: slice = slice(start, stop)
+        return [
+            Sale(fruit_id=fruit_id, quantity=quantity, total_amount=total_amount,
+                 sale_date=datetime.fromtimestamp(timestamp, tz=dt_timezone.utc), import_batch=import_batch)
+            for fruit_id, quantity, total_amount, timestamp in zip(
+                self.fruit_ids[rows], self.quantities[rows], self.total_amounts[rows], self.timestamps[rows])
+        ]
+
+
+def split_ranges(path: str, chunks: int) -> List[ByteRange]:
+    # ファイルをおおよそ等分し、各境界を次の行頭まで進める
+    file_size: int = os.path.getsize(path)
+    boundaries: List[int] = [0]
+    with open(path, 'rb') as file:
+        for index in range(1, chunks):
+            position: int = file_size * index // chunks
+            if position <= boundaries[-1]:
+                continue
+            # 直前の1バイトから読むことで、境界がちょうど行頭の場合も正しく扱う
+            file.seek(position - 1)
+            file.readline()
+            boundary: int = file.tell()
+            if boundaries[-1] < boundary < file_size:
+                boundaries.append(boundary)
+    boundaries.append(file_size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if start < end]
+
+
+def byte_ranges(path: str, range_bytes: int, min_ranges: int = 1) -> List[ByteRange]:
+    # ファイルの大きさによらず1範囲をおおよそrange_bytes以下にする(ワーカー・書き込み側のメモリを一定に保つ)。
+    # 小さいファイルでも負荷が偏らないよう、少なくともmin_ranges個に分ける
+    return split_ranges(path, max(-(-os.path.getsize(path) // max(range_bytes, 1)), min_ranges))
+
+
+def _init_worker(fruits: FruitPrices, time_zone: str, prices: Optional[PriceTable] = None) -> None:
+    global _worker_fruits, _worker_prices, _worker_tzinfo
+    _worker_fruits = fruits
+    _worker_prices = prices
+    _worker_tzinfo = ZoneInfo(time_zone)
+
+
+def validate_range(path: str, byte_range: ByteRange) -> ChunkResult:
+    # ワーカープロセスで指定範囲の行をDBにアクセスせずに検証する
+    start, end = byte_range
+    with open(path, 'rb') as file:
+        file.seek(start)
+        text: str = file.read(end - start).decode('utf-8')
+
+    result: ChunkResult = ChunkResult(array('q'), array('q'), array('q'), array('q'), Counter(), end - start)
+    # 改行の扱いはcsvモジュールに任せる(splitlinesは引用符の中の\rや\u2028などでも行を分けてしまう)
+    for row in csv.reader(io.StringIO(text, newline='')):
+        parsed, reason = parse_row(row, _worker_fruits, _worker_tzinfo, _worker_prices)
+        if parsed is None:
+            result.rejected[reason] += 1
+            continue
+        result.fruit_ids.append(parsed.fruit_id)
+        result.quantities.append(parsed.quantity)
+        result.total_amounts.append(parsed.total_amount)
+        result.timestamps.append(int(parsed.sale_date.timestamp()))
+    return result
+
+
+class ParallelSaleImporter:
+    def __init__(
+        self, workers: Optional[int] = None, batch_size: Optional[int] = None, fruits: Optional[FruitPrices] = None,
+        import_batch: Optional[str] = None, prices: Optional[PriceTable] = None, range_bytes: Optional[int] = None,
+    ) -> None:
+        self.workers: int = workers or settings.SALES_IMPORT_WORKERS or os.cpu_count() or 1
+        self.batch_size: int = batch_size or settings.SALES_IMPORT_BATCH_SIZE
+        self.fruits: FruitPrices = fruits if fruits is not None else fruit_price_snapshot()
+        # 果物を指定した場合(計測など)は、単価の履歴も指定されたものだけを使う
+        self.prices: Optional[PriceTable] = prices if prices is not None or fruits is not None \
+            else fruit_catalog.price_table()
+        self.import_batch: str = import_batch or new_import_batch()
+        self.range_bytes: int = range_bytes or settings.SALES_IMPORT_RANGE_BYTES
+
+    def validate(self, path: str) -> Iterator[ChunkResult]:
+        # 一定のバイト数ごとの範囲に分け、ファイル順に結果を返す。
+        # 検証中・書き込み待ちの範囲はワーカー数の2倍までにし、ファイル全体の結果を同時に持たない
+        ranges: List[ByteRange] = byte_ranges(path, self.range_bytes, self.workers * 4)
+        if self.workers == 1:
+            _init_worker(self.fruits, settings.TIME_ZONE, self.prices)
+            for byte_range in ranges:
+                yield validate_range(path, byte_range)
+            return
+
+        with ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_init_worker, initargs=(self.fruits, settings.TIME_ZONE, self.prices)
+        ) as executor:
+            pending: Deque[Future] = deque()
+            for byte_range in ranges:
+                if len(pending) >= self.workers * 2:
+                    yield pending.popleft().result()
+                pending.append(executor.submit(validate_range, path, byte_range))
+            while pending:
+                yield pending.popleft().result()
+
+    def run(
+        self, path: str, on_chunk: Optional[Callable[[ImportResult, int], None]] = None, atomic: bool = True
+    ) -> ImportResult:
+        # 検証は並列に行い、書き込みはこのプロセスだけが行う
+        result: ImportResult = ImportResult(self.import_batch)
+        bytes_processed: int = 0
+
+        with transaction.atomic() if atomic else nullcontext():
+            for chunk in self.validate(path):
+                result.rejected.update(chunk.rejected)
+                with transaction.atomic():
+                    deltas: RollupDeltas = RollupDeltas()
+                    # モデルのインスタンスはbatch_size件ずつ作ってINSERTする
+                    for start in range(0, len(chunk), self.batch_size):
+                        sales: List[Sale] = chunk.to_sales(self.import_batch, start, start + self.batch_size)
+                        Sale.objects.bulk_create(sales)
+                        for sale in sales:
+                            deltas.add(SaleFigures.of(sale))
+                    apply_deltas(deltas)
+                result.imported += len(chunk)
+                bytes_processed += chunk.size
+                if on_chunk is not None:
+                    on_chunk(result, bytes_processed)
+
+        return result
+
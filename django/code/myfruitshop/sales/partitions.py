@@ -0,0 +1,120 @@
+from datetime import date, datetime, timezone as dt_timezone
+from typing import List, Optional
+
+from django.db.backends.base.base import BaseDatabaseWrapper
+
+from .aggregates import add_months, local_midnight
+from .rollups import JST
+
+# MySQLでは販売実績テーブルを販売日時(日本時間の月)ごとのRANGEパーティションに分ける
+SALE_TABLE: str = 'sales_sale'
+# 最後の月より後の販売日時を受ける予備のパーティション
+MAXVALUE_PARTITION: str = 'pmax'
+
+
+def is_partitionable(connection: BaseDatabaseWrapper) -> bool:
+    return connection.vendor == 'mysql'
+
+
+def partition_name(month: date) -> str:
+    return f'p{month:%Y%m}'
+
+
+def partition_month(name: str) -> Optional[date]:
+    # p202401 -> 2024-01-01(予備のパーティションはNone)
+    if name == MAXVALUE_PARTITION:
+        return None
+    return date(int(name[1:5]), int(name[5:7]), 1)
+
+
+def partition_bound(month: date) -> str:
+    # 月の終わり(翌月1日0時、日本時間)。USE_TZのMySQLは日時をUTCで保存するため、UTCの日時で区切る
+    upper: datetime = local_midnight(add_months(month, 1), JST).astimezone(dt_timezone.utc)
+    return upper.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def month_range(first: date, last: date) -> List[date]:
+    months: List[date] = []
+    month: date = first.replace(day=1)
+    while month <= last:
+        months.append(month)
+        month = add_months(month, 1)
+    return months
+
+
+def partition_definitions(months: List[date]) -> str:
+    # 最初の月のパーティションはそれより前の販売日時も受ける
+    definitions: List[str] = [
+        f"PARTITION {partition_name(month)} VALUES LESS THAN ('{partition_bound(month)}')" for month in months]
+    definitions.append(f'PARTITION {MAXVALUE_PARTITION} VALUES LESS THAN (MAXVALUE)')
+    return ', '.join(definitions)
+
+
+def sale_partitions(connection: BaseDatabaseWrapper) -> List[str]:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT PARTITION_NAME FROM information_schema.PARTITIONS '
+            'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL '
+            'ORDER BY PARTITION_ORDINAL_POSITION', [SALE_TABLE])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def sale_foreign_keys(connection: BaseDatabaseWrapper) -> List[str]:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS '
+            'WHERE CONSTRAINT_SCHEMA = DATABASE() AND TABLE_NAME = %s', [SALE_TABLE])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def partition_sale_table(connection: BaseDatabaseWrapper, first: date, last: date) -> None:
+    # パーティション化したテーブルは外部キーを持てず、主キーに販売日時を含める必要がある。
+    # 外部キーはDjangoがアプリ側で扱うため、DBの制約だけを外す
+    if not is_partitionable(connection) or sale_partitions(connection):
+        return
+    with connection.cursor() as cursor:
+        for name in sale_foreign_keys(connection):
+            cursor.execute(f'ALTER TABLE {SALE_TABLE} DROP FOREIGN KEY {name}')
+        cursor.execute(f'ALTER TABLE {SALE_TABLE} DROP PRIMARY KEY, ADD PRIMARY KEY (id, sale_date)')
+        cursor.execute(f'ALTER TABLE {SALE_TABLE} PARTITION BY RANGE COLUMNS(sale_date) '
+                       f'({partition_definitions(month_range(first, last))})')
+
+
+def unpartition_sale_table(connection: BaseDatabaseWrapper) -> None:
+    if not is_partitionable(connection) or not sale_partitions(connection):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {SALE_TABLE} REMOVE PARTITIONING')
+        cursor.execute(f'ALTER TABLE {SALE_TABLE} DROP PRIMARY KEY, ADD PRIMARY KEY (id)')
+        cursor.execute(f'ALTER TABLE {SALE_TABLE} ADD CONSTRAINT sales_sale_fruit_id_fk '
+                       f'FOREIGN KEY (fruit_id) REFERENCES sales_fruit (id)')
+
+
+def add_sale_partitions(connection: BaseDatabaseWrapper, last: date) -> List[str]:
+    # 予備のパーティションを分割してlastの月までのパーティションを作る(予備は空のため一瞬で済む)
+    months: List[date] = [month for month in map(partition_month, sale_partitions(connection)) if month]
+    if not months:
+        return []
+    missing: List[date] = month_range(add_months(months[-1], 1), last)
+    if missing:
+        with connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE {SALE_TABLE} REORGANIZE PARTITION {MAXVALUE_PARTITION} '
+                           f'INTO ({partition_definitions(missing)})')
+    return [partition_name(month) for month in missing]
+
+
+def drop_sale_partitions(connection: BaseDatabaseWrapper, before: date) -> List[str]:
+    # beforeの月より前の空になったパーティションを削除する(販売実績は保管先へ移してから)。
+    # 最後の月のパーティションは残す
+    names: List[str] = [name for name in sale_partitions(connection) if partition_month(name)]
+    dropped: List[str] = []
+    with connection.cursor() as cursor:
+        for name in names[:-1]:
+            if partition_month(name) >= before.replace(day=1):
+                break
+            cursor.execute(f'SELECT 1 FROM {SALE_TABLE} PARTITION ({name}) LIMIT 1')
+            if cursor.fetchone():
+                break
+            cursor.execute(f'ALTER TABLE {SALE_TABLE} DROP PARTITION {name}')
+            dropped.append(name)
+    return dropped
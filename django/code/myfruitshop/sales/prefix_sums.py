@@ -0,0 +1,216 @@
+import threading
+from array import array
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import DefaultDict, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from django.db import transaction
+from django.db.models import F, Q, QuerySet, Sum
+
+from .caching import sales_data_version
+from .models import SalesDailyRollup, SalesPrefixSum
+
+# (果物ID, 日付)。果物IDがNoneの系列は全果物の累計
+PrefixKey = Tuple[Optional[int], date]
+
+
+class RangeTotal(NamedTuple):
+    amount: int
+    quantity: int
+    count: int
+
+    def __add__(self, other: 'RangeTotal') -> 'RangeTotal':
+        return RangeTotal(self.amount + other.amount, self.quantity + other.quantity, self.count + other.count)
+
+    def __sub__(self, other: 'RangeTotal') -> 'RangeTotal':
+        return RangeTotal(self.amount - other.amount, self.quantity - other.quantity, self.count - other.count)
+
+
+ZERO: RangeTotal = RangeTotal(0, 0, 0)
+
+
+def series_filter(fruit_id: Optional[int]) -> Q:
+    return Q(fruit__isnull=True) if fruit_id is None else Q(fruit_id=fruit_id)
+
+
+def cumulative_at(day: Optional[date], fruit_id: Optional[int] = None) -> RangeTotal:
+    # day(日本時間)までの累計。dayがNoneなら全期間。(果物, 日付)のインデックスで1行だけ読む
+    rows: QuerySet = SalesPrefixSum.objects.filter(series_filter(fruit_id))
+    if day is not None:
+        rows = rows.filter(day__lte=day)
+    row: Optional[tuple] = rows.order_by('-day').values_list('total_amount', 'quantity', 'sale_count').first()
+    return RangeTotal(*row) if row else ZERO
+
+
+def range_total(start_day: Optional[date], end_day: Optional[date], fruit_id: Optional[int] = None) -> RangeTotal:
+    # 期間(両端を含む)の合計 = 終了日の累計 - 開始前日の累計
+    before: RangeTotal = ZERO if start_day is None else cumulative_at(start_day - timedelta(days=1), fruit_id)
+    return cumulative_at(end_day, fruit_id) - before
+
+
+def daily_figures(fruit_id: Optional[int], since: Optional[date] = None) -> QuerySet:
+    # 日次集計から系列の日ごとの値を古い順に取得する
+    rows: QuerySet = SalesDailyRollup.objects.all()
+    if fruit_id is not None:
+        rows = rows.filter(fruit_id=fruit_id)
+    if since is not None:
+        rows = rows.filter(day__gte=since)
+    return (
+        rows.values('day')
+        .annotate(amount=Sum('total_amount'), qty=Sum('quantity'), count=Sum('sale_count'))
+        .order_by('day')
+        .values_list('day', 'amount', 'qty', 'count')
+    )
+
+
+def rebuild_series(fruit_id: Optional[int], since: Optional[date] = None) -> int:
+    # since以降の累計を日次集計から作り直す
+    with transaction.atomic():
+        running: RangeTotal = ZERO if since is None else cumulative_at(since - timedelta(days=1), fruit_id)
+        stale: QuerySet = SalesPrefixSum.objects.filter(series_filter(fruit_id))
+        if since is not None:
+            stale = stale.filter(day__gte=since)
+        stale.delete()
+
+        rows: List[SalesPrefixSum] = []
+        for day, amount, quantity, count in daily_figures(fruit_id, since).iterator():
+            running += RangeTotal(amount, quantity, count)
+            rows.append(SalesPrefixSum(day=day, fruit_id=fruit_id, total_amount=running.amount,
+                                       quantity=running.quantity, sale_count=running.count))
+        SalesPrefixSum.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def rebuild_prefix_sums(since: Optional[date] = None) -> int:
+    # 日次集計または累計に行のあるすべての果物と、全果物の系列を作り直す
+    fruit_ids: Set[int] = set()
+    for model in (SalesDailyRollup, SalesPrefixSum):
+        rows: QuerySet = model.objects.filter(fruit__isnull=False)
+        if since is not None:
+            rows = rows.filter(day__gte=since)
+        fruit_ids.update(rows.values_list('fruit_id', flat=True).distinct())
+
+    with transaction.atomic():
+        return sum(rebuild_series(fruit_id, since) for fruit_id in [None, *sorted(fruit_ids)])
+
+
+def add_to_suffix(fruit_id: Optional[int], day: date, delta: RangeTotal) -> None:
+    # その日の行がなければ前日までの累計で作り、その日以降のすべての行に加算する。
+    # 最新の日付への追加(通常の登録)は、最新行の取得と作成・更新の2回で済ませる
+    rows: QuerySet = SalesPrefixSum.objects.filter(series_filter(fruit_id))
+    latest: Optional[tuple] = rows.order_by('-day').values_list(
+        'day', 'total_amount', 'quantity', 'sale_count').first()
+    if latest is None or latest[0] < day:
+        base: RangeTotal = ZERO if latest is None else RangeTotal(*latest[1:])
+        total: RangeTotal = base + delta
+        SalesPrefixSum.objects.create(day=day, fruit_id=fruit_id, total_amount=total.amount,
+                                      quantity=total.quantity, sale_count=total.count)
+        return
+
+    if not rows.filter(day=day).exists():
+        base = cumulative_at(day, fruit_id)
+        SalesPrefixSum.objects.create(day=day, fruit_id=fruit_id, total_amount=base.amount,
+                                      quantity=base.quantity, sale_count=base.count)
+    rows.filter(day__gte=day).update(
+        total_amount=F('total_amount') + delta.amount,
+        quantity=F('quantity') + delta.quantity,
+        sale_count=F('sale_count') + delta.count,
+    )
+
+
+def apply_prefix_deltas(items: Iterable[Tuple[Tuple[date, int], List[int]]]) -> None:
+    # 日次集計の増減(日次集計の更新後に呼ぶ)を累計に反映する。
+    # 系列ごとに変更日が1日だけならその日以降に加算し、複数日にまたがる場合や
+    # 件数が減る場合(日次集計の行が消えることがある)は最も古い変更日以降を作り直す
+    changes: DefaultDict[Optional[int], Dict[date, RangeTotal]] = defaultdict(dict)
+    for (day, fruit_id), (amount, quantity, count) in items:
+        if not (amount or quantity or count):
+            continue
+        for series in (fruit_id, None):
+            changes[series][day] = changes[series].get(day, ZERO) + RangeTotal(amount, quantity, count)
+
+    for fruit_id in sorted(changes, key=lambda series: -1 if series is None else series):
+        days: Dict[date, RangeTotal] = changes[fruit_id]
+        if len(days) == 1 and next(iter(days.values())).count >= 0:
+            add_to_suffix(fruit_id, *next(iter(days.items())))
+        else:
+            rebuild_series(fruit_id, min(days))
+
+
+def expected_prefix_sums() -> Dict[PrefixKey, RangeTotal]:
+    expected: Dict[PrefixKey, RangeTotal] = {}
+    fruit_ids: List[Optional[int]] = [None, *SalesDailyRollup.objects.values_list('fruit_id', flat=True)
+                                      .distinct().order_by('fruit_id')]
+    for fruit_id in fruit_ids:
+        running: RangeTotal = ZERO
+        for day, amount, quantity, count in daily_figures(fruit_id).iterator():
+            running += RangeTotal(amount, quantity, count)
+            expected[(fruit_id, day)] = running
+    return expected
+
+
+def stored_prefix_sums() -> Dict[PrefixKey, RangeTotal]:
+    return {
+        (fruit_id, day): RangeTotal(amount, quantity, count)
+        for fruit_id, day, amount, quantity, count in SalesPrefixSum.objects.values_list(
+            'fruit_id', 'day', 'total_amount', 'quantity', 'sale_count').iterator()
+    }
+
+
+class PrefixSeries:
+    # 1系列の累計を日付(通日)順の配列で保持し、二分探索で任意の日の累計を求める
+    def __init__(self, rows: Iterable[Tuple[date, int, int, int]]) -> None:
+        self.days: array = array('l')
+        self.amounts: array = array('q')
+        self.quantities: array = array('q')
+        self.counts: array = array('q')
+        for day, amount, quantity, count in rows:
+            self.days.append(day.toordinal())
+            self.amounts.append(amount)
+            self.quantities.append(quantity)
+            self.counts.append(count)
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def at(self, day: Optional[date]) -> RangeTotal:
+        index: int = len(self.days) - 1 if day is None else bisect_right(self.days, day.toordinal()) - 1
+        if index < 0:
+            return ZERO
+        return RangeTotal(self.amounts[index], self.quantities[index], self.counts[index])
+
+    def between(self, start_day: Optional[date], end_day: Optional[date]) -> RangeTotal:
+        before: RangeTotal = ZERO if start_day is None else self.at(start_day - timedelta(days=1))
+        return self.at(end_day) - before
+
+
+class PrefixSumIndex:
+    # 系列を初めて使うときに読み込んでプロセス内に保持し、販売実績の版番号が変わったら読み直す
+    def __init__(self) -> None:
+        self._lock: threading.Lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._series: Dict[Optional[int], PrefixSeries] = {}
+
+    def series(self, fruit_id: Optional[int] = None) -> PrefixSeries:
+        version: int = sales_data_version()
+        with self._lock:
+            if version != self._version:
+                self._series = {}
+                self._version = version
+            series: Optional[PrefixSeries] = self._series.get(fruit_id)
+        if series is None:
+            series = PrefixSeries(
+                SalesPrefixSum.objects.filter(series_filter(fruit_id)).order_by('day')
+                .values_list('day', 'total_amount', 'quantity', 'sale_count').iterator())
+            with self._lock:
+                if version == self._version:
+                    self._series[fruit_id] = series
+        return series
+
+    def range_total(self, start_day: Optional[date], end_day: Optional[date],
+                    fruit_id: Optional[int] = None) -> RangeTotal:
+        return self.series(fruit_id).between(start_day, end_day)
+
+
+prefix_index: PrefixSumIndex = PrefixSumIndex()
@@ -0,0 +1,88 @@
+from array import array
+from bisect import bisect_right
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from .models import Fruit, FruitPriceHistory
+
+EPOCH: datetime = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND: timedelta = timedelta(microseconds=1)
+
+
+def to_micros(moment: datetime) -> int:
+    # 日時をUNIX時間(マイクロ秒)の整数にする(浮動小数点の誤差で境界がずれないように)
+    return (moment - EPOCH) // MICROSECOND
+
+
+class PriceSchedule:
+    # 1つの果物の(適用開始日時, 単価)を開始日時の順に型付き配列で保持し、二分探索で時点の単価を求める
+    __slots__ = ('starts', 'prices')
+
+    def __init__(self, rows: Iterable[Tuple[datetime, int]] = ()) -> None:
+        self.starts: array = array('q')
+        self.prices: array = array('q')
+        for effective_from, price in rows:
+            self.append(effective_from, price)
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    def __getstate__(self) -> Tuple[array, array]:
+        # 取り込みのワーカープロセスへ渡すため
+        return self.starts, self.prices
+
+    def __setstate__(self, state: Tuple[array, array]) -> None:
+        self.starts, self.prices = state
+
+    def append(self, effective_from: datetime, price: int) -> None:
+        self.starts.append(to_micros(effective_from))
+        self.prices.append(price)
+
+    def at(self, moment: datetime) -> int:
+        # 最初の適用開始より前の時点は最初の単価とみなす
+        if len(self.prices) == 1:
+            return self.prices[0]
+        index: int = bisect_right(self.starts, to_micros(moment)) - 1
+        return self.prices[max(index, 0)]
+
+
+# 果物ID -> 単価の履歴
+PriceTable = Dict[int, PriceSchedule]
+
+
+def load_price_table() -> PriceTable:
+    # すべての果物(削除済みを含む)の単価の履歴を1回のクエリで読み込む
+    table: PriceTable = {}
+    rows: QuerySet = FruitPriceHistory.objects.order_by('fruit_id', 'effective_from').values_list(
+        'fruit_id', 'effective_from', 'price')
+    for fruit_id, effective_from, price in rows.iterator():
+        schedule: Optional[PriceSchedule] = table.get(fruit_id)
+        if schedule is None:
+            schedule = table[fruit_id] = PriceSchedule()
+        schedule.append(effective_from, price)
+    return table
+
+
+def price_at(table: PriceTable, fruit_id: int, moment: Optional[datetime], default: int) -> int:
+    # 履歴のない果物(一括登録など)や日時が不明な場合はdefault(現在の単価)を使う
+    schedule: Optional[PriceSchedule] = table.get(fruit_id)
+    if schedule is None or moment is None:
+        return default
+    return schedule.at(moment)
+
+
+def record_price_change(sender: Any, instance: Fruit, created: bool = False, raw: bool = False, **kwargs: Any) -> None:
+    # 果物の単価が変わったら履歴に1行追加する(新規登録は登録日時から適用)
+    if raw:
+        return
+    if not created:
+        latest: Optional[int] = FruitPriceHistory.objects.filter(fruit=instance).order_by(
+            '-effective_from').values_list('price', flat=True).first()
+        if latest == instance.price:
+            return
+    effective_from: datetime = instance.created_at if created and instance.created_at else timezone.now()
+    FruitPriceHistory.objects.update_or_create(
+        fruit=instance, effective_from=effective_from, defaults={'price': instance.price})
@@ -0,0 +1,174 @@
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import DefaultDict, Dict, List, NamedTuple, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from django.db import transaction
+from django.db.models import Count, F, Q, QuerySet, Sum
+from django.db.models.functions import TruncDate
+
+from .caching import bump_sales_version
+from .grand_total import add_to_grand_total, rebuild_grand_total
+from .models import Sale, SaleArchive, SalesDailyRollup
+from .prefix_sums import RangeTotal, apply_prefix_deltas, rebuild_prefix_sums
+
+# 集計は日本時間で行う
+JST: ZoneInfo = ZoneInfo('Asia/Tokyo')
+
+RollupKey = Tuple[date, int]
+
+
+def jst_day(value: datetime) -> date:
+    return value.astimezone(JST).date()
+
+
+class SaleFigures(NamedTuple):
+    # 集計に必要な値だけを保持するSaleのスナップショット
+    sale_date: datetime
+    fruit_id: int
+    total_amount: int
+    quantity: int
+    is_active: bool
+
+    @classmethod
+    def of(cls, sale: Sale) -> 'SaleFigures':
+        return cls(sale.sale_date, sale.fruit_id, int(sale.total_amount), int(sale.quantity), sale.is_active)
+
+
+class RollupDeltas:
+    # (日付, 果物)ごとの金額・個数・件数の増減をまとめて保持する
+    def __init__(self) -> None:
+        self.items: DefaultDict[RollupKey, List[int]] = defaultdict(lambda: [0, 0, 0])
+
+    def add(self, figures: SaleFigures, sign: int = 1) -> None:
+        if not figures.is_active:
+            return
+        delta: List[int] = self.items[(jst_day(figures.sale_date), figures.fruit_id)]
+        delta[0] += sign * figures.total_amount
+        delta[1] += sign * figures.quantity
+        delta[2] += sign
+
+    def __bool__(self) -> bool:
+        return any(any(delta) for delta in self.items.values())
+
+    def total(self) -> RangeTotal:
+        return RangeTotal(*(sum(delta[i] for delta in self.items.values()) for i in range(3)))
+
+
+def apply_deltas(deltas: RollupDeltas) -> None:
+    # 呼び出し元のトランザクション内でF式による加算を行う
+    # (呼び出し元がトランザクション中ならセーブポイントは作らない)
+    emptied: List[Q] = []
+    with transaction.atomic(savepoint=False):
+        # 最初に全体の累計の1行に加算してコミットまでロックし、同時に書き込まれた販売実績の
+        # 日次集計・累計の更新を1件ずつ順に行う(MySQLでは全果物の累計に一意制約を作れないため)
+        add_to_grand_total(deltas.total())
+
+        # 件数が増える行は先に0で作っておき(既にある行は何もしない)、すべての行をF式で加算する。
+        # 同じ(日付, 果物)の最初の販売が同時に登録されても、一意制約で1行だけ作られ両方の加算が残る
+        SalesDailyRollup.objects.bulk_create(
+            [SalesDailyRollup(day=day, fruit_id=fruit_id)
+             for (day, fruit_id), (_, _, count) in sorted(deltas.items.items()) if count > 0],
+            ignore_conflicts=True,
+        )
+        for (day, fruit_id), (amount, quantity, count) in sorted(deltas.items.items()):
+            if not (amount or quantity or count):
+                continue
+            SalesDailyRollup.objects.filter(day=day, fruit_id=fruit_id).update(
+                total_amount=F('total_amount') + amount,
+                quantity=F('quantity') + quantity,
+                sale_count=F('sale_count') + count,
+            )
+            if count < 0:
+                emptied.append(Q(day=day, fruit_id=fruit_id))
+
+        # 件数が0になった行は削除する
+        if emptied:
+            condition: Q = emptied[0]
+            for q in emptied[1:]:
+                condition |= q
+            SalesDailyRollup.objects.filter(condition, sale_count__lte=0).delete()
+
+        # 累計(期間合計用)も同じトランザクションで更新する
+        apply_prefix_deltas(deltas.items.items())
+
+        # コミット後に集計キャッシュの版を進める
+        transaction.on_commit(bump_sales_version)
+
+
+def record_sale_change(before: Optional[SaleFigures], after: Optional[SaleFigures]) -> None:
+    # 登録(before=None)・編集・論理削除の差分を集計テーブルに反映する
+    deltas: RollupDeltas = RollupDeltas()
+    if before is not None:
+        deltas.add(before, sign=-1)
+    if after is not None:
+        deltas.add(after)
+    if deltas:
+        apply_deltas(deltas)
+
+
+def day_bounds(start_day: Optional[date], end_day: Optional[date]) -> Q:
+    # 日本時間の日付範囲をsale_dateの範囲条件に変換する(インデックスを使えるように)
+    condition: Q = Q()
+    if start_day is not None:
+        condition &= Q(sale_date__gte=datetime.combine(start_day, time.min, tzinfo=JST))
+    if end_day is not None:
+        condition &= Q(sale_date__lt=datetime.combine(end_day + timedelta(days=1), time.min, tzinfo=JST))
+    return condition
+
+
+def compute_rollup(start_day: Optional[date] = None, end_day: Optional[date] = None) -> Dict[RollupKey, Tuple[int, int, int]]:
+    # Saleテーブルと保管済みの販売実績(SaleArchive)から(日付, 果物)ごとの集計値をGROUP BYで求める
+    totals: DefaultDict[RollupKey, List[int]] = defaultdict(lambda: [0, 0, 0])
+    for model in (Sale, SaleArchive):
+        rows: QuerySet = (
+            model.objects.filter(day_bounds(start_day, end_day), is_active=True)
+            .annotate(day=TruncDate('sale_date', tzinfo=JST))
+            .values('day', 'fruit_id')
+            .annotate(amount=Sum('total_amount'), qty=Sum('quantity'), count=Count('id'))
+            .order_by()
+        )
+        for row in rows.iterator():
+            figures: List[int] = totals[(row['day'], row['fruit_id'])]
+            figures[0] += row['amount']
+            figures[1] += row['qty']
+            figures[2] += row['count']
+    return {key: tuple(figures) for key, figures in totals.items()}
+
+
+def stored_rollup(start_day: Optional[date] = None, end_day: Optional[date] = None) -> Dict[RollupKey, Tuple[int, int, int]]:
+    rollups: QuerySet = SalesDailyRollup.objects.all()
+    if start_day is not None:
+        rollups = rollups.filter(day__gte=start_day)
+    if end_day is not None:
+        rollups = rollups.filter(day__lte=end_day)
+    return {
+        (day, fruit_id): (amount, quantity, count)
+        for day, fruit_id, amount, quantity, count in rollups.values_list(
+            'day', 'fruit_id', 'total_amount', 'quantity', 'sale_count').iterator()
+    }
+
+
+def rebuild_rollup(start_day: Optional[date] = None, end_day: Optional[date] = None) -> int:
+    # Saleテーブル(保管済みを含む)から指定期間(日本時間の日付)の集計を作り直す
+    with transaction.atomic():
+        # 全体の累計は期間によらず販売実績テーブルから数え直す(行をロックし、作り直す間の書き込みを待たせる)
+        rebuild_grand_total()
+        rollups: QuerySet = SalesDailyRollup.objects.all()
+        if start_day is not None:
+            rollups = rollups.filter(day__gte=start_day)
+        if end_day is not None:
+            rollups = rollups.filter(day__lte=end_day)
+        rollups.delete()
+
+        created: List[SalesDailyRollup] = SalesDailyRollup.objects.bulk_create(
+            [
+                SalesDailyRollup(day=day, fruit_id=fruit_id, total_amount=amount, quantity=quantity, sale_count=count)
+                for (day, fruit_id), (amount, quantity, count) in compute_rollup(start_day, end_day).items()
+            ],
+            batch_size=1000,
+        )
+        # 再構築した期間より後の累計も変わるため、開始日以降の累計を作り直す
+        rebuild_prefix_sums(start_day)
+        transaction.on_commit(bump_sales_version)
+    return len(created)
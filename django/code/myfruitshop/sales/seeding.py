@@ -0,0 +1,64 @@
+import random
+from datetime import date, datetime, time, timedelta
+from typing import Iterator, List, Tuple
+
+from django.db import transaction
+
+from .catalog import bump_catalog_version, fruit_catalog
+from .models import Fruit, Sale
+from .rollups import JST, rebuild_rollup
+
+SEED_FRUIT_PREFIX: str = 'seed-fruit-'
+
+
+def seed_fruits(count: int, seed: int = 0) -> List[Fruit]:
+    # 名前で照合するため、何度実行しても同じ果物・同じ単価になる
+    rng: random.Random = random.Random(seed)
+    wanted: List[Tuple[str, int]] = [
+        (f'{SEED_FRUIT_PREFIX}{index:04d}', rng.randint(5, 50) * 10) for index in range(count)]
+    existing: dict = {fruit.name: fruit for fruit in Fruit.objects.filter(name__startswith=SEED_FRUIT_PREFIX)}
+    Fruit.objects.bulk_create([
+        Fruit(name=name, price=price) for name, price in wanted if name not in existing])
+
+    # bulk_createはシグナルを送らないため、果物カタログには明示的に知らせる
+    fruit_catalog.invalidate()
+    bump_catalog_version()
+    names: List[str] = [name for name, _ in wanted]
+    return sorted(Fruit.objects.filter(name__in=names), key=lambda fruit: fruit.name)
+
+
+def generate_sales(fruits: List[Fruit], count: int, start: date, end: date,
+                   seed: int = 0, inactive_ratio: float = 0.0) -> Iterator[Sale]:
+    # 日本時間の start 〜 end(両端を含む)に一様に散らばった販売実績を決まった順に生成する
+    rng: random.Random = random.Random(seed)
+    first: datetime = datetime.combine(start, time.min, tzinfo=JST)
+    span: int = int((datetime.combine(end + timedelta(days=1), time.min, tzinfo=JST) - first).total_seconds())
+    for _ in range(count):
+        fruit: Fruit = rng.choice(fruits)
+        quantity: int = rng.randint(1, 20)
+        yield Sale(
+            fruit=fruit,
+            quantity=quantity,
+            total_amount=quantity * fruit.price,
+            sale_date=first + timedelta(seconds=rng.randrange(span)),
+            is_active=rng.random() >= inactive_ratio,
+        )
+
+
+def seed_sales(fruit_count: int, sale_count: int, start: date, end: date, seed: int = 0,
+               inactive_ratio: float = 0.0, batch_size: int = 5000) -> int:
+    fruits: List[Fruit] = seed_fruits(fruit_count, seed)
+    created: int = 0
+    batch: List[Sale] = []
+    with transaction.atomic():
+        for sale in generate_sales(fruits, sale_count, start, end, seed, inactive_ratio):
+            batch.append(sale)
+            if len(batch) >= batch_size:
+                created += len(Sale.objects.bulk_create(batch))
+                batch = []
+        if batch:
+            created += len(Sale.objects.bulk_create(batch))
+
+        # 一括登録は集計の差分更新を通らないため、対象期間の日次集計を作り直す
+        rebuild_rollup(start, end)
+    return created
@@ -6,10 +6,21 @@ from .views import (
     DeleteFruitView,
     AddFruitView,
     SaleCombinedView,
+    AsyncSaleListView,
+    SaleExportView,
+    AsyncSaleExportView,
+    ImportJobCreateView,
+    ImportJobStatusView,
     AddSaleView,
     EditSaleView,
     DeleteSaleView,
+    SaleBulkUpdateView,
     SalesAggregateView,
+    AsyncSalesAggregateView,
+    SalesAggregateApiView,
+    SalesLeaderboardApiView,
+    SalesRangeTotalView,
+    CacheStatsView,
 )
 
 
@@ -22,8 +33,19 @@ urlpatterns = [
     path('fruit/add_fruit/', AddFruitView.as_view(), name='add_fruit'),
     path('fruit/<int:pk>/delete/', DeleteFruitView.as_view(), name='delete_fruit'),
     path('sales_combined/', SaleCombinedView.as_view(), name='sales_combined'),
+    path('sales_combined/async/', AsyncSaleListView.as_view(), name='sales_combined_async'),
+    path('sales_export/', SaleExportView.as_view(), name='sales_export'),
+    path('sales_export/async/', AsyncSaleExportView.as_view(), name='sales_export_async'),
+    path('import_jobs/', ImportJobCreateView.as_view(), name='import_jobs'),
+    path('import_jobs/<int:pk>/', ImportJobStatusView.as_view(), name='import_job_status'),
     path('add_sales/', AddSaleView.as_view(), name='add_sales'),
     path('edit_sales/<int:pk>/', EditSaleView.as_view(), name='edit_sales'),
     path('delete_sale/<int:pk>/', DeleteSaleView.as_view(), name='delete_sale'),
+    path('sales_bulk/', SaleBulkUpdateView.as_view(), name='sales_bulk'),
     path('sales_aggregate/', SalesAggregateView.as_view(), name='sales_aggregate'),
+    path('sales_aggregate/async/', AsyncSalesAggregateView.as_view(), name='sales_aggregate_async'),
+    path('sales_aggregate/api/', SalesAggregateApiView.as_view(), name='sales_aggregate_api'),
+    path('sales_aggregate/range/', SalesRangeTotalView.as_view(), name='sales_range_total'),
+    path('sales_aggregate/leaderboard/', SalesLeaderboardApiView.as_view(), name='sales_leaderboard_api'),
+    path('cache_stats/', CacheStatsView.as_view(), name='cache_stats'),
 ]
@@ -1,25 +1,63 @@
 from decimal import Decimal
-from datetime import datetime, timedelta, timezone as dt_timezone
-from typing import List, Tuple, Dict, Any, Union
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone, tzinfo
+from typing import List, Tuple, Dict, Any, Union, Optional
 from collections import defaultdict
+from functools import partial
+import asyncio
 import csv
 import logging
 from io import TextIOWrapper
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.files.uploadedfile import UploadedFile
+from django.http import HttpRequest, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
 from django.shortcuts import get_object_or_404, render, redirect
 from django.core.paginator import Paginator
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.views.generic import ListView, UpdateView, DeleteView, View
-from django.db import models
-
-from .models import Fruit, Sale
-from .forms import SaleCombinedForm, SaleAddForm, FruitForm, BulkSaleForm, SaleEditForm
+from django.db import models, transaction
+
+from .models import Fruit, ImportJob, Sale, SalesDailyRollup
+from .forms import (
+    SaleCombinedForm, SaleAddForm, FruitForm, BulkSaleForm, SaleBulkForm, SaleEditForm, SaleExportForm,
+    SalesAggregateForm, SalesLeaderboardForm, SalesRangeForm,
+)
+from .aggregates import SalesAggregate, TooManyBuckets, add_months, is_jst, local_midnight
+from .archive import with_archive
+from .bulk import BulkResult, SaleBulkUpdater, select_sales
+from .caching import acached_by_version, cache_stats, cached_by_version, sales_data_version
+from .catalog import CatalogFruit, catalog_version, fruit_catalog
+from .columnar import GroupTotals, SalesColumns, aload_rollups, calendar_edges, load_rollups, local_day_rows, rollup_rows
+from .exporter import aexport_sales_csv, export_sales_csv
+from .grand_total import agrand_total, grand_total
+from .importer import ImportResult, SaleCsvImporter
+from .jobs import enqueue_import
+from .leaderboard import (
+    LEADERBOARD_WINDOWS, Leaderboard, aleaderboard, leaderboard, leaderboard_key, window_bounds,
+)
+from .pagination import CachedCountPaginator, KeysetPaginator, aapproximate_sale_count
+from .prefix_sums import RangeTotal, prefix_index
+from .rollups import JST, SaleFigures, day_bounds, jst_day, record_sale_change
 
 
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
+
+
+class AsyncLoginRequiredMixin(LoginRequiredMixin):
+    # 非同期ビュー用のLoginRequiredMixin。request.userの読み込み(セッションとユーザーの取得)は
+    # 同期のORMを使うため、先にスレッドで済ませてから通常のログイン確認を行う
+    async def dispatch(self, request: HttpRequest, *args, **kwargs) -> HttpResponse:
+        await sync_to_async(lambda: request.user.is_authenticated)()
+        response: Any = super().dispatch(request, *args, **kwargs)
+        if asyncio.iscoroutine(response):
+            response = await response
+        return response
 
 
 class FruitListView(LoginRequiredMixin, ListView):
@@ -55,11 +93,11 @@ class EditFruitView(LoginRequiredMixin, UpdateView):
     http_method_names: List[str] = ['get', 'post', ]
 
     def get_object(self, queryset=None) -> models.Model:
-        logger.info('This is an info message in get_object method.')
+        logger.debug('This is a debug message in get_object method.')
         return super().get_object(queryset)
 
     def form_valid(self, form) -> super:
-        logger.info('This is an info message in form_valid method.')
+        logger.debug('This is a debug message in form_valid method.')
         # フォームのバリデーションが成功した場合の処理
         return super().form_valid(form)
 
@@ -103,62 +141,150 @@ class AddFruitView(LoginRequiredMixin, View):
 class SaleCombinedView(LoginRequiredMixin, View):
     template_name: str = 'sales_list_combined.html'
     paginate_by: int = 10  # ページあたりのアイテム数
-
-    def get(self, request) -> render:
-        sales: models.Model = Sale.objects.select_related('fruit').filter(
-            is_active=True).order_by('-sale_date')
-
-        paginator: Paginator = Paginator(sales, self.paginate_by)
-        page: int = request.GET.get('page')
-        sales: models.Model = paginator.get_page(page)
-
+    import_result: Optional[ImportResult] = None  # CSV取り込み結果
+    import_job: Optional[ImportJob] = None  # バックグラウンド取り込みジョブ
+
+    def sales_queryset(self) -> models.QuerySet:
+        return Sale.objects.select_related('fruit').filter(is_active=True).order_by('-sale_date', '-id')
+
+    def sales_page(self, request) -> Any:
+        sales: models.QuerySet = self.sales_queryset()
+
+        page: Optional[str] = request.GET.get('page')
+        if page is not None:
+            # 従来のページ番号方式(件数はキャッシュした概算値を使う)
+            paginator: Paginator = CachedCountPaginator(sales, self.paginate_by)
+            return paginator.get_page(page)
+        # カーソル方式(販売日時とIDによる範囲読み込み)
+        return KeysetPaginator(sales, self.paginate_by).get_page(request.GET.get('cursor'))
+
+    def table_key(self, request) -> str:
+        # 一覧の表とページ送りのHTMLは(販売実績の版, 果物カタログの版, ページ位置)ごとにキャッシュする。
+        # 登録・編集・削除・取り込みで販売実績の版が、果物名の変更でカタログの版が進むため古い表は使われない
+        page: Optional[str] = request.GET.get('page')
+        position: str = f'page={page}' if page is not None else f"cursor={request.GET.get('cursor') or ''}"
+        return f'{sales_data_version()}:{catalog_version()}:{position}'
+
+    def page_context(self, sales: Any, table_key: str) -> Dict[str, Any]:
         form_sale: models.Model = SaleCombinedForm()
         form_bulk_sale: models.Model = BulkSaleForm()
 
-        return render(request, self.template_name, {'sales': sales, 'form_sale': form_sale, 'form_bulk_sale': form_bulk_sale})
+        return {
+            'sales': sales,
+            'sales_table_key': table_key,
+            'sales_table_timeout': settings.SALES_LIST_FRAGMENT_TIMEOUT,
+            'form_sale': form_sale,
+            'form_bulk_sale': form_bulk_sale,
+            'import_result': self.import_result,
+            'import_job': self.import_job,
+        }
+
+    def get(self, request, *args, **kwargs) -> render:
+        # 一覧はテンプレートの断片キャッシュがない場合にだけ読み込む
+        sales: SimpleLazyObject = SimpleLazyObject(lambda: self.sales_page(request))
+        return render(request, self.template_name, self.page_context(sales, self.table_key(request)))
 
     def post(self, request, *args, **kwargs) -> render:
         form_bulk_sale: models.Model = BulkSaleForm(
             request.POST, request.FILES)
 
         if form_bulk_sale.is_valid():
-            csv_file: TextIOWrapper = TextIOWrapper(
-                request.FILES['csv_file'].file, encoding='utf-8')
-            reader: csv.reader = csv.reader(csv_file)
-            for row in reader:
-                if len(row) != 4:
-                    # 期待される数の値が含まれていない場合の処理
-                    continue
-
-                fruit_name, quantity, total_amount, sale_date = row
-
-                try:
-                    fruit: models.Model = Fruit.objects.filter(name=fruit_name, is_active=True).get()
-                except Fruit.DoesNotExist:
-                    continue
-
-                current_price: int = fruit.price
-                expected_total_amount: int = int(quantity) * current_price
-
-                try:
-                    # 日付の形式が正しくない場合はValidationErrorが発生
-                    datetime.strptime(sale_date, "%Y-%m-%d %H:%M")
-                except ValueError:
-                    continue
-
-                if int(total_amount) != expected_total_amount:
-                    continue
-
-                Sale.objects.create(
-                    fruit=fruit,
-                    quantity=int(quantity),
-                    total_amount=int(total_amount),
-                    sale_date=sale_date
-                )
+            uploaded_file: UploadedFile = request.FILES['csv_file']
+            if uploaded_file.size > settings.SALES_IMPORT_ASYNC_THRESHOLD:
+                # 大きなファイルはワーカーに任せてすぐに応答を返す
+                self.import_job = enqueue_import(uploaded_file, request.user)
+            else:
+                csv_file: TextIOWrapper = TextIOWrapper(uploaded_file.file, encoding='utf-8')
+                reader: csv.reader = csv.reader(csv_file)
+                self.import_result = SaleCsvImporter().run(reader)
 
         return self.get(request, *args, **kwargs)
 
 
+class AsyncSaleListView(AsyncLoginRequiredMixin, SaleCombinedView):
+    # 販売情報一覧(GETのみ)の非同期版。CSVの取り込みは同期版のSaleCombinedViewで行う
+    http_method_names: List[str] = ['get', ]
+
+    def numbered_page(self, sales: models.QuerySet, page: str) -> Any:
+        # Paginatorは同期のAPIしかないため、テンプレートが参照する値をここで読み込んでおく
+        sales_page: Any = CachedCountPaginator(sales, self.paginate_by).get_page(page)
+        sales_page.object_list = list(sales_page.object_list)
+        return sales_page
+
+    async def get(self, request, *args, **kwargs) -> HttpResponse:
+        table_key: str = await sync_to_async(self.table_key)(request)
+        page: Optional[str] = request.GET.get('page')
+        sales_page: Any
+        if await cache.aget(make_template_fragment_key('sales_table', [table_key])) is not None:
+            # 断片がキャッシュにあれば一覧は読まない(描画までに期限が切れた場合はスレッドで読み込む)
+            sales_page = SimpleLazyObject(lambda: self.sales_page(request))
+        elif page is not None:
+            sales_page = await sync_to_async(self.numbered_page)(self.sales_queryset(), page)
+        else:
+            sales_page = await KeysetPaginator(self.sales_queryset(), self.paginate_by).aget_page(
+                request.GET.get('cursor'))
+            sales_page.count = await aapproximate_sale_count()
+
+        # 描画はスレッドで行い、読み込みが必要になった場合も同期のORMを使えるようにする
+        return await sync_to_async(render)(request, self.template_name, self.page_context(sales_page, table_key))
+
+
+class ImportJobCreateView(LoginRequiredMixin, View):
+    http_method_names: List[str] = ['post', ]
+
+    def post(self, request, *args, **kwargs) -> JsonResponse:
+        form_bulk_sale: models.Model = BulkSaleForm(request.POST, request.FILES)
+        if not form_bulk_sale.is_valid():
+            return JsonResponse({'errors': form_bulk_sale.errors}, status=400)
+
+        job: ImportJob = enqueue_import(request.FILES['csv_file'], request.user)
+        return JsonResponse({
+            'id': job.pk,
+            'status': job.status,
+            'status_url': reverse('import_job_status', kwargs={'pk': job.pk}),
+        }, status=202)
+
+
+class ImportJobStatusView(LoginRequiredMixin, View):
+    def get(self, request, pk) -> JsonResponse:
+        job: ImportJob = get_object_or_404(ImportJob, pk=pk)
+        return JsonResponse(job.as_status())
+
+
+class SaleExportView(LoginRequiredMixin, View):
+    def export_queryset(self, form: SaleExportForm) -> models.QuerySet:
+        sales: models.QuerySet = Sale.objects.filter(
+            day_bounds(form.cleaned_data['start'], form.cleaned_data['end']))
+        if form.cleaned_data['fruit']:
+            sales = sales.filter(fruit__name=form.cleaned_data['fruit'])
+        active: str = form.cleaned_data['active'] or 'active'
+        if active != 'all':
+            sales = sales.filter(is_active=active == 'active')
+        return sales
+
+    def csv_response(self, content: Any) -> StreamingHttpResponse:
+        response: StreamingHttpResponse = StreamingHttpResponse(content, content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = 'attachment; filename="sales.csv"'
+        return response
+
+    def get(self, request, *args, **kwargs) -> Union[StreamingHttpResponse, JsonResponse]:
+        form: SaleExportForm = SaleExportForm(request.GET)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+
+        return self.csv_response(export_sales_csv(self.export_queryset(form)))
+
+
+class AsyncSaleExportView(AsyncLoginRequiredMixin, SaleExportView):
+    # CSVエクスポートの非同期版。ASGIではイベントループ上でチャンクごとに読み込みながら送信する
+    async def get(self, request, *args, **kwargs) -> Union[StreamingHttpResponse, JsonResponse]:
+        form: SaleExportForm = SaleExportForm(request.GET)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+
+        return self.csv_response(aexport_sales_csv(self.export_queryset(form)))
+
+
 class AddSaleView(LoginRequiredMixin, View):
     template_name: str = 'add_sales.html'
 
@@ -171,25 +297,25 @@ class AddSaleView(LoginRequiredMixin, View):
 
         if form_sale.is_valid():
             sale: models.Model = form_sale.save(commit=False)
-            fruit_name: str = form_sale.cleaned_data.get('fruit')
             quantity: int = form_sale.cleaned_data.get('quantity')
 
-            # Fruitが存在するか確認
-            try:
-                fruit: models.Model = Fruit.objects.get(name=fruit_name)
-            except Fruit.DoesNotExist:
+            # Fruitが存在するか確認(果物カタログから解決し、DBには問い合わせない)
+            fruit: Optional[CatalogFruit] = fruit_catalog.get(sale.fruit_id)
+            if fruit is None:
                 form_sale.add_error('fruit', '選択した果物は存在しません。')
                 return render(request, self.template_name, {'form': form_sale})
 
-            # SaleCombinedViewでのバリデーション
-            current_price: int = fruit.price
-            total_amount: Decimal = quantity * current_price
+            # SaleCombinedViewでのバリデーション(販売日時点の単価を使う)
+            sale_price: int = fruit_catalog.price_at(fruit.id, sale.sale_date, fruit.price)
+            total_amount: Decimal = quantity * sale_price
 
             # 計算結果をsaleオブジェクトのtotal_amountフィールドに代入
             sale.total_amount = Decimal(total_amount)
 
-            sale.save()
-            logger.info('This is an info message in get_object AddSaleView.')
+            with transaction.atomic():
+                sale.save()
+                record_sale_change(None, SaleFigures.of(sale))
+            logger.debug('This is a debug message in get_object AddSaleView.')
             return redirect('sales_combined')  # 保存後、販売情報管理画面にリダイレクト
 
         return render(request, self.template_name, {'form': form_sale})
@@ -203,27 +329,26 @@ class EditSaleView(LoginRequiredMixin, View):
         form: models.Model = SaleEditForm(instance=sale)
         return render(request, self.template_name, {'form': form, 'sale_id': pk})
 
+    @transaction.atomic
     def post(self, request, pk) -> render:
-        sale: models.Model = get_object_or_404(Sale, pk=pk)
+        sale: models.Model = get_object_or_404(Sale.objects.select_for_update(), pk=pk)
+        # 編集前の値を日次集計の差分計算のために保持しておく
+        before: SaleFigures = SaleFigures.of(sale)
         form: models.Model = SaleEditForm(request.POST, instance=sale)
 
         if form.is_valid():
             sale: models.Model = form.save(commit=False)
-            fruit_name: str = form.cleaned_data.get('fruit')
             quantity: int = form.cleaned_data.get('quantity')
-            try:
-                fruit: models.Model = Fruit.objects.get(
-                    name__iexact=fruit_name)
-            except Fruit.DoesNotExist:
-                form.add_error('fruit', '選択した果物は存在しません。')
-                return render(request, self.template_name, {'form': form})
+            # 削除済みの果物のままの編集も許可するため、フォームで解決した果物の販売日時点の単価を使う
+            fruit: Fruit = form.cleaned_data.get('fruit')
 
-            current_price: int = fruit.price
-            total_amount: Decimal = quantity * current_price
+            sale_price: int = fruit_catalog.price_at(fruit.pk, sale.sale_date, fruit.price)
+            total_amount: Decimal = quantity * sale_price
 
             # 計算結果をsaleオブジェクトのtotal_amountフィールドに代入
             sale.total_amount = Decimal(total_amount)
             form.save()
+            record_sale_change(before, SaleFigures.of(sale))
             return redirect('sales_combined')
 
         return render(request, self.template_name, {'form': form, 'sale_id': pk})
@@ -234,100 +359,122 @@ class DeleteSaleView(LoginRequiredMixin, DeleteView):
     success_url: str = reverse_lazy('sales_combined')
     template_name: str = 'sale_confirm_delete.html'
 
+    @transaction.atomic
     def delete(self, request, *args, **kwargs) -> Any:
-        self.object: models.Model = self.get_object()
+        self.object: models.Model = self.get_object(self.get_queryset().select_for_update())
         success_url: str = self.get_success_url()
+        before: SaleFigures = SaleFigures.of(self.object)
         self.object.is_active = False
         self.object.save()
+        record_sale_change(before, SaleFigures.of(self.object))
 
         return redirect(success_url)
 
     def get(self, request, *args, **kwargs) -> Any:
         return self.delete(request, *args, **kwargs)
 
+    def post(self, request, *args, **kwargs) -> Any:
+        # DeleteViewのPOSTは物理削除(form_valid)になるため、GETと同じ論理削除にする
+        return self.delete(request, *args, **kwargs)
+
+
+class SaleBulkUpdateView(LoginRequiredMixin, View):
+    # 条件に合う販売実績をまとめて論理削除・復元・訂正し、件数をJSONで返す
+    http_method_names: List[str] = ['post', ]
+
+    def post(self, request, *args, **kwargs) -> JsonResponse:
+        form: SaleBulkForm = SaleBulkForm(request.POST)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+
+        params: Dict[str, Any] = form.cleaned_data
+        sales: models.QuerySet = select_sales(
+            params['ids'], params['start'], params['end'], params['fruit'], params['import_batch'])
+        result: BulkResult = SaleBulkUpdater(sales).run(params['action'], params['new_fruit'], params['quantity'])
+        return JsonResponse(result._asdict())
+
 
 class SalesAggregateView(LoginRequiredMixin, View):
     template_name: str = 'sales_aggregate.html'
 
     def __init__(self, *args, **kwargs):
-
-        # 現在時刻を取得
-        current_time = datetime.now(timezone.utc)
-        # 日本時間に変換
-        current_time_jp = current_time.astimezone(
-            dt_timezone(timedelta(hours=9)))
-        self.end_of_day = current_time_jp.replace(second=59, minute=59, hour=23)
-        # 月次集計の開始日（当日を含めた3ヶ月）
-        start_year = current_time_jp.year - 1 if (current_time_jp.month - 2) <= 0 else current_time_jp.year
-        self.start_date_monthly = datetime(
-            start_year, (current_time_jp.month - 2) % 12, 1, 0, 0, 0, tzinfo=dt_timezone(timedelta(hours=9)))
-        # 日次集計の開始日（当日を含めた3日）
-        # 日数の補正
-        adjusted_day = current_time_jp.day - 2
-        adjusted_month = current_time_jp.month
-        adjusted_year = current_time_jp.year
-
-        while adjusted_day < 1:
-            # 日が1未満の場合は前月の末日を取得し、補正する
-            current_time_jp = (current_time_jp.replace(day=1) - timedelta(days=1)).replace(day=1)
-            adjusted_day += current_time_jp.day
-            adjusted_month = current_time_jp.month
-
-            # 年がまたがる場合の補正
-            if adjusted_month == 12:
-                adjusted_year -= 1
-
-        self.start_date_daily = datetime(
-            adjusted_year, adjusted_month, adjusted_day, 0, 0, 0, tzinfo=dt_timezone(timedelta(hours=9)))
+        super().__init__(*args, **kwargs)
+        # 既定は日本時間。?tz= で店舗のタイムゾーンを指定できる
+        self.set_time_zone(JST)
+        # 売れ筋の指定期間(開始日, 終了日)
+        self.custom_window: Optional[Tuple[Optional[date], Optional[date]]] = None
+
+    def set_time_zone(self, tz: tzinfo) -> None:
+        self.tz: tzinfo = tz
+        # 集計するタイムゾーンでの今日
+        today: date = datetime.now(dt_timezone.utc).astimezone(tz).date()
+        self.end_of_day: datetime = datetime.combine(today, time(23, 59, 59), tzinfo=tz)
+        # 集計期間の終わり(翌日の0時)。夏時間の切り替わる日も現地の0時になる
+        self.period_end: datetime = local_midnight(today + timedelta(days=1), tz)
+        # 月次集計の開始日（当月を含めた3ヶ月）。年をまたぐ場合も月の足し引きで求める
+        self.start_date_monthly: datetime = local_midnight(add_months(today, -2), tz)
+        # 日次集計の開始日（当日を含めた3日）。月・年をまたぐ場合も日付の引き算で求める
+        self.start_date_daily: datetime = local_midnight(today - timedelta(days=2), tz)
+
+    def read_params(self, request: HttpRequest) -> Optional[HttpResponse]:
+        # ?tz= と売れ筋の指定期間(?from=&to=)を読む。不正な場合は400を返す
+        form: SalesLeaderboardForm = SalesLeaderboardForm({
+            'tz': request.GET.get('tz'),
+            'start': request.GET.get('from'),
+            'end': request.GET.get('to'),
+        })
+        if not form.is_valid():
+            return HttpResponseBadRequest(' '.join(str(error) for errors in form.errors.values() for error in errors))
+        self.set_time_zone(form.cleaned_data['tz'])
+        start: Optional[date] = form.cleaned_data['start']
+        end: Optional[date] = form.cleaned_data['end']
+        self.custom_window = (start, end) if start is not None or end is not None else None
+        return None
+
+    def aggregate_sales(self, start_date: datetime, is_monthly: bool = True) -> models.QuerySet:
+        # 集計期間の(日付 x 果物)の行。月/日単位の集計はformat_dataで列の配列に対して行う
+        if is_jst(self.tz):
+            # 日本時間は日次集計をそのまま使う
+            return rollup_rows(SalesDailyRollup.objects.filter(
+                day__gte=jst_day(start_date),
+                day__lte=jst_day(self.end_of_day),
+            ))
+        # それ以外のタイムゾーンは販売実績(保管済みを含む)をDBで現地の日付ごとに集計する
+        return with_archive(lambda sales: local_day_rows(sales.filter(
+            is_active=True, sale_date__gte=start_date, sale_date__lt=self.period_end), self.tz))
 
     def format_data(
-        self, sales_data: List[models.Model], is_monthly: bool = True
+        self, sales_data: SalesColumns, is_monthly: bool = True
     ) -> List[Tuple[Tuple[Any, ...], Dict[str, Union[int, List[Dict[str, Union[str, Decimal, int]]]]]]]:
         formatted_data: Dict[Tuple[Any, ...], Dict[str, Union[int, List[Dict[str, Union[str, Decimal, int]]]]]] = defaultdict(
             lambda: {'total': 0, 'details': {}}
         )
 
-        if is_monthly:
-            # 月次集計の開始日（当月を含めた三ヶ月）
-            start_date = self.start_date_monthly
-        else:
-            # 日次集計の開始日（当日を含めた3日）
-            start_date = self.start_date_daily
-
-        for sale in sales_data:
-            # 指定された期間内のデータのみ処理
-            if start_date <= sale.sale_date <= self.end_of_day and sale.is_active:
-                key: Tuple[Any, ...] = (
-                    sale.sale_date.year,
-                    sale.sale_date.month
-                ) if is_monthly else (
-                    sale.sale_date.year,
-                    sale.sale_date.month,
-                    sale.sale_date.day
-                )
-                total_amount: Decimal = sale.total_amount
-
-                # 新しいデータを作成する場合
-                if key not in formatted_data:
-                    formatted_data[key] = {'total': 0, 'details': {}}
-
-                details: Dict[str, Union[str, Decimal, int]] = formatted_data[key]['details'].get(
-                    sale.fruit.name
-                )
-
-                # すでに同じ果物のデータがある場合は合算する
-                if details:
-                    details['amount'] += total_amount
-                    details['quantity'] += sale.quantity
-                else:
-                    details = {
-                        'fruit': sale.fruit.name,
-                        'amount': total_amount,
-                        'quantity': sale.quantity,
-                    }
-
-                formatted_data[key]['details'][sale.fruit.name] = details
-                formatted_data[key]['total'] += total_amount
+        # 集計するタイムゾーンの月/日の境界で行を区間に分け、(区間, 果物)ごとに合計する
+        start_date: datetime = self.start_date_monthly if is_monthly else self.start_date_daily
+        periods, edges = calendar_edges(start_date, self.period_end, 'month' if is_monthly else 'day', self.tz)
+        totals: GroupTotals = sales_data.group_by_bucket(edges)
+
+        # 果物名の順に期間ごとの辞書にまとめる
+        for (code, fruit_id), (amount, quantity, _) in sorted(
+                totals.items(), key=lambda item: (item[0][0], sales_data.fruit_names[item[0][1]])):
+            period: date = periods[code]
+            key: Tuple[Any, ...] = (
+                period.year,
+                period.month
+            ) if is_monthly else (
+                period.year,
+                period.month,
+                period.day
+            )
+            fruit_name: str = sales_data.fruit_names[fruit_id]
+
+            formatted_data[key]['details'][fruit_name] = {
+                'fruit': fruit_name,
+                'amount': amount,
+                'quantity': quantity,
+            }
+            formatted_data[key]['total'] += amount
 
         # 期間の部分をソート
         sorted_data: List[Tuple[Tuple[Any, ...], Dict[str, Union[int, List[Dict[str, Union[str, Decimal, int]]]]]]] = sorted(
@@ -341,52 +488,187 @@ class SalesAggregateView(LoginRequiredMixin, View):
 
         return formatted_data.items()
 
-    def get(self, request, *args, **kwargs) -> Any:
-        # Get all sales data
-        all_sales: List[models.Model] = Sale.objects.all()
+    def total_sales(self) -> Decimal:
+        # 累計(登録・編集・削除・取り込みのたびに更新している累計の1行だけを読む)
+        return grand_total().amount
 
-        # 累計
-        total_sales: Decimal = sum(
-            sale.total_amount for sale in all_sales if sale.is_active
+    def sorted_data(self, is_monthly: bool = True) -> List[Tuple[Tuple[Any, ...], Dict[str, Union[int, List[Dict[str, Union[str, Decimal, int]]]]]]]:
+        start_date: datetime = self.start_date_monthly if is_monthly else self.start_date_daily
+        data: List[Tuple[Tuple[Any, ...], Dict[str, Union[int, List[Dict[str, Union[str, Decimal, int]]]]]]] = self.format_data(
+            load_rollups(self.aggregate_sales(start_date, is_monthly=is_monthly), self.tz), is_monthly=is_monthly
         )
-        # UTC+9:00のオフセットを取得
-        jst_offset = timedelta(hours=9)
-
-        # monthly_sales_data の各要素の sale_date を日本時間に変換
-        for sale in all_sales:
-            sale.sale_date = sale.sale_date + jst_offset
-
-        # 月別集計
-        # Filter sales data for the specified conditions
-        monthly_sales_data: List[models.Model] = [
-            sale
-            for sale in all_sales
-            if self.start_date_monthly <= sale.sale_date <= self.end_of_day and sale.is_active
+        return sorted(data, key=lambda x: x[0], reverse=True)
+
+    def period_key(self) -> List[Any]:
+        # 集計結果は(タイムゾーン, その日付)ごとに販売実績の版番号付きでキャッシュする。
+        # 果物名を含むため、果物名の変更で果物カタログの版が進めば作り直す
+        return [str(self.tz), self.end_of_day.date(), catalog_version()]
+
+    def leaderboard_windows(self) -> List[Tuple[str, Optional[date], Optional[date]]]:
+        # 今日・今週・今月と、?from=&to= が指定された場合はその期間
+        windows: List[Tuple[str, Optional[date], Optional[date]]] = [
+            (LEADERBOARD_WINDOWS[name], start, end)
+            for name, (start, end) in window_bounds(self.end_of_day.date()).items()]
+        if self.custom_window is not None:
+            windows.append(('指定期間', *self.custom_window))
+        return windows
+
+    def leaderboards(self) -> List[Dict[str, Any]]:
+        # 売れ筋は期間ごとにキャッシュする(順位表APIとキャッシュを共有)
+        size: int = settings.SALES_LEADERBOARD_SIZE
+        return [
+            dict(label=label, start=start, end=end, **cached_by_version(
+                'sales_leaderboard', leaderboard_key(self.tz, start, end, size),
+                lambda: leaderboard(start, end, self.tz, size)))
+            for label, start, end in self.leaderboard_windows()
         ]
-        monthly_data: List[Tuple[Tuple[Any, ...], Dict[str, Union[int, List[Dict[str, Union[str, Decimal, int]]]]]]] = self.format_data(
-            monthly_sales_data
-        )
-        sorted_monthly_data: List[Tuple[Tuple[Any, ...], Dict[str, Union[int, List[Dict[str, Union[str, Decimal, int]]]]]]] = sorted(
-            monthly_data, key=lambda x: x[0], reverse=True
-        )
-
-        # 日別集計
-        daily_sales_data: List[models.Model] = [
-            sale
-            for sale in all_sales
-            if self.start_date_daily <= sale.sale_date <= self.end_of_day and sale.is_active
-        ]
-        daily_data: List[Tuple[Tuple[Any, ...], Dict[str, Union[int, List[Dict[str, Union[str, Decimal, int]]]]]]] = self.format_data(
-            daily_sales_data, is_monthly=False
-        )
-        sorted_daily_data: List[Tuple[Tuple[Any, ...], Dict[str, Union[int, List[Dict[str, Union[str, Decimal, int]]]]]]] = sorted(
-            daily_data, key=lambda x: x[0], reverse=True
-        )
 
+    def get(self, request, *args, **kwargs) -> Any:
+        error: Optional[HttpResponse] = self.read_params(request)
+        if error is not None:
+            return error
         context = {
-            'total_sales': total_sales,
-            'monthly_data': sorted_monthly_data,
-            'daily_data': sorted_daily_data,
+            'time_zone': str(self.tz),
+            'leaderboards': self.leaderboards(),
+            'total_sales': cached_by_version('sales_aggregate:total', [], self.total_sales),
+            # 月別集計
+            'monthly_data': cached_by_version(
+                'sales_aggregate:monthly', self.period_key(), lambda: self.sorted_data(is_monthly=True)),
+            # 日別集計
+            'daily_data': cached_by_version(
+                'sales_aggregate:daily', self.period_key(), lambda: self.sorted_data(is_monthly=False)),
         }
 
         return render(request, self.template_name, context)
+
+
+class AsyncSalesAggregateView(AsyncLoginRequiredMixin, SalesAggregateView):
+    # 売り上げ集計の非同期版。キャッシュは同期版と共有し、累計・月別・日別を並行して取得する
+    async def atotal_sales(self) -> Decimal:
+        return (await agrand_total()).amount
+
+    async def asorted_data(self, is_monthly: bool = True) -> List[Tuple[Tuple[Any, ...], Dict[str, Union[int, List[Dict[str, Union[str, Decimal, int]]]]]]]:
+        start_date: datetime = self.start_date_monthly if is_monthly else self.start_date_daily
+        columns: SalesColumns = await aload_rollups(self.aggregate_sales(start_date, is_monthly=is_monthly), self.tz)
+        return sorted(self.format_data(columns, is_monthly=is_monthly), key=lambda x: x[0], reverse=True)
+
+    async def aleaderboards(self) -> List[Dict[str, Any]]:
+        size: int = settings.SALES_LEADERBOARD_SIZE
+        windows: List[Tuple[str, Optional[date], Optional[date]]] = self.leaderboard_windows()
+        keys: List[List[Any]] = await sync_to_async(
+            lambda: [leaderboard_key(self.tz, start, end, size) for _, start, end in windows])()
+        boards: List[Leaderboard] = await asyncio.gather(*[
+            acached_by_version('sales_leaderboard', key, partial(aleaderboard, start, end, self.tz, size))
+            for key, (_, start, end) in zip(keys, windows)])
+        return [dict(label=label, start=start, end=end, **board) for (label, start, end), board in zip(windows, boards)]
+
+    async def get(self, request, *args, **kwargs) -> HttpResponse:
+        error: Optional[HttpResponse] = self.read_params(request)
+        if error is not None:
+            return error
+        period_key: List[Any] = await sync_to_async(self.period_key)()
+        total_sales, monthly_data, daily_data, leaderboards = await asyncio.gather(
+            acached_by_version('sales_aggregate:total', [], self.atotal_sales),
+            acached_by_version('sales_aggregate:monthly', period_key, lambda: self.asorted_data(is_monthly=True)),
+            acached_by_version('sales_aggregate:daily', period_key, lambda: self.asorted_data(is_monthly=False)),
+            self.aleaderboards(),
+        )
+
+        return render(request, self.template_name, {
+            'time_zone': str(self.tz),
+            'leaderboards': leaderboards,
+            'total_sales': total_sales,
+            'monthly_data': monthly_data,
+            'daily_data': daily_data,
+        })
+
+
+class SalesAggregateApiView(LoginRequiredMixin, View):
+    # ?from=&to=&granularity=hour|day|week|month|year&tz=&fruit= で任意の期間を集計してJSONで返す
+    def get(self, request, *args, **kwargs) -> JsonResponse:
+        form: SalesAggregateForm = SalesAggregateForm({
+            'start': request.GET.get('from'),
+            'end': request.GET.get('to'),
+            'granularity': request.GET.get('granularity'),
+            'tz': request.GET.get('tz'),
+            'fruit': request.GET.get('fruit'),
+        })
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+
+        params: Dict[str, Any] = form.cleaned_data
+        try:
+            aggregate: SalesAggregate = SalesAggregate(
+                params['start'], params['end'], params['granularity'], params['tz'],
+                fruit=params['fruit'] or None, limit=settings.SALES_AGGREGATE_MAX_BUCKETS)
+        except TooManyBuckets as error:
+            return JsonResponse({'errors': {'__all__': [str(error)]}}, status=400)
+
+        return JsonResponse(cached_by_version('sales_aggregate:api', [
+            params['start'].isoformat(), params['end'].isoformat(), params['granularity'],
+            params['tz'], params['fruit'], catalog_version(),
+        ], aggregate.as_json))
+
+
+class SalesLeaderboardApiView(LoginRequiredMixin, View):
+    # ?from=&to=&k=&tz= の期間の売り上げ順・個数順の上位k件の果物を返す
+    def get(self, request, *args, **kwargs) -> JsonResponse:
+        form: SalesLeaderboardForm = SalesLeaderboardForm({
+            'start': request.GET.get('from'),
+            'end': request.GET.get('to'),
+            'k': request.GET.get('k'),
+            'tz': request.GET.get('tz'),
+        })
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+
+        params: Dict[str, Any] = form.cleaned_data
+        board: Leaderboard = cached_by_version(
+            'sales_leaderboard', leaderboard_key(params['tz'], params['start'], params['end'], params['k']),
+            lambda: leaderboard(params['start'], params['end'], params['tz'], params['k']))
+        return JsonResponse({
+            'from': params['start'].isoformat() if params['start'] else None,
+            'to': params['end'].isoformat() if params['end'] else None,
+            'tz': str(params['tz']),
+            'k': params['k'],
+            **{metric: [rank._asdict() for rank in ranks] for metric, ranks in board.items()},
+        })
+
+
+class SalesRangeTotalView(LoginRequiredMixin, View):
+    # ?from=&to=&fruit= の期間合計を累計の差(2回の参照と引き算)で返す
+    def get(self, request, *args, **kwargs) -> JsonResponse:
+        form: SalesRangeForm = SalesRangeForm({
+            'start': request.GET.get('from'),
+            'end': request.GET.get('to'),
+            'fruit': request.GET.get('fruit'),
+        })
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+
+        fruit_id: Optional[int] = None
+        fruit_name: str = form.cleaned_data['fruit']
+        if fruit_name:
+            fruit: Optional[CatalogFruit] = fruit_catalog.by_name(fruit_name)
+            # 削除済みの果物の販売実績も集計に含まれるため、カタログになければDBを探す
+            fruit_id = fruit.id if fruit is not None else Fruit.objects.filter(
+                name=fruit_name).values_list('id', flat=True).first()
+            if fruit_id is None:
+                return JsonResponse({'errors': {'fruit': ['選択した果物は存在しません。']}}, status=400)
+
+        start: Optional[date] = form.cleaned_data['start']
+        end: Optional[date] = form.cleaned_data['end']
+        total: RangeTotal = prefix_index.range_total(start, end, fruit_id)
+        return JsonResponse({
+            'from': start.isoformat() if start else None,
+            'to': end.isoformat() if end else None,
+            'fruit': fruit_name or None,
+            'amount': total.amount,
+            'quantity': total.quantity,
+            'count': total.count,
+        })
+
+
+class CacheStatsView(LoginRequiredMixin, View):
+    def get(self, request, *args, **kwargs) -> JsonResponse:
+        return JsonResponse(cache_stats())
@@ -0,0 +1,17 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+
+from sales.caching import stats_buffer
+from sales.models import Fruit
+
+
+class SalesTestCase(TestCase):
+    # キャッシュを空にし、ログイン済みのクライアントと果物(Apple・Banana)を用意する
+    def setUp(self) -> None:
+        cache.clear()
+        stats_buffer.clear()
+        self.user: User = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_login(self.user)
+        self.apple: Fruit = Fruit.objects.create(name='Apple', price=100)
+        self.banana: Fruit = Fruit.objects.create(name='Banana', price=50)
@@ -0,0 +1,10 @@
+import pytest
+from django.test import override_settings
+
+
+@pytest.fixture(autouse=True, scope='session')
+def locmem_cache():
+    # テストでは開発環境のファイルキャッシュ(BASE_DIR/cache)を使わず、プロセス内のキャッシュを使う。
+    # 各テストのcache.clear()が開発中のキャッシュを消さないよう、すべてのテストに適用する
+    with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+        yield
@@ -0,0 +1,108 @@
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List
+from zoneinfo import ZoneInfo
+
+from django.test import SimpleTestCase
+from django.urls import reverse
+
+from sales.aggregates import SalesAggregate, TooManyBuckets, bucket_list
+from sales.models import Sale
+from sales.rollups import JST, rebuild_rollup
+from tests.base import SalesTestCase
+
+NEW_YORK = ZoneInfo('America/New_York')
+
+
+class BucketListTest(SimpleTestCase):
+    def test_hours_follow_daylight_saving_changes(self) -> None:
+        # 夏時間の開始日は23時間、終了日は25時間
+        spring: List[datetime] = bucket_list(datetime(2024, 3, 10, tzinfo=NEW_YORK),
+                                             datetime(2024, 3, 11, tzinfo=NEW_YORK), 'hour', NEW_YORK, 100)
+        autumn: List[datetime] = bucket_list(datetime(2024, 11, 3, tzinfo=NEW_YORK),
+                                             datetime(2024, 11, 4, tzinfo=NEW_YORK), 'hour', NEW_YORK, 100)
+
+        self.assertEqual((len(spring), len(autumn)), (23, 25))
+        self.assertEqual(len(set(autumn)), 25)
+
+    def test_calendar_buckets(self) -> None:
+        start: datetime = datetime(2023, 12, 20, tzinfo=JST)
+        end: datetime = datetime(2024, 3, 2, tzinfo=JST)
+
+        self.assertEqual(bucket_list(start, end, 'month', JST, 10),
+                         [date(2023, 12, 1), date(2024, 1, 1), date(2024, 2, 1), date(2024, 3, 1)])
+        self.assertEqual(bucket_list(start, end, 'week', JST, 20)[:2], [date(2023, 12, 18), date(2023, 12, 25)])
+        self.assertEqual(bucket_list(start, end, 'year', JST, 10), [date(2023, 1, 1), date(2024, 1, 1)])
+        with self.assertRaises(TooManyBuckets):
+            bucket_list(start, end, 'day', JST, 30)
+
+
+class SalesAggregateApiTest(SalesTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        for day, hour, fruit, quantity in [(1, 9, self.apple, 1), (1, 23, self.banana, 2), (2, 0, self.apple, 3),
+                                           (31, 12, self.apple, 4), (45, 8, self.banana, 5)]:
+            Sale.objects.create(fruit=fruit, quantity=quantity, total_amount=quantity * fruit.price,
+                                sale_date=datetime(2024, 1, 1, hour, tzinfo=JST) + timedelta(days=day - 1))
+        Sale.objects.create(fruit=self.apple, quantity=9, total_amount=900, is_active=False,
+                            sale_date=datetime(2024, 1, 1, 10, tzinfo=JST))
+        rebuild_rollup()
+
+    def fetch(self, **params: Any) -> Dict[str, Any]:
+        params = {'from': '2024-01-01', 'to': '2024-02-29', **params}
+        response = self.client.get(reverse('sales_aggregate_api'), params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_daily_buckets_from_rollup(self) -> None:
+        data: Dict[str, Any] = self.fetch(granularity='day')
+
+        self.assertEqual(data['source'], 'rollup')
+        self.assertEqual(len(data['buckets']), 60)
+        self.assertEqual(data['total'], {'amount': 1150, 'quantity': 15, 'count': 5})
+        first: Dict[str, Any] = data['buckets'][0]
+        self.assertEqual((first['start'], first['amount'], first['count']), ('2024-01-01T00:00:00+09:00', 200, 2))
+        self.assertEqual([fruit['fruit'] for fruit in first['fruits']], ['Apple', 'Banana'])
+
+    def test_rollup_and_sales_agree(self) -> None:
+        start: datetime = datetime(2024, 1, 1, tzinfo=JST)
+        end: datetime = datetime(2024, 3, 1, tzinfo=JST)
+        for granularity in ('day', 'week', 'month', 'year'):
+            with self.subTest(granularity):
+                aggregate: SalesAggregate = SalesAggregate(start, end, granularity, JST)
+                self.assertTrue(aggregate.uses_rollup)
+                from_rollup: Dict[str, Any] = aggregate.as_json()
+
+                # 同じ条件を販売実績から直接集計する
+                aggregate.rollup_rows = aggregate.sale_rows
+                self.assertEqual(from_rollup, dict(aggregate.as_json(), source='rollup'))
+
+    def test_other_timezone_uses_sales(self) -> None:
+        data: Dict[str, Any] = self.fetch(granularity='day', tz='UTC', **{'from': '2023-12-31', 'to': '2024-01-01'})
+
+        # 日本時間 1/1 9:00 は UTC 1/1 0:00、1/1 23:00 と 1/2 0:00 は UTC 1/1 14:00, 15:00
+        self.assertEqual(data['source'], 'sales')
+        self.assertEqual([(bucket['start'], bucket['count']) for bucket in data['buckets']],
+                         [('2023-12-31T00:00:00+00:00', 0), ('2024-01-01T00:00:00+00:00', 3)])
+
+    def test_hourly_and_fruit_filter(self) -> None:
+        data: Dict[str, Any] = self.fetch(granularity='hour', fruit='Apple',
+                                          **{'from': '2024-01-01T00:00', 'to': '2024-01-02T12:00'})
+
+        self.assertEqual(len(data['buckets']), 36)
+        self.assertEqual([bucket['start'] for bucket in data['buckets'] if bucket['count']],
+                         ['2024-01-01T09:00:00+09:00', '2024-01-02T00:00:00+09:00'])
+        self.assertEqual(data['total']['amount'], 400)
+
+    def test_invalid_parameters(self) -> None:
+        url: str = reverse('sales_aggregate_api')
+        for params in [{'from': '2024-01-01'}, {'from': '2024-02-01', 'to': '2024-01-01'},
+                       {'from': '2024-01-01', 'to': '2024-01-02', 'tz': 'Mars/Base'},
+                       {'from': '2024-01-01', 'to': '2024-01-02', 'granularity': 'minute'},
+                       {'from': '2000-01-01', 'to': '2024-01-01', 'granularity': 'hour'}]:
+            with self.subTest(params):
+                self.assertEqual(self.client.get(url, params).status_code, 400)
+
+    def test_result_is_cached(self) -> None:
+        self.fetch()
+        with self.assertNumQueries(2):
+            self.fetch()
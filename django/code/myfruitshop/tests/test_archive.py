@@ -0,0 +1,128 @@
+from datetime import date, datetime
+from importlib import import_module
+from io import StringIO
+from typing import List, Tuple
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.urls import reverse
+from freezegun import freeze_time
+
+from sales.grand_total import compute_grand_total, grand_total
+from sales.models import Fruit, Sale, SaleArchive
+from sales.partitions import month_range, partition_bound, partition_definitions, partition_month
+from sales.prefix_sums import expected_prefix_sums, stored_prefix_sums
+from sales.rollups import JST, compute_rollup, rebuild_rollup, stored_rollup
+from sales.views import SaleCombinedView
+from tests.base import SalesTestCase
+
+
+class SaleArchiveTest(SalesTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        rows: List[Tuple[Fruit, int, datetime, bool]] = [
+            (self.apple, 1, datetime(2022, 12, 31, 23, 30, tzinfo=JST), True),
+            (self.banana, 2, datetime(2023, 3, 1, 10, tzinfo=JST), True),
+            (self.apple, 3, datetime(2023, 5, 31, 23, 59, tzinfo=JST), True),
+            (self.apple, 9, datetime(2023, 4, 1, 10, tzinfo=JST), False),
+            # 保管期間内(2023-06-01以降)
+            (self.apple, 4, datetime(2023, 6, 1, 0, 0, tzinfo=JST), True),
+            (self.banana, 5, datetime(2024, 6, 1, 10, tzinfo=JST), True),
+            (self.banana, 7, datetime(2024, 5, 1, 10, tzinfo=JST), False),
+        ]
+        Sale.objects.bulk_create([
+            Sale(fruit=fruit, quantity=quantity, total_amount=quantity * fruit.price, sale_date=sale_date,
+                 is_active=is_active)
+            for fruit, quantity, sale_date, is_active in rows])
+        # 保管期間内の論理削除済みは100日前に、保管期間より前の論理削除済みは最近削除したものとする
+        Sale.objects.filter(quantity=7).update(updated_at=datetime(2024, 3, 7, tzinfo=JST))
+        Sale.objects.filter(quantity=9).update(updated_at=datetime(2024, 6, 10, tzinfo=JST))
+        rebuild_rollup()
+
+    def archive(self, *args: str) -> str:
+        out: StringIO = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('archive_sales', '--retention-months', '12', '--batch-size', '2', *args, stdout=out)
+        return out.getvalue()
+
+    def aggregate(self, tz: str) -> dict:
+        response = self.client.get(reverse('sales_aggregate_api'), {
+            'from': '2022-12-01', 'to': '2024-06-30', 'granularity': 'month', 'tz': tz})
+        self.assertEqual(response.status_code, 200)
+        data: dict = response.json()
+        return {'total': data['total'], 'buckets': [(bucket['start'], bucket['amount']) for bucket in data['buckets']]}
+
+    @freeze_time('2024-06-15 03:00:00')
+    def test_archive_keeps_rollups_and_reports(self) -> None:
+        rollup = stored_rollup()
+        total = grand_total()
+        reports = {tz: self.aggregate(tz) for tz in ('Asia/Tokyo', 'UTC')}
+        leaderboard = self.client.get(reverse('sales_leaderboard_api'), {'tz': 'UTC'}).json()
+
+        self.assertIn('5 件', self.archive('--dry-run'))
+        self.assertEqual(SaleArchive.objects.count(), 0)
+
+        # 2023-06-01(日本時間)より前の4件(論理削除済みを含む)と、90日より前に論理削除された1件
+        output: str = self.archive()
+        self.assertIn('5 件', output)
+        self.assertIn('3 バッチ', output)
+        self.assertEqual(sorted(SaleArchive.objects.values_list('quantity', flat=True)), [1, 2, 3, 7, 9])
+        self.assertEqual(sorted(Sale.objects.values_list('quantity', flat=True)), [4, 5])
+        archived: SaleArchive = SaleArchive.objects.get(quantity=3)
+        self.assertEqual((archived.fruit, archived.total_amount, archived.sale_date),
+                         (self.apple, 300, datetime(2023, 5, 31, 23, 59, tzinfo=JST)))
+
+        # 日次集計・累計は変わらず、作り直しても保管済みの販売実績を含める
+        self.assertEqual(stored_rollup(), rollup)
+        self.assertEqual(grand_total(), total)
+        rebuild_rollup()
+        self.assertEqual(stored_rollup(), rollup)
+        self.assertEqual(compute_rollup(), rollup)
+        self.assertEqual(compute_grand_total(), total)
+        self.assertEqual(stored_prefix_sums(), expected_prefix_sums())
+
+        # 日本時間(日次集計)・それ以外(販売実績 + 保管済み)の集計も変わらない
+        cache.clear()
+        self.assertEqual({tz: self.aggregate(tz) for tz in reports}, reports)
+        self.assertEqual(self.client.get(reverse('sales_leaderboard_api'), {'tz': 'UTC'}).json(), leaderboard)
+
+        # 2回目は移すものがない
+        self.assertIn('0 件', self.archive())
+
+    @freeze_time('2024-06-15 03:00:00')
+    def test_sales_list_count_excludes_archived_sales(self) -> None:
+        def list_page(page: int):
+            response = self.client.get(reverse('sales_combined'), {'page': page})
+            self.assertEqual(response.status_code, 200)
+            return response.context['sales']
+
+        with patch.object(SaleCombinedView, 'paginate_by', 1):
+            self.assertEqual(list_page(1).paginator.num_pages, 5)
+            # 保管後は件数のキャッシュが捨てられ、日次集計のうち一覧に残る日だけを数える(空のページを出さない)
+            self.archive()
+            self.assertEqual(list_page(1).paginator.count, 2)
+            last = list_page(2)
+            self.assertEqual([sale.quantity for sale in last], [4])
+            self.assertFalse(last.has_next())
+        # カーソル方式の一覧に表示する件数も同じ
+        self.assertContains(self.client.get(reverse('sales_combined')), '約 2 件')
+
+    def test_partition_definitions(self) -> None:
+        # 日本時間の月末(翌月1日0時)をUTCで区切る
+        self.assertEqual(partition_bound(date(2024, 1, 1)), '2024-01-31 15:00:00')
+        self.assertEqual(partition_bound(date(2024, 12, 1)), '2024-12-31 15:00:00')
+        self.assertEqual(month_range(date(2023, 11, 15), date(2024, 2, 1)),
+                         [date(2023, 11, 1), date(2023, 12, 1), date(2024, 1, 1), date(2024, 2, 1)])
+        self.assertEqual(
+            partition_definitions([date(2023, 12, 1), date(2024, 1, 1)]),
+            "PARTITION p202312 VALUES LESS THAN ('2023-12-31 15:00:00'), "
+            "PARTITION p202401 VALUES LESS THAN ('2024-01-31 15:00:00'), "
+            'PARTITION pmax VALUES LESS THAN (MAXVALUE)')
+        self.assertEqual(partition_month('p202402'), date(2024, 2, 1))
+        self.assertIsNone(partition_month('pmax'))
+
+        # 0013のマイグレーションは同じ定義を自前で持つ
+        migration = import_module('sales.migrations.0013_salearchive')
+        self.assertEqual(migration.partition_definitions(date(2023, 11, 1), date(2024, 2, 1)),
+                         partition_definitions(month_range(date(2023, 11, 1), date(2024, 2, 1))))
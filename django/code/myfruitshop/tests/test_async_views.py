@@ -0,0 +1,93 @@
+import csv
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.test import AsyncClient
+from django.urls import reverse
+from freezegun import freeze_time
+
+from sales.benchmarks import LoadResult, asgi_load, percentile
+from sales.models import Sale
+from sales.rollups import rebuild_rollup
+from tests.base import SalesTestCase
+
+JST = timezone(timedelta(hours=9))
+
+
+class AsyncViewTest(SalesTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.async_client.force_login(self.user)
+        for day, fruit, quantity in [(20, self.apple, 2), (19, self.apple, 1), (1, self.banana, 3), (18, self.banana, 1)]:
+            Sale.objects.create(fruit=fruit, quantity=quantity, total_amount=quantity * fruit.price,
+                                sale_date=datetime(2024, 1, day, 9, 0, tzinfo=JST))
+        Sale.objects.create(fruit=self.apple, quantity=5, total_amount=500, is_active=False,
+                            sale_date=datetime(2024, 1, 20, 11, 0, tzinfo=JST))
+        rebuild_rollup()
+
+    @freeze_time("2024-01-20 03:00:00")
+    async def test_aggregate_matches_sync_view(self) -> None:
+        response = await self.async_client.get(reverse('sales_aggregate_async'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_sales'], 500)
+        self.assertEqual([key for key, _ in response.context['daily_data']], [(2024, 1, 20), (2024, 1, 19), (2024, 1, 18)])
+
+        # 同期版とキャッシュを共有し、同じ内容を表示する
+        await cache.aclear()
+        expected = await self.async_client.get(reverse('sales_aggregate'))
+        for name in ('total_sales', 'monthly_data', 'daily_data'):
+            self.assertEqual(response.context[name], expected.context[name])
+
+    async def test_sales_list_pages(self) -> None:
+        response = await self.async_client.get(reverse('sales_combined_async'))
+        self.assertEqual(response.status_code, 200)
+        page = response.context['sales']
+        self.assertEqual([sale.quantity for sale in page], [2, 1, 1, 3])
+        self.assertEqual(page.count, 4)
+
+        # 同期版は同じ表の断片をキャッシュから使うため、一覧は読み込まれていない(参照時にスレッドで読む)
+        expected = await self.async_client.get(reverse('sales_combined'))
+        self.assertEqual(list(page), await sync_to_async(list)(expected.context['sales']))
+        cached = await self.async_client.get(reverse('sales_combined_async'))
+        self.assertEqual(cached.content.split(b'</table>')[0].split(b'<table')[1],
+                         response.content.split(b'</table>')[0].split(b'<table')[1])
+
+        response = await self.async_client.get(reverse('sales_combined_async'), {'page': 1})
+        self.assertEqual(len(response.context['sales'].object_list), 4)
+
+    async def test_export_streams_same_csv(self) -> None:
+        response = await self.async_client.get(reverse('sales_export_async'), {'fruit': 'Apple'})
+        self.assertEqual(response.status_code, 200)
+        content: str = b''.join([chunk async for chunk in response.streaming_content]).decode('utf-8')
+        rows: List[List[str]] = list(csv.reader(content.splitlines()))
+        self.assertEqual(rows, [['Apple', '1', '100', '2024-01-19 09:00'], ['Apple', '2', '200', '2024-01-20 09:00']])
+
+        invalid = await self.async_client.get(reverse('sales_export_async'), {'start': 'x'})
+        self.assertEqual(invalid.status_code, 400)
+
+    async def test_login_required(self) -> None:
+        client: AsyncClient = AsyncClient()
+        for name in ('sales_aggregate_async', 'sales_combined_async', 'sales_export_async'):
+            with self.subTest(name):
+                response = await client.get(reverse(name))
+                self.assertEqual(response.status_code, 302)
+                self.assertIn(reverse('login'), response['Location'])
+
+    def test_sync_client_can_call_async_views(self) -> None:
+        self.assertEqual(self.client.get(reverse('sales_combined_async')).status_code, 200)
+
+    async def test_asgi_load_reports_latency(self) -> None:
+        session_key: str = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        result: LoadResult = await asgi_load(reverse('sales_export_async'), session_key, 4, 12)
+
+        report: dict = result.as_report()
+        self.assertEqual((report['server'], report['requests'], report['errors']), ('asgi', 12, 0))
+        self.assertLessEqual(report['p50_ms'], report['p99_ms'])
+
+    def test_percentile(self) -> None:
+        values: List[float] = [float(value) for value in range(1, 101)]
+        self.assertEqual((percentile(values, 50), percentile(values, 99), percentile(values, 100)), (50, 99, 100))
+        self.assertEqual(percentile([3.0], 95), 3.0)
@@ -0,0 +1,95 @@
+from datetime import datetime
+from typing import List
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from sales.grand_total import compute_grand_total, grand_total
+from sales.importer import ImportResult, SaleCsvImporter
+from sales.models import Sale
+from sales.prefix_sums import expected_prefix_sums, stored_prefix_sums
+from sales.rollups import JST, compute_rollup, rebuild_rollup, stored_rollup
+from tests.base import SalesTestCase
+
+
+class SaleBulkUpdateTest(SalesTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.manual: Sale = Sale.objects.create(fruit=self.apple, quantity=1, total_amount=100,
+                                                sale_date=datetime(2024, 1, 1, 12, tzinfo=JST))
+        rebuild_rollup()
+        self.result: ImportResult = SaleCsvImporter().run([
+            ['Apple', '2', '200', '2024-01-02 10:00'],
+            ['Banana', '4', '200', '2024-01-02 11:00'],
+            ['Banana', '1', '50', '2024-01-20 10:00'],
+        ])
+
+    def assertAggregatesInSync(self) -> None:
+        self.assertEqual(stored_rollup(), compute_rollup())
+        self.assertEqual(stored_prefix_sums(), expected_prefix_sums())
+        self.assertEqual(grand_total(), compute_grand_total())
+
+    def bulk(self, **data) -> dict:
+        response = self.client.post(reverse('sales_bulk'), data=data)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_delete_and_restore_import_batch(self) -> None:
+        self.assertEqual(self.bulk(action='delete', import_batch=self.result.import_batch),
+                         {'action': 'delete', 'matched': 3, 'updated': 3})
+        self.assertEqual(list(Sale.objects.filter(is_active=True)), [self.manual])
+        self.assertEqual(grand_total().amount, 100)
+        self.assertAggregatesInSync()
+
+        # 削除済みの行は再度の論理削除の対象にならない
+        self.assertEqual(self.bulk(action='delete', import_batch=self.result.import_batch)['matched'], 0)
+
+        self.assertEqual(self.bulk(action='restore', import_batch=self.result.import_batch, fruit='Banana'),
+                         {'action': 'restore', 'matched': 2, 'updated': 2})
+        self.assertEqual(grand_total().amount, 350)
+        self.assertAggregatesInSync()
+
+    def test_correct_quantity_recalculates_total_amount(self) -> None:
+        self.assertEqual(self.bulk(action='correct', start='2024-01-02', end='2024-01-02', quantity=3)['updated'], 2)
+        self.assertEqual(
+            sorted(Sale.objects.filter(quantity=3).values_list('fruit__name', 'total_amount')),
+            [('Apple', 300), ('Banana', 150)])
+        self.assertAggregatesInSync()
+
+    def test_correct_fruit_by_ids(self) -> None:
+        ids: str = ','.join(str(pk) for pk in Sale.objects.filter(fruit=self.banana).values_list('pk', flat=True))
+        self.bulk(action='correct', ids=ids, new_fruit=self.apple.pk)
+        self.assertFalse(Sale.objects.filter(fruit=self.banana).exists())
+        self.assertEqual(sorted(Sale.objects.values_list('quantity', 'total_amount')),
+                         [(1, 100), (1, 100), (2, 200), (4, 400)])
+        self.assertAggregatesInSync()
+
+    def test_bulk_update_is_set_based(self) -> None:
+        # 同じ日・果物に1件ずつと10件ずつの取り込みで、一括削除のクエリ数が変わらないこと
+        query_counts: List[int] = []
+        for batch, copies in (('small', 1), ('big', 10)):
+            SaleCsvImporter(import_batch=batch).run(
+                [['Apple', '1', '100', f'2024-02-{day:02d} 10:00'] for day in range(1, 29)] * copies)
+            with CaptureQueriesContext(connection) as queries:
+                self.bulk(action='delete', import_batch=batch)
+            query_counts.append(len(queries))
+
+        self.assertEqual(query_counts[0], query_counts[1])
+        self.assertEqual(Sale.objects.filter(import_batch='big', is_active=False).count(), 280)
+        self.assertAggregatesInSync()
+
+    def test_invalid_requests(self) -> None:
+        # 条件なしの全件更新や、訂正後の値のない訂正は受け付けない
+        self.assertEqual(self.client.post(reverse('sales_bulk'), data={'action': 'delete'}).status_code, 400)
+        self.assertEqual(self.client.post(reverse('sales_bulk'), data={
+            'action': 'correct', 'fruit': 'Apple'}).status_code, 400)
+        self.assertEqual(self.client.post(reverse('sales_bulk'), data={
+            'action': 'delete', 'ids': '1,x'}).status_code, 400)
+        self.assertEqual(Sale.objects.filter(is_active=True).count(), 4)
+
+    def test_delete_view_post_is_soft_delete(self) -> None:
+        self.client.post(reverse('delete_sale', kwargs={'pk': self.manual.pk}))
+        self.manual.refresh_from_db()
+        self.assertFalse(self.manual.is_active)
+        self.assertAggregatesInSync()
@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta, timezone
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from freezegun import freeze_time
+
+from sales.caching import cache_stats, sales_data_version, stats_buffer
+from sales.models import Fruit, Sale
+from sales.rollups import rebuild_rollup
+
+JST = timezone(timedelta(hours=9))
+
+
+class SalesAggregateCacheTest(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        stats_buffer.clear()
+        self.user: User = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_login(self.user)
+        self.apple: Fruit = Fruit.objects.create(name='Apple', price=100)
+        Sale.objects.create(fruit=self.apple, quantity=1, total_amount=100,
+                            sale_date=datetime(2024, 1, 20, 10, 0, tzinfo=JST))
+        rebuild_rollup()
+
+    @freeze_time("2024-01-20 03:00:00")
+    def test_hit_until_a_sale_is_written(self) -> None:
+        first = self.client.get(reverse('sales_aggregate'))
+        self.assertEqual(first.context['total_sales'], 100)
+
+        with self.assertNumQueries(2):
+            # セッションとユーザーの取得のみ
+            second = self.client.get(reverse('sales_aggregate'))
+        self.assertEqual(second.context['total_sales'], 100)
+
+        version: int = sales_data_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('add_sales'), data={
+                'fruit': self.apple.pk, 'quantity': 2, 'sale_date': '2024-01-20 11:00'})
+        self.assertEqual(sales_data_version(), version + 1)
+
+        third = self.client.get(reverse('sales_aggregate'))
+        self.assertEqual(third.context['total_sales'], 300)
+        self.assertEqual(third.context['daily_data'][0][1]['total'], 300)
+
+        stats = self.client.get(reverse('cache_stats')).json()
+        self.assertEqual(stats['caches']['sales_aggregate:total'], {'hits': 1, 'misses': 2, 'hit_ratio': 1 / 3})
+        self.assertEqual(cache_stats()['caches']['sales_aggregate:daily']['hits'], 1)
+
+    @freeze_time("2024-01-20 03:00:00")
+    def test_fruit_rename_rebuilds_tables_and_leaderboards(self) -> None:
+        def fruit_names(response) -> set:
+            names: set = {name for _, data in response.context['monthly_data'] for name in data['details']}
+            names |= {name for _, data in response.context['daily_data'] for name in data['details']}
+            return names | {rank.fruit for board in response.context['leaderboards'] for rank in board['amount']}
+
+        self.assertEqual(fruit_names(self.client.get(reverse('sales_aggregate'))), {'Apple'})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('edit_fruit', kwargs={'pk': self.apple.pk}), data={'name': 'Fuji', 'price': 100})
+
+        # 販売実績は変わらなくても、果物名を含む表・売れ筋は作り直す
+        renamed = self.client.get(reverse('sales_aggregate'))
+        self.assertEqual(fruit_names(renamed), {'Fuji'})
+        self.assertNotContains(renamed, 'Apple')
+        api = self.client.get(reverse('sales_leaderboard_api'), {'from': '2024-01-20', 'to': '2024-01-20'}).json()
+        self.assertEqual(api['amount'][0]['fruit'], 'Fuji')
+
+    def test_stats_are_buffered_per_process(self) -> None:
+        self.client.get(reverse('sales_aggregate'))
+        # 参照のたびには共有のキャッシュへ書き込まない
+        self.assertIsNone(cache.get('sales:cache_stats:sales_aggregate:total:misses'))
+
+        self.assertEqual(cache_stats()['caches']['sales_aggregate:total']['misses'], 1)
+        self.assertEqual(cache.get('sales:cache_stats:sales_aggregate:total:misses'), 1)
+        with override_settings(SALES_CACHE_STATS_FLUSH_SECONDS=0):
+            self.client.get(reverse('sales_aggregate'))
+        self.assertEqual(cache.get('sales:cache_stats:sales_aggregate:total:hits'), 1)
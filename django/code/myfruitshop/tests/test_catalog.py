@@ -0,0 +1,67 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from sales.catalog import catalog_version, fruit_catalog
+from sales.importer import fruit_price_snapshot
+from sales.models import Fruit, Sale
+
+
+class FruitCatalogTest(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.user: User = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_login(self.user)
+        self.apple: Fruit = Fruit.objects.create(name='Apple', price=100)
+        self.banana: Fruit = Fruit.objects.create(name='Banana', price=50, is_active=False)
+
+    def test_lookups_use_active_fruits_only(self) -> None:
+        self.assertEqual(fruit_catalog.get(self.apple.pk).price, 100)
+        self.assertIsNone(fruit_catalog.get(self.banana.pk))
+        self.assertEqual(fruit_catalog.by_name('apple', ignore_case=True).id, self.apple.pk)
+        self.assertIsNone(fruit_catalog.by_name('apple'))
+        self.assertEqual(fruit_price_snapshot(), {'Apple': (self.apple.pk, 100)})
+
+    def test_add_sale_does_not_read_fruits(self) -> None:
+        fruit_catalog.all()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('add_sales'), data={
+                'fruit': self.apple.pk, 'quantity': 3, 'sale_date': '2024-01-20 11:00'})
+        self.assertEqual(response.status_code, 302)
+
+        fruit_reads: list = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and 'sales_fruit' in query['sql']
+        ]
+        self.assertEqual(fruit_reads, [])
+        self.assertEqual(Sale.objects.get().total_amount, 300)
+
+    def test_fruit_change_reloads_catalog(self) -> None:
+        fruit_catalog.all()
+        version: int = catalog_version()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('edit_fruit', kwargs={'pk': self.apple.pk}),
+                             data={'name': 'Apple', 'price': 120})
+
+        self.assertGreater(catalog_version(), version)
+        self.assertEqual(fruit_catalog.get(self.apple.pk).price, 120)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('delete_fruit', kwargs={'pk': self.apple.pk}))
+        self.assertIsNone(fruit_catalog.get(self.apple.pk))
+
+    def test_edit_keeps_inactive_fruit_of_sale(self) -> None:
+        sale: Sale = Sale.objects.create(fruit=self.banana, quantity=2, total_amount=100,
+                                         sale_date='2024-01-20T10:00:00+09:00')
+
+        response = self.client.post(reverse('edit_sales', kwargs={'pk': sale.pk}), data={
+            'fruit': self.banana.pk, 'quantity': 4, 'sale_date': '2024-01-20 10:00'})
+
+        self.assertEqual(response.status_code, 302)
+        sale.refresh_from_db()
+        self.assertEqual((sale.fruit_id, sale.total_amount), (self.banana.pk, 200))
@@ -0,0 +1,90 @@
+from datetime import date, datetime
+from typing import Dict, List, Tuple
+
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+from django.test import TestCase
+
+from sales.aggregates import local_midnight
+from sales.columnar import SalesColumns, calendar_edges, load_rollups, load_sales, rollup_rows
+from sales.models import Fruit, Sale, SalesDailyRollup
+from sales.rollups import JST, rebuild_rollup
+
+
+class SalesColumnsTest(TestCase):
+    def setUp(self) -> None:
+        self.apple: Fruit = Fruit.objects.create(name='Apple', price=100)
+        self.banana: Fruit = Fruit.objects.create(name='Banana', price=50)
+        rows: List[Tuple[Fruit, int, datetime, bool]] = [
+            (self.apple, 1, datetime(2024, 1, 1, 0, 0, tzinfo=JST), True),
+            (self.apple, 2, datetime(2024, 1, 31, 23, 59, tzinfo=JST), True),
+            (self.banana, 3, datetime(2024, 2, 1, 0, 0, tzinfo=JST), True),
+            (self.banana, 4, datetime(2024, 2, 29, 12, 0, tzinfo=JST), True),
+            (self.apple, 5, datetime(2024, 3, 1, 9, 0, tzinfo=JST), True),
+            (self.apple, 6, datetime(2024, 2, 10, 9, 0, tzinfo=JST), False),
+        ]
+        Sale.objects.bulk_create([
+            Sale(fruit=fruit, quantity=quantity, total_amount=quantity * fruit.price, sale_date=sale_date,
+                 is_active=is_active)
+            for fruit, quantity, sale_date, is_active in rows])
+        rebuild_rollup()
+        self.start: datetime = local_midnight(date(2024, 1, 1), JST)
+        self.end: datetime = local_midnight(date(2024, 3, 1), JST)
+
+    def sql_by_month(self) -> Dict[Tuple[date, int], List[int]]:
+        rows = (Sale.objects.filter(is_active=True, sale_date__gte=self.start, sale_date__lt=self.end)
+                .annotate(month=TruncMonth('sale_date', tzinfo=JST)).values('month', 'fruit_id')
+                .annotate(amount=Sum('total_amount'), quantity=Sum('quantity'), count=Count('id')).order_by())
+        return {(row['month'].date(), row['fruit_id']): [row['amount'], row['quantity'], row['count']]
+                for row in rows}
+
+    def test_sales_group_by_month_matches_sql(self) -> None:
+        # 主キーの範囲で区切って読み込んでも全件が読み込まれること
+        columns: SalesColumns = load_sales(Sale.objects.filter(is_active=True), chunk_size=2)
+        self.assertEqual(len(columns), 5)
+        self.assertEqual(columns.nbytes, 5 * 5 * 8)
+
+        buckets, edges = calendar_edges(self.start, self.end, 'month', JST)
+        totals = columns.group_sum(columns.bucket_codes(edges), columns.fruit_ids)
+        self.assertEqual({(buckets[code], fruit_id): figures for (code, fruit_id), figures in totals.items()},
+                         self.sql_by_month())
+
+    def test_rollups_group_by_day(self) -> None:
+        columns: SalesColumns = load_rollups(rollup_rows(SalesDailyRollup.objects.all()), JST)
+        self.assertEqual(columns.fruit_names, {self.apple.pk: 'Apple', self.banana.pk: 'Banana'})
+
+        buckets, edges = calendar_edges(self.start, self.end, 'day', JST)
+        totals = columns.group_sum(columns.bucket_codes(edges))
+        # 範囲外(3月)の行は含まない。日付の境界は日本時間の0時
+        self.assertEqual({buckets[code]: figures for (code,), figures in totals.items()}, {
+            date(2024, 1, 1): [100, 1, 1],
+            date(2024, 1, 31): [200, 2, 1],
+            date(2024, 2, 1): [150, 3, 1],
+            date(2024, 2, 29): [200, 4, 1],
+        })
+
+    def test_filters(self) -> None:
+        columns: SalesColumns = load_sales(Sale.objects.filter(is_active=True))
+        february: SalesColumns = columns.between(local_midnight(date(2024, 2, 1), JST),
+                                                 local_midnight(date(2024, 3, 1), JST))
+        self.assertEqual(list(february.quantities), [3, 4])
+        self.assertEqual(list(columns.for_fruits([self.apple.pk]).amounts), [100, 200, 500])
+
+    def test_sorted_and_unsorted_columns(self) -> None:
+        # 無効な販売実績(2月10日)は主キーの順では3月1日より後になる
+        columns: SalesColumns = load_sales(Sale.objects.all())
+        self.assertFalse(columns.epoch_sorted)
+        ordered: SalesColumns = columns.sorted_by_epoch()
+        self.assertTrue(ordered.epoch_sorted)
+        february_start: datetime = local_midnight(date(2024, 2, 1), JST)
+        self.assertEqual(list(columns.between(february_start, self.end).quantities), [3, 4, 6])
+        self.assertEqual(list(ordered.between(february_start, self.end).quantities), [3, 6, 4])
+
+        # 二分探索による区間分けは、行ごとに区間番号を求める集計と同じ結果になる
+        _, edges = calendar_edges(self.start, self.end, 'month', JST)
+        expected = columns.group_sum(columns.bucket_codes(edges), columns.fruit_ids)
+        self.assertEqual(ordered.group_by_bucket(edges), expected)
+        self.assertEqual(columns.group_by_bucket(edges), expected)
+        self.assertEqual(ordered.group_sum(ordered.bucket_codes(edges), ordered.fruit_ids), expected)
+        self.assertEqual(ordered.group_by_bucket(edges, by_fruit=False),
+                         {(0,): [300, 3, 2], (1,): [950, 13, 3]})
@@ -0,0 +1,61 @@
+import csv
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from django.urls import reverse
+
+from sales.exporter import export_sales_csv
+from sales.importer import ImportResult, SaleCsvImporter
+from sales.models import Sale
+from tests.base import SalesTestCase
+
+JST = timezone(timedelta(hours=9))
+
+
+class SaleExportTest(SalesTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        Sale.objects.create(fruit=self.apple, quantity=2, total_amount=200,
+                            sale_date=datetime(2024, 1, 20, 0, 30, tzinfo=JST))
+        Sale.objects.create(fruit=self.banana, quantity=1, total_amount=50,
+                            sale_date=datetime(2024, 1, 21, 9, 0, tzinfo=JST))
+        Sale.objects.create(fruit=self.apple, quantity=1, total_amount=100,
+                            sale_date=datetime(2024, 1, 22, 9, 0, tzinfo=JST), is_active=False)
+
+    def export(self, **params) -> List[List[str]]:
+        response = self.client.get(reverse('sales_export'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        content: str = b''.join(response.streaming_content).decode('utf-8')
+        return list(csv.reader(content.splitlines()))
+
+    def test_export_uses_import_format(self) -> None:
+        self.assertEqual(self.export(), [
+            ['Apple', '2', '200', '2024-01-20 00:30'],
+            ['Banana', '1', '50', '2024-01-21 09:00'],
+        ])
+
+    def test_filters(self) -> None:
+        self.assertEqual(self.export(fruit='Banana'), [['Banana', '1', '50', '2024-01-21 09:00']])
+        self.assertEqual(self.export(start='2024-01-21', end='2024-01-22', active='all'), [
+            ['Banana', '1', '50', '2024-01-21 09:00'],
+            ['Apple', '1', '100', '2024-01-22 09:00'],
+        ])
+        self.assertEqual(self.export(active='inactive'), [['Apple', '1', '100', '2024-01-22 09:00']])
+
+    def test_invalid_filter(self) -> None:
+        response = self.client.get(reverse('sales_export'), {'start': '2024/01/20'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_chunks_cover_every_row_and_round_trip(self) -> None:
+        same_time: datetime = datetime(2024, 2, 1, 12, 0, tzinfo=JST)
+        Sale.objects.bulk_create([
+            Sale(fruit=self.apple, quantity=1, total_amount=100, sale_date=same_time) for _ in range(7)
+        ])
+        lines: List[str] = list(export_sales_csv(Sale.objects.filter(is_active=True), chunk_size=3))
+        self.assertEqual(len(lines), 9)
+
+        Sale.objects.all().delete()
+        result: ImportResult = SaleCsvImporter().run(csv.reader(lines))
+        self.assertEqual(result.imported, 9)
+        self.assertEqual(result.rejected_total, 0)
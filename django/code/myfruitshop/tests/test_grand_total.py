@@ -0,0 +1,83 @@
+from datetime import datetime
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db.models import QuerySet
+from django.urls import reverse
+
+from sales.grand_total import add_to_grand_total, compute_grand_total, grand_total, rebuild_grand_total
+from sales.importer import SaleCsvImporter
+from sales.models import Sale, SalesGrandTotal
+from sales.prefix_sums import RangeTotal
+from sales.rollups import JST
+from tests.base import SalesTestCase
+
+
+class SalesGrandTotalTest(SalesTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        Sale.objects.create(fruit=self.apple, quantity=1, total_amount=100,
+                            sale_date=datetime(2024, 1, 1, 12, tzinfo=JST))
+        Sale.objects.create(fruit=self.banana, quantity=2, total_amount=100, is_active=False,
+                            sale_date=datetime(2024, 1, 2, 12, tzinfo=JST))
+        rebuild_grand_total()
+
+    def test_writes_update_grand_total(self) -> None:
+        self.assertEqual(grand_total(), RangeTotal(100, 1, 1))
+
+        self.client.post(reverse('add_sales'), data={
+            'fruit': self.banana.pk, 'quantity': 3, 'sale_date': '2024-01-03 09:00'})
+        self.assertEqual(grand_total(), RangeTotal(250, 4, 2))
+
+        sale: Sale = Sale.objects.get(quantity=3)
+        self.client.post(reverse('edit_sales', kwargs={'pk': sale.pk}), data={
+            'fruit': self.apple.pk, 'quantity': 2, 'sale_date': '2024-01-03 09:00'})
+        self.assertEqual(grand_total(), RangeTotal(300, 3, 2))
+
+        self.client.get(reverse('delete_sale', kwargs={'pk': sale.pk}))
+        self.assertEqual(grand_total(), RangeTotal(100, 1, 1))
+
+        SaleCsvImporter().run([['Apple', '1', '100', '2024-01-02 10:00'], ['Banana', '4', '200', '2024-02-01 10:00']])
+        self.assertEqual(grand_total(), RangeTotal(400, 6, 3))
+        self.assertEqual(grand_total(), compute_grand_total())
+
+    def test_grand_total_is_one_row_read(self) -> None:
+        with self.assertNumQueries(1):
+            self.assertEqual(grand_total().amount, 100)
+
+    def test_missing_row_is_rebuilt_on_write(self) -> None:
+        SalesGrandTotal.objects.all().delete()
+        self.client.post(reverse('add_sales'), data={
+            'fruit': self.apple.pk, 'quantity': 1, 'sale_date': '2024-01-03 09:00'})
+        self.assertEqual(grand_total(), RangeTotal(200, 2, 2))
+
+    def test_row_created_concurrently_is_added_to(self) -> None:
+        # 行がないことを確かめた直後に、別の書き込みがこの変更を含まない行を作った場合
+        SalesGrandTotal.objects.filter(pk=1).update(total_amount=100, quantity=1, active_count=1)
+        Sale.objects.create(fruit=self.apple, quantity=2, total_amount=200,
+                            sale_date=datetime(2024, 1, 3, 12, tzinfo=JST))
+        update = QuerySet.update
+        calls: list = []
+
+        def miss_first_update(queryset: QuerySet, **kwargs) -> int:
+            calls.append(kwargs)
+            return 0 if len(calls) == 1 else update(queryset, **kwargs)
+
+        with patch.object(QuerySet, 'update', miss_first_update):
+            add_to_grand_total(RangeTotal(200, 2, 1))
+        self.assertEqual(grand_total(), RangeTotal(300, 3, 2))
+
+    def test_reconcile_command(self) -> None:
+        output: StringIO = StringIO()
+        call_command('reconcile_sales_total', stdout=output)
+        self.assertIn('差分はありません', output.getvalue())
+
+        Sale.objects.filter(fruit=self.banana).update(is_active=True)
+        output = StringIO()
+        call_command('reconcile_sales_total', stdout=output)
+        self.assertIn('差分があります', output.getvalue())
+        self.assertEqual(grand_total(), RangeTotal(100, 1, 1))
+
+        call_command('reconcile_sales_total', fix=True, stdout=StringIO())
+        self.assertEqual(grand_total(), RangeTotal(200, 3, 2))
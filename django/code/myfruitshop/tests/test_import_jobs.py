@@ -0,0 +1,155 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from freezegun import freeze_time
+
+from sales.importer import SaleCsvImporter
+from sales.jobs import claim_next_job, recover_stale_jobs, run_job
+from sales.models import Fruit, ImportJob, Sale
+from sales.rollups import compute_rollup, stored_rollup
+
+
+class ImportJobTest(TestCase):
+    def setUp(self) -> None:
+        self.import_dir: str = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            SALES_IMPORT_DIR=self.import_dir, SALES_IMPORT_ASYNC_THRESHOLD=0, SALES_IMPORT_BATCH_SIZE=2)
+        self.settings_override.enable()
+        self.user: User = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_login(self.user)
+        Fruit.objects.create(name='Apple', price=100)
+
+    def tearDown(self) -> None:
+        self.settings_override.disable()
+        shutil.rmtree(self.import_dir, ignore_errors=True)
+
+    def upload(self, url_name: str):
+        csv_file = BytesIO(
+            'Apple,1,100,2024-01-20 08:00\n'
+            'Apple,2,200,2024-01-20 09:00\n'
+            'Apple,3,300,2024-01-20 10:00\n'
+            'Melon,1,100,2024-01-20 10:00\n'.encode('utf-8'))
+        csv_file.name = 'sales.csv'
+        return self.client.post(reverse(url_name), data={'csv_file': csv_file})
+
+    def test_large_upload_is_queued(self) -> None:
+        response = self.upload('sales_combined')
+
+        job: ImportJob = response.context['import_job']
+        self.assertEqual(job.status, ImportJob.STATUS_QUEUED)
+        self.assertTrue(os.path.exists(job.file_path))
+        self.assertEqual(Sale.objects.count(), 0)
+
+    def test_worker_processes_job_and_reports_progress(self) -> None:
+        response = self.upload('import_jobs')
+        self.assertEqual(response.status_code, 202)
+        status_url: str = response.json()['status_url']
+
+        call_command('process_import_jobs', '--once', stdout=StringIO())
+
+        status = self.client.get(status_url).json()
+        self.assertEqual(status['status'], ImportJob.STATUS_DONE)
+        self.assertEqual(status['rows_processed'], 4)
+        self.assertEqual(status['rows_imported'], 3)
+        self.assertEqual(status['rows_rejected'], 1)
+        self.assertEqual(status['rejected_reasons'], {'unknown_fruit': 1})
+        self.assertEqual(status['bytes_processed'], status['file_size'])
+        self.assertEqual(status['eta_seconds'], 0.0)
+        self.assertEqual(Sale.objects.count(), 3)
+        self.assertEqual(os.listdir(self.import_dir), [])
+
+    def test_missing_file_marks_job_failed(self) -> None:
+        job: ImportJob = ImportJob.objects.create(file_path=os.path.join(self.import_dir, 'missing.csv'))
+
+        call_command('process_import_jobs', '--once', stdout=StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.STATUS_FAILED)
+        self.assertTrue(job.error)
+
+    def test_failed_job_discards_committed_batches(self) -> None:
+        response = self.upload('import_jobs')
+        save_batch = SaleCsvImporter.save_batch
+        saved: list = []
+
+        def fail_on_second_batch(importer, batch, deltas, result) -> None:
+            # 1バッチ目(2件)をコミットした後に失敗させる
+            if saved:
+                raise RuntimeError('disk full')
+            saved.append(batch)
+            save_batch(importer, batch, deltas, result)
+
+        with patch.object(SaleCsvImporter, 'save_batch', fail_on_second_batch):
+            call_command('process_import_jobs', '--once', stdout=StringIO())
+
+        status = self.client.get(response.json()['status_url']).json()
+        self.assertEqual((status['status'], status['error'], status['rows_imported']),
+                         (ImportJob.STATUS_FAILED, 'disk full', 0))
+        self.assertEqual(len(saved), 1)
+        self.assertEqual(Sale.objects.count(), 0)
+        self.assertEqual(stored_rollup(), {})
+
+    def start_and_kill_worker(self) -> ImportJob:
+        # ワーカーがジョブを確保し、1バッチ目(2件)をコミットした後に強制終了された状態を作る
+        self.upload('import_jobs')
+        job: ImportJob = claim_next_job()
+        SaleCsvImporter(import_batch=job.import_batch).run_in_batches(
+            [['Apple', '1', '100', '2024-01-20 08:00'], ['Apple', '2', '200', '2024-01-20 09:00']])
+        self.assertEqual(Sale.objects.filter(import_batch=job.import_batch).count(), 2)
+        return job
+
+    def test_stalled_job_is_discarded_and_requeued(self) -> None:
+        with freeze_time('2024-01-20 00:00:00'):
+            job: ImportJob = self.start_and_kill_worker()
+        with freeze_time('2024-01-20 00:09:59'):
+            self.assertEqual(recover_stale_jobs(), [])
+
+        with freeze_time('2024-01-20 00:10:01'):
+            output: StringIO = StringIO()
+            call_command('process_import_jobs', '--once', stdout=output)
+
+        self.assertIn(f'job={job.pk} recovered', output.getvalue())
+        job.refresh_from_db()
+        # 前回の分は取り消され、2回目の確保で全件を取り込み直す
+        self.assertEqual((job.status, job.attempts, job.rows_imported), (ImportJob.STATUS_DONE, 2, 3))
+        self.assertEqual(list(Sale.objects.values_list('import_batch', flat=True).distinct()), [f'job-{job.pk}-2'])
+        self.assertEqual(Sale.objects.count(), 3)
+        self.assertEqual(stored_rollup(), compute_rollup())
+
+    @override_settings(SALES_IMPORT_MAX_ATTEMPTS=1)
+    def test_stalled_job_fails_after_max_attempts(self) -> None:
+        with freeze_time('2024-01-20 00:00:00'):
+            job: ImportJob = self.start_and_kill_worker()
+        with freeze_time('2024-01-20 00:11:00'):
+            self.assertEqual(recover_stale_jobs(), [job.pk])
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.rows_imported), (ImportJob.STATUS_FAILED, 0))
+        self.assertTrue(job.error)
+        self.assertEqual(Sale.objects.count(), 0)
+        self.assertEqual(stored_rollup(), {})
+
+    def test_worker_stops_writing_after_its_job_is_taken_over(self) -> None:
+        self.upload('import_jobs')
+        job: ImportJob = claim_next_job()
+        save_batch = SaleCsvImporter.save_batch
+
+        def taken_over_during_batch(importer, batch, deltas, result) -> None:
+            # 1バッチ目の処理が長引き、その間に別のワーカーが取り戻して待機中に戻した
+            save_batch(importer, batch, deltas, result)
+            ImportJob.objects.filter(pk=job.pk).update(status=ImportJob.STATUS_QUEUED)
+
+        with patch.object(SaleCsvImporter, 'save_batch', taken_over_during_batch):
+            job = run_job(job)
+
+        # 自分のバッチは取り消し、ジョブの状態は取り戻した側のまま
+        self.assertEqual(job.status, ImportJob.STATUS_QUEUED)
+        self.assertEqual(Sale.objects.count(), 0)
+        self.assertEqual(stored_rollup(), {})
@@ -0,0 +1,71 @@
+from io import BytesIO
+from typing import List
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.urls import reverse
+
+from sales.importer import ImportResult, SaleCsvImporter
+from sales.models import Fruit, Sale
+from sales.rollups import compute_rollup, stored_rollup
+
+
+class SaleCsvImporterTest(TestCase):
+    def setUp(self) -> None:
+        Fruit.objects.create(name='Apple', price=100)
+        Fruit.objects.create(name='Banana', price=50)
+        Fruit.objects.create(name='Grape', price=300, is_active=False)
+
+    def test_rejected_rows_are_counted_per_reason(self) -> None:
+        rows: List[List[str]] = [
+            ['Apple', '2', '200', '2024-01-20 08:00'],
+            ['Banana', '1', '50', '2024-01-20 09:00'],
+            ['Apple', '2', '200'],
+            ['Grape', '1', '300', '2024-01-20 10:00'],
+            ['Melon', '1', '300', '2024-01-20 10:00'],
+            ['Apple', 'two', '200', '2024-01-20 10:00'],
+            ['Apple', '2', '200', '2024/01/20 10:00'],
+            ['Apple', '2', '150', '2024-01-20 10:00'],
+        ]
+        result: ImportResult = SaleCsvImporter().run(rows)
+
+        self.assertEqual(result.imported, 2)
+        self.assertEqual(result.rejected, {
+            'column_count': 1,
+            'unknown_fruit': 2,
+            'invalid_number': 1,
+            'invalid_date': 1,
+            'amount_mismatch': 1,
+        })
+        self.assertEqual(result.rejected_total, 6)
+        self.assertEqual(Sale.objects.count(), 2)
+        self.assertEqual(stored_rollup(), compute_rollup())
+
+    def test_queries_do_not_grow_with_rows(self) -> None:
+        rows: List[List[str]] = [['Apple', '1', '100', '2024-01-20 08:00']] * 250
+        with CaptureQueriesContext(connection) as queries:
+            result: ImportResult = SaleCsvImporter(batch_size=100).run(rows)
+
+        self.assertEqual(result.imported, 250)
+        inserts = [q for q in queries.captured_queries if q['sql'].startswith('INSERT INTO "sales_sale"')]
+        self.assertEqual(len(inserts), 3)
+        self.assertLess(len(queries.captured_queries), 15)
+
+
+class SaleCombinedViewImportTest(TestCase):
+    def setUp(self) -> None:
+        self.user: User = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_login(self.user)
+        Fruit.objects.create(name='Apple', price=100)
+
+    @override_settings(SALES_IMPORT_BATCH_SIZE=1)
+    def test_response_reports_import_result(self) -> None:
+        csv_file = BytesIO('Apple,2,200,2024-01-20 08:00\nApple,2,1,2024-01-20 08:00\n'.encode('utf-8'))
+        csv_file.name = 'sales.csv'
+        response = self.client.post(reverse('sales_combined'), data={'csv_file': csv_file})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['import_result'].imported, 1)
+        self.assertContains(response, '売り上げが単価と一致しない: 1 件')
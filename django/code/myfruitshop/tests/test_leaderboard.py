@@ -0,0 +1,112 @@
+import random
+from datetime import date, datetime
+from typing import List, Tuple
+
+from django.test import TestCase
+from django.urls import reverse
+from freezegun import freeze_time
+
+from sales.leaderboard import FruitRank, fruit_totals, leaderboard, prefix_fruit_totals, top_k
+from sales.models import Fruit, Sale
+from sales.rollups import JST, rebuild_rollup
+from tests.base import SalesTestCase
+
+
+class TopKTest(TestCase):
+    def test_matches_full_sort(self) -> None:
+        rng: random.Random = random.Random(0)
+        rows: List[Tuple[int, str, int, int, int]] = [
+            (fruit_id, f'fruit-{fruit_id}', rng.randint(0, 50) * 100, rng.randint(0, 30), 1)
+            for fruit_id in range(1, 2001)]
+        board = top_k(iter(rows), 10)
+        for metric, index in (('amount', 2), ('quantity', 3)):
+            # 同じ値の場合は果物IDの小さい順
+            expected = sorted(rows, key=lambda row: (-row[index], row[0]))[:10]
+            self.assertEqual(board[metric], [FruitRank(*row) for row in expected])
+
+        self.assertEqual(len(top_k(iter(rows[:3]), 10)['amount']), 3)
+
+
+class SalesLeaderboardTest(SalesTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.cherry: Fruit = Fruit.objects.create(name='Cherry', price=300)
+        rows: List[Tuple[Fruit, int, datetime, bool]] = [
+            (self.apple, 3, datetime(2024, 1, 20, 10, tzinfo=JST), True),
+            (self.banana, 10, datetime(2024, 1, 20, 11, tzinfo=JST), True),
+            (self.cherry, 1, datetime(2024, 1, 16, 9, tzinfo=JST), True),
+            (self.cherry, 2, datetime(2024, 1, 5, 9, tzinfo=JST), True),
+            # 論理削除済み
+            (self.apple, 50, datetime(2024, 1, 20, 12, tzinfo=JST), False),
+        ]
+        Sale.objects.bulk_create([
+            Sale(fruit=fruit, quantity=quantity, total_amount=quantity * fruit.price, sale_date=sale_date,
+                 is_active=is_active)
+            for fruit, quantity, sale_date, is_active in rows])
+        rebuild_rollup()
+
+    def api(self, **params) -> dict:
+        response = self.client.get(reverse('sales_leaderboard_api'), params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_api_ranks_by_amount_and_quantity(self) -> None:
+        data: dict = self.api(**{'from': '2024-01-01', 'to': '2024-01-31', 'k': 2})
+        self.assertEqual([(rank['fruit'], rank['amount']) for rank in data['amount']],
+                         [('Cherry', 900), ('Banana', 500)])
+        self.assertEqual([(rank['fruit'], rank['quantity']) for rank in data['quantity']],
+                         [('Banana', 10), ('Apple', 3)])
+        self.assertEqual(data['amount'][0]['count'], 2)
+
+        # 日本時間以外は販売実績から集計する(ロサンゼルスでは1/20 10:00 JSTは1/19)
+        data = self.api(**{'from': '2024-01-19', 'to': '2024-01-19', 'tz': 'America/Los_Angeles'})
+        self.assertEqual([rank['fruit'] for rank in data['amount']], ['Banana', 'Apple'])
+
+    def test_cached_per_window_and_invalidated_on_write(self) -> None:
+        params: dict = {'from': '2024-01-20', 'to': '2024-01-20'}
+        self.assertEqual(self.api(**params)['amount'][0]['fruit'], 'Banana')
+        with self.assertNumQueries(2):
+            # セッションとユーザーの取得のみ
+            self.api(**params)
+
+        # 集計キャッシュの版はコミット後に進む
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('add_sales'), data={
+                'fruit': self.cherry.pk, 'quantity': 5, 'sale_date': '2024-01-20 15:00'})
+        self.assertEqual(self.api(**params)['amount'][0], {
+            'fruit_id': self.cherry.pk, 'fruit': 'Cherry', 'amount': 1500, 'quantity': 5, 'count': 1})
+
+    def test_long_ranges_use_prefix_sums(self) -> None:
+        # 長い期間は累計の差で求め、日次集計を集計した結果と一致すること
+        for start, end in ((date(2024, 1, 1), date(2024, 1, 31)), (date(2024, 1, 6), date(2024, 1, 20)),
+                           (None, date(2024, 1, 19)), (date(2024, 1, 21), date(2024, 3, 1))):
+            with self.subTest(start=start, end=end):
+                self.assertEqual(top_k(prefix_fruit_totals(start, end), 3),
+                                 top_k(fruit_totals(start, end, JST).iterator(), 3))
+        with self.assertNumQueries(1):
+            self.assertEqual(leaderboard(date(2024, 1, 1), date(2024, 1, 31), JST, 1)['quantity'][0].fruit, 'Banana')
+
+    def test_invalid_requests(self) -> None:
+        url: str = reverse('sales_leaderboard_api')
+        self.assertEqual(self.client.get(url, {'k': 0}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'k': 1000}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'from': '2024-02-01', 'to': '2024-01-01'}).status_code, 400)
+
+    @freeze_time('2024-01-20 03:00:00')
+    def test_statistics_page_panel(self) -> None:
+        response = self.client.get(reverse('sales_aggregate'), {'from': '2024-01-01', 'to': '2024-01-10'})
+        boards: List[dict] = response.context['leaderboards']
+        self.assertEqual([(board['label'], board['start'], board['end']) for board in boards], [
+            ('今日', date(2024, 1, 20), date(2024, 1, 20)),
+            ('今週', date(2024, 1, 15), date(2024, 1, 20)),
+            ('今月', date(2024, 1, 1), date(2024, 1, 20)),
+            ('指定期間', date(2024, 1, 1), date(2024, 1, 10)),
+        ])
+        self.assertEqual([[rank.fruit for rank in board['amount']] for board in boards],
+                         [['Banana', 'Apple'], ['Banana', 'Apple', 'Cherry'],
+                          ['Cherry', 'Banana', 'Apple'], ['Cherry']])
+        self.assertContains(response, '売れ筋')
+
+        # 非同期版も同じ内容
+        response = self.client.get(reverse('sales_aggregate_async'), {'from': '2024-01-01', 'to': '2024-01-10'})
+        self.assertEqual(response.context['leaderboards'], boards)
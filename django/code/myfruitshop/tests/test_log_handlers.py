@@ -0,0 +1,118 @@
+import glob
+import logging
+import os
+import tempfile
+import unittest
+
+from django.test import SimpleTestCase
+
+from myfruitshop.log_handlers import QueuedFileHandler, SamplingFilter
+
+
+def make_record(level: int = logging.DEBUG, message: str = 'SELECT 1') -> logging.LogRecord:
+    return logging.LogRecord('django.db.backends', level, __file__, 1, message, None, None)
+
+
+class QueuedFileHandlerTest(SimpleTestCase):
+    def setUp(self) -> None:
+        self.directory: tempfile.TemporaryDirectory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path: str = os.path.join(self.directory.name, 'debug.log')
+
+    def test_writes_in_background_and_rotates_by_size(self) -> None:
+        handler: QueuedFileHandler = QueuedFileHandler(self.path, max_bytes=200, backup_count=2)
+        self.addCleanup(handler.close)
+        handler.setFormatter(logging.Formatter('%(levelname)s %(message)s'))
+
+        for index in range(20):
+            handler.handle(make_record(logging.INFO, f"line {index:02d} {'x' * 20}"))
+        handler.flush()
+
+        self.assertTrue(os.path.exists(self.path + '.1'))
+        self.assertFalse(os.path.exists(self.path + '.3'))
+        with open(self.path, encoding='utf-8') as file:
+            self.assertTrue(file.read().rstrip().endswith('line 19 ' + 'x' * 20))
+
+    def test_full_queue_drops_instead_of_blocking(self) -> None:
+        handler: QueuedFileHandler = QueuedFileHandler(self.path, queue_size=1)
+        self.addCleanup(handler.close)
+        handler.listener.stop()
+        handler.listening = False
+
+        for _ in range(3):
+            handler.handle(make_record())
+
+        self.assertEqual(handler.dropped, 2)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'requires fork')
+    def test_forked_child_restarts_writer(self) -> None:
+        handler: QueuedFileHandler = QueuedFileHandler(self.path)
+        self.addCleanup(handler.close)
+        handler.setFormatter(logging.Formatter('%(process)d %(message)s'))
+        handler.handle(make_record(logging.INFO, 'from parent'))
+        handler.flush()
+
+        pid: int = os.fork()
+        if pid == 0:
+            # 子プロセス(ワーカー)からのログも、終了時にファイルへ書き出される
+            try:
+                handler.handle(make_record(logging.INFO, 'from child'))
+                handler.close()
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+
+        with open(self.path, encoding='utf-8') as file:
+            lines: list = file.read().splitlines()
+        self.assertEqual([line.split(' ', 1)[1] for line in lines], ['from parent', 'from child'])
+        self.assertNotEqual(lines[1].split(' ')[0], str(os.getpid()))
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'requires fork')
+    def test_processes_sharing_a_file_rotate_without_losing_lines(self) -> None:
+        # gunicornのワーカーのように、ハンドラーを作った後にforkしたプロセスが同時に同じファイルへ書き込み、
+        # それぞれがローテーションする。同じファイルを二重にローテーションしなければ全行が残る
+        handler: QueuedFileHandler = QueuedFileHandler(self.path, max_bytes=1000, backup_count=1000)
+        self.addCleanup(handler.close)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        expected: list = [f'worker {worker} line {index:04d}' for worker in range(4) for index in range(2000)]
+
+        start_reader, start_writer = os.pipe()
+        pids: list = []
+        for worker in range(4):
+            pid: int = os.fork()
+            if pid == 0:
+                try:
+                    # 全プロセスがそろってから書き始める
+                    os.close(start_writer)
+                    os.read(start_reader, 1)
+                    for index in range(2000):
+                        handler.handle(make_record(logging.INFO, f'worker {worker} line {index:04d}'))
+                    handler.close()
+                finally:
+                    os._exit(0)
+            pids.append(pid)
+        os.close(start_reader)
+        os.close(start_writer)
+        for pid in pids:
+            os.waitpid(pid, 0)
+
+        lines: list = []
+        for path in glob.glob(self.path + '*'):
+            if not path.endswith('.lock'):
+                with open(path, encoding='utf-8') as file:
+                    lines.extend(file.read().splitlines())
+        self.assertEqual(sorted(lines), sorted(expected))
+
+    def test_rejects_unknown_rotation(self) -> None:
+        with self.assertRaises(ValueError):
+            QueuedFileHandler(self.path, rotation='weekly')
+
+
+class SamplingFilterTest(SimpleTestCase):
+    def test_keeps_one_in_every_n_below_warning(self) -> None:
+        sampling: SamplingFilter = SamplingFilter(every=10)
+
+        kept: int = sum(sampling.filter(make_record()) for _ in range(100))
+        warnings: int = sum(sampling.filter(make_record(logging.WARNING)) for _ in range(5))
+
+        self.assertEqual((kept, warnings), (10, 5))
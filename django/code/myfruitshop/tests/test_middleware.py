@@ -0,0 +1,71 @@
+import json
+from typing import Any
+
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from myfruitshop.middleware import RequestMetricsMiddleware
+from sales.models import Fruit
+
+
+def fruit_names_one_by_one(request: Any) -> HttpResponse:
+    # 1件ずつ取得するN+1のパターン
+    names: list = [Fruit.objects.get(pk=pk).name for pk in Fruit.objects.values_list('pk', flat=True)]
+    return HttpResponse(','.join(names))
+
+
+async def fruit_names_async(request: Any) -> HttpResponse:
+    names: list = [name async for name in Fruit.objects.values_list('name', flat=True)]
+    return HttpResponse(','.join(names))
+
+
+class RequestMetricsMiddlewareTest(TestCase):
+    def setUp(self) -> None:
+        self.factory: RequestFactory = RequestFactory()
+        for index in range(3):
+            Fruit.objects.create(name=f'Fruit {index}', price=100)
+
+    def test_server_timing_and_log_line(self) -> None:
+        user: User = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_login(user)
+
+        with self.assertLogs('myfruitshop.requests', 'INFO') as logs:
+            response = self.client.get(reverse('fruit'))
+
+        self.assertRegex(response['Server-Timing'],
+                         r'^db;dur=[\d.]+;desc="3 queries", dup;desc="0 duplicated", view;dur=[\d.]+$')
+        record: dict = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['path'], record['status'], record['queries']), ('/sales/fruit/', 200, 3))
+
+    def test_duplicated_queries_are_reported(self) -> None:
+        middleware: RequestMetricsMiddleware = RequestMetricsMiddleware(fruit_names_one_by_one)
+
+        with self.assertLogs('myfruitshop.requests', 'INFO') as logs:
+            response: HttpResponse = middleware(self.factory.get('/'))
+
+        self.assertIn('dup;desc="2 duplicated"', response['Server-Timing'])
+        record: dict = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['queries'], 4)
+        self.assertEqual(record['duplicates'][0]['count'], 3)
+
+    async def test_async_view_is_awaited_directly(self) -> None:
+        middleware: RequestMetricsMiddleware = RequestMetricsMiddleware(fruit_names_async)
+
+        with self.assertLogs('myfruitshop.requests', 'INFO'):
+            response: HttpResponse = await middleware(self.factory.get('/'))
+
+        self.assertEqual(response.content, b'Fruit 0,Fruit 1,Fruit 2')
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+    @override_settings(REQUEST_METRICS_SLOW_MS=0)
+    def test_slow_request_dumps_queries(self) -> None:
+        middleware: RequestMetricsMiddleware = RequestMetricsMiddleware(fruit_names_one_by_one)
+
+        with self.assertLogs('myfruitshop.requests', 'WARNING') as logs:
+            middleware(self.factory.get('/'))
+
+        record: dict = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(len(record['slow_queries']), 4)
+        self.assertIn('sales_fruit', record['slow_queries'][0]['sql'])
@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from sales.models import Fruit, Sale
+from sales.pagination import KeysetPage, KeysetPaginator
+from sales.rollups import rebuild_rollup
+
+
+class KeysetPaginatorTest(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        fruit: Fruit = Fruit.objects.create(name='Apple', price=100)
+        start: datetime = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        # 同じ販売日時の行を含めてもページの境界で重複・欠落しないことを確認する
+        Sale.objects.bulk_create([
+            Sale(fruit=fruit, quantity=1, total_amount=100, sale_date=start + timedelta(hours=index // 3))
+            for index in range(25)
+        ])
+        Sale.objects.create(fruit=fruit, quantity=1, total_amount=100, sale_date=start, is_active=False)
+        rebuild_rollup()
+        self.queryset = Sale.objects.filter(is_active=True).order_by('-sale_date', '-id')
+        self.expected: List[int] = list(self.queryset.values_list('id', flat=True))
+
+    def test_walk_forward_and_backward(self) -> None:
+        paginator: KeysetPaginator = KeysetPaginator(self.queryset, 10)
+        pages: List[KeysetPage] = [paginator.get_page(None)]
+        while pages[-1].has_next:
+            pages.append(paginator.get_page(pages[-1].next_cursor))
+
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual([sale.pk for page in pages for sale in page], self.expected)
+        self.assertFalse(pages[0].has_previous)
+
+        previous: KeysetPage = paginator.get_page(pages[2].previous_cursor)
+        self.assertEqual([sale.pk for sale in previous], [sale.pk for sale in pages[1]])
+        first: KeysetPage = paginator.get_page(previous.previous_cursor)
+        self.assertEqual([sale.pk for sale in first], [sale.pk for sale in pages[0]])
+        self.assertFalse(first.has_previous)
+
+        last: KeysetPage = paginator.get_page(pages[0].last_cursor)
+        self.assertEqual([sale.pk for sale in last], self.expected[-10:])
+        self.assertFalse(last.has_next)
+
+    def test_invalid_cursor_falls_back_to_first_page(self) -> None:
+        page: KeysetPage = KeysetPaginator(self.queryset, 10).get_page('not-a-cursor')
+        self.assertEqual([sale.pk for sale in page], self.expected[:10])
+        self.assertEqual(page.count, 25)
+
+    def test_list_view_does_not_count_sales(self) -> None:
+        user: User = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_login(user)
+        first = self.client.get(reverse('sales_combined'))
+        cursor: Optional[str] = first.context['sales'].next_cursor
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('sales_combined'), {'cursor': cursor})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '約 25 件')
+        self.assertFalse([q for q in queries.captured_queries if 'COUNT(' in q['sql']])
+
+
+class SalesListFragmentCacheTest(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.user: User = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_login(self.user)
+        self.fruit: Fruit = Fruit.objects.create(name='Apple', price=100)
+        Sale.objects.bulk_create([
+            Sale(fruit=self.fruit, quantity=index + 1, total_amount=100 * (index + 1),
+                 sale_date=datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(hours=index))
+            for index in range(15)
+        ])
+        rebuild_rollup()
+
+    def table(self, **params) -> str:
+        content: str = self.client.get(reverse('sales_combined'), params).content.decode('utf-8')
+        return content[content.index('<table'):content.index('</ul>')]
+
+    def test_cached_table_skips_sales_query(self) -> None:
+        first: str = self.table()
+        with CaptureQueriesContext(connection) as queries:
+            second: str = self.table()
+
+        self.assertEqual(first, second)
+        self.assertFalse([q for q in queries.captured_queries if 'sales_sale' in q['sql']])
+        # ページごとに別の断片になる
+        self.assertNotEqual(self.table(page=2), first)
+
+    def test_writes_and_fruit_changes_replace_the_table(self) -> None:
+        self.table()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('add_sales'), data={
+                'fruit': self.fruit.pk, 'quantity': 99, 'sale_date': '2024-02-01 09:00'})
+        self.assertIn('<td>99</td>', self.table())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('edit_fruit', kwargs={'pk': self.fruit.pk}),
+                             data={'name': 'Green Apple', 'price': 100})
+        self.assertIn('Green Apple', self.table())
@@ -0,0 +1,89 @@
+import csv
+import os
+import shutil
+import tempfile
+from typing import List, Tuple
+
+from django.test import TestCase
+
+from sales.importer import ImportResult, SaleCsvImporter
+from sales.jobs import ByteCountingReader
+from sales.models import Fruit, Sale
+from sales.parallel_import import ParallelSaleImporter, byte_ranges, split_ranges
+from sales.rollups import compute_rollup, stored_rollup
+
+
+class ParallelSaleImporterTest(TestCase):
+    def setUp(self) -> None:
+        self.directory: str = tempfile.mkdtemp()
+        self.path: str = os.path.join(self.directory, 'sales.csv')
+        Fruit.objects.create(name='Apple', price=100)
+        Fruit.objects.create(name='Banana', price=50)
+
+        lines: List[str] = []
+        for index in range(200):
+            if index % 10 == 0:
+                lines.append(f'Apple,{index % 7 + 1},1,2024-01-{index % 28 + 1:02d} 10:00')
+            elif index % 2:
+                lines.append(f'Apple,{index % 7 + 1},{(index % 7 + 1) * 100},2024-01-{index % 28 + 1:02d} 10:00')
+            else:
+                lines.append(f'Banana,{index % 5 + 1},{(index % 5 + 1) * 50},2024-02-{index % 28 + 1:02d} 23:30')
+        with open(self.path, 'w', encoding='utf-8') as file:
+            file.write('\n'.join(lines) + '\n')
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_split_ranges_follow_line_boundaries(self) -> None:
+        with open(self.path, 'rb') as file:
+            content: bytes = file.read()
+
+        ranges = split_ranges(self.path, 7)
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], len(content))
+        for (_, end), (start, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(end, start)
+            self.assertEqual(content[start - 1:start], b'\n')
+
+    def test_parallel_import_matches_serial_validation(self) -> None:
+        result: ImportResult = ParallelSaleImporter(workers=2, batch_size=30).run(self.path)
+
+        self.assertEqual(result.imported, 180)
+        self.assertEqual(result.rejected, {'amount_mismatch': 20})
+        self.assertEqual(Sale.objects.count(), 180)
+        self.assertEqual(stored_rollup(), compute_rollup())
+
+    def test_ranges_are_bounded_by_bytes(self) -> None:
+        # ファイルが大きくなっても1範囲の大きさは変わらず、範囲の数が増える
+        ranges = byte_ranges(self.path, 512, 2)
+        self.assertGreater(len(ranges), 2)
+        for start, end in ranges:
+            # 境界を行頭まで進めた分(1行未満)だけ超えることがある
+            self.assertLess(end - start, 512 + 40)
+
+        result: ImportResult = ParallelSaleImporter(workers=2, batch_size=30, range_bytes=512).run(self.path)
+        self.assertEqual((result.imported, result.rejected), (180, {'amount_mismatch': 20}))
+        self.assertEqual(stored_rollup(), compute_rollup())
+
+    def test_line_separators_inside_quotes_match_serial_import(self) -> None:
+        # 引用符の中の\r・\x0b・\u2028などは値の一部(行の区切りではない)
+        names: List[str] = ['Kiwi\rGold', 'Kiwi\x0bGold', 'Kiwi\u2028Gold', 'Kiwi\x1cGold']
+        for name in names:
+            Fruit.objects.create(name=name, price=80)
+        with open(self.path, 'a', encoding='utf-8', newline='') as file:
+            csv.writer(file, lineterminator='\n').writerows(
+                [[name, 2, 160, '2024-03-01 10:00'] for name in names] + [['Kiwi\rGold', 1, 1, '2024-03-02 10:00']])
+
+        def imported_sales() -> List[Tuple[str, int, int]]:
+            return sorted(Sale.objects.values_list('fruit__name', 'quantity', 'total_amount'))
+
+        parallel: ImportResult = ParallelSaleImporter(workers=2, batch_size=30).run(self.path)
+        parallel_sales: List[Tuple[str, int, int]] = imported_sales()
+        Sale.objects.all().delete()
+        with open(self.path, 'rb') as file:
+            # バックグラウンド取り込み(1プロセス)と同じ読み方
+            serial: ImportResult = SaleCsvImporter(batch_size=30).run(csv.reader(ByteCountingReader(file)))
+
+        self.assertEqual((parallel.imported, parallel.rejected), (serial.imported, serial.rejected))
+        self.assertEqual((serial.imported, serial.rejected), (184, {'amount_mismatch': 21}))
+        self.assertEqual(parallel_sales, imported_sales())
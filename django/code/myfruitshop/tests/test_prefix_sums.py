@@ -0,0 +1,111 @@
+from datetime import date, datetime
+from io import StringIO
+from typing import Optional
+
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count, Sum
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from sales.importer import SaleCsvImporter
+from sales.models import Fruit, Sale
+from sales.prefix_sums import (
+    RangeTotal, expected_prefix_sums, prefix_index, range_total, stored_prefix_sums,
+)
+from sales.rollups import JST, RollupDeltas, SaleFigures, apply_deltas, day_bounds, rebuild_rollup
+from tests.base import SalesTestCase
+
+
+class SalesPrefixSumTest(SalesTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        for day, fruit, quantity in [(1, self.apple, 1), (1, self.banana, 2), (5, self.apple, 3), (20, self.banana, 4)]:
+            Sale.objects.create(fruit=fruit, quantity=quantity, total_amount=quantity * fruit.price,
+                                sale_date=datetime(2024, 1, day, 12, tzinfo=JST))
+        rebuild_rollup()
+
+    def direct_total(self, start: Optional[date], end: Optional[date], fruit: Optional[Fruit] = None) -> RangeTotal:
+        sales = Sale.objects.filter(day_bounds(start, end), is_active=True)
+        if fruit is not None:
+            sales = sales.filter(fruit=fruit)
+        row: dict = sales.aggregate(amount=Sum('total_amount'), quantity=Sum('quantity'), count=Count('id'))
+        return RangeTotal(row['amount'] or 0, row['quantity'] or 0, row['count'])
+
+    def test_range_total_matches_sales(self) -> None:
+        for start, end in [(None, None), (date(2024, 1, 1), date(2024, 1, 1)), (date(2024, 1, 2), date(2024, 1, 19)),
+                           (date(2024, 1, 5), None), (None, date(2023, 12, 31)), (date(2024, 1, 6), date(2024, 2, 1))]:
+            for fruit in (None, self.apple, self.banana):
+                with self.subTest(start=start, end=end, fruit=fruit):
+                    fruit_id: Optional[int] = fruit.pk if fruit else None
+                    expected: RangeTotal = self.direct_total(start, end, fruit)
+                    self.assertEqual(range_total(start, end, fruit_id), expected)
+                    self.assertEqual(prefix_index.range_total(start, end, fruit_id), expected)
+
+    def test_writes_keep_prefix_sums_in_sync(self) -> None:
+        self.client.post(reverse('add_sales'), data={
+            'fruit': self.apple.pk, 'quantity': 2, 'sale_date': '2024-01-20 09:00'})
+        self.client.post(reverse('add_sales'), data={
+            'fruit': self.banana.pk, 'quantity': 1, 'sale_date': '2024-01-03 09:00'})
+        self.assertEqual(stored_prefix_sums(), expected_prefix_sums())
+
+        sale: Sale = Sale.objects.get(quantity=3)
+        self.client.post(reverse('edit_sales', kwargs={'pk': sale.pk}), data={
+            'fruit': self.banana.pk, 'quantity': 6, 'sale_date': '2024-01-25 09:00'})
+        self.assertEqual(stored_prefix_sums(), expected_prefix_sums())
+
+        self.client.get(reverse('delete_sale', kwargs={'pk': Sale.objects.get(quantity=1, fruit=self.apple).pk}))
+        self.assertEqual(stored_prefix_sums(), expected_prefix_sums())
+
+        SaleCsvImporter().run([['Apple', '1', '100', '2024-01-02 10:00'], ['Apple', '2', '200', '2024-02-01 10:00'],
+                               ['Banana', '1', '50', '2024-01-02 10:00']])
+        self.assertEqual(stored_prefix_sums(), expected_prefix_sums())
+        self.assertEqual(range_total(None, None), self.direct_total(None, None))
+
+    def test_in_memory_index_reloads_after_writes(self) -> None:
+        before: RangeTotal = prefix_index.range_total(None, None)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('add_sales'), data={
+                'fruit': self.apple.pk, 'quantity': 2, 'sale_date': '2024-01-20 09:00'})
+
+        self.assertEqual(prefix_index.range_total(None, None), before + RangeTotal(200, 2, 1))
+        with self.assertNumQueries(0):
+            prefix_index.range_total(date(2024, 1, 1), date(2024, 1, 31))
+
+    def test_range_view(self) -> None:
+        response = self.client.get(reverse('sales_range_total'), {'from': '2024-01-02', 'to': '2024-01-31',
+                                                                   'fruit': 'Banana'})
+        self.assertEqual(response.json(), {'from': '2024-01-02', 'to': '2024-01-31', 'fruit': 'Banana',
+                                           'amount': 200, 'quantity': 4, 'count': 1})
+
+        self.assertEqual(self.client.get(reverse('sales_range_total'), {'fruit': 'Cherry'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('sales_range_total'), {'from': '2024-02-01',
+                                                                        'to': '2024-01-01'}).status_code, 400)
+
+    def test_rebuild_command(self) -> None:
+        Sale.objects.filter(fruit=self.banana).update(total_amount=0)
+        rebuild_rollup(date(2024, 1, 10))
+        output: StringIO = StringIO()
+        call_command('rebuild_sales_prefix_sums', check=True, stdout=output)
+        self.assertIn('差分はありません', output.getvalue())
+
+        self.assertEqual(range_total(date(2024, 1, 10), None, self.banana.pk), RangeTotal(0, 4, 1))
+        self.assertEqual(range_total(None, date(2024, 1, 9), self.banana.pk), RangeTotal(100, 2, 1))
+        call_command('rebuild_sales_prefix_sums', stdout=StringIO())
+        self.assertEqual(stored_prefix_sums(), expected_prefix_sums())
+        self.assertEqual(range_total(None, None) - range_total(None, date(2024, 1, 9)),
+                         RangeTotal(0, 4, 1))
+
+    def test_writes_are_serialised_on_grand_total_row(self) -> None:
+        # 累計の更新より先に全体の累計の行を更新(コミットまでロック)する。
+        # 果物を変えるだけの訂正(全体の増減が0)でも同じ
+        deltas: RollupDeltas = RollupDeltas()
+        sale_date: datetime = datetime(2024, 1, 5, 12, tzinfo=JST)
+        deltas.add(SaleFigures(sale_date, self.apple.pk, 300, 3, True), sign=-1)
+        deltas.add(SaleFigures(sale_date, self.banana.pk, 300, 3, True))
+
+        with CaptureQueriesContext(connection) as queries:
+            apply_deltas(deltas)
+        self.assertTrue(queries.captured_queries[0]['sql'].startswith('UPDATE "sales_salesgrandtotal"'))
+        self.assertEqual(stored_prefix_sums(), expected_prefix_sums())
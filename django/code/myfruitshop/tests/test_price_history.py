@@ -0,0 +1,75 @@
+import pickle
+from datetime import datetime, timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from sales.catalog import fruit_catalog
+from sales.importer import ImportResult, SaleCsvImporter
+from sales.models import Fruit, FruitPriceHistory, Sale
+from sales.price_history import PriceSchedule
+from sales.rollups import JST
+
+
+class FruitPriceHistoryTest(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.user: User = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_login(self.user)
+        self.apple: Fruit = Fruit.objects.create(name='Apple', price=100)
+        # 2024-02-01から単価が120円に上がったものとする
+        self.change: datetime = datetime(2024, 2, 1, tzinfo=JST)
+        FruitPriceHistory.objects.filter(fruit=self.apple).update(effective_from=datetime(2024, 1, 1, tzinfo=JST))
+        FruitPriceHistory.objects.create(fruit=self.apple, price=120, effective_from=self.change)
+        Fruit.objects.filter(pk=self.apple.pk).update(price=120)
+        fruit_catalog.invalidate()
+
+    def test_price_changes_are_recorded(self) -> None:
+        self.client.post(reverse('edit_fruit', kwargs={'pk': self.apple.pk}), data={'name': 'Apple', 'price': 150})
+        # 単価が変わらない編集では履歴を追加しない
+        self.client.post(reverse('edit_fruit', kwargs={'pk': self.apple.pk}), data={'name': 'Apple!', 'price': 150})
+        self.assertEqual(list(self.apple.price_history.order_by('effective_from').values_list('price', flat=True)),
+                         [100, 120, 150])
+
+        banana: Fruit = Fruit.objects.create(name='Banana', price=50)
+        self.assertEqual(list(banana.price_history.values_list('price', 'effective_from')),
+                         [(50, banana.created_at)])
+
+    def test_price_at_uses_history_without_queries(self) -> None:
+        fruit_catalog.all()
+        with self.assertNumQueries(0):
+            self.assertEqual(fruit_catalog.price_at(self.apple.pk, self.change - timedelta(microseconds=1), 0), 100)
+            self.assertEqual(fruit_catalog.price_at(self.apple.pk, self.change, 0), 120)
+            # 最初の履歴より前は最初の単価、履歴のない果物は既定値
+            self.assertEqual(fruit_catalog.price_at(self.apple.pk, datetime(2020, 1, 1, tzinfo=JST), 0), 100)
+            self.assertEqual(fruit_catalog.price_at(self.apple.pk + 1, self.change, 7), 7)
+
+    def test_importer_validates_against_price_at_sale_date(self) -> None:
+        result: ImportResult = SaleCsvImporter().run([
+            ['Apple', '2', '200', '2024-01-31 23:59'],
+            ['Apple', '2', '240', '2024-02-01 00:00'],
+            # 販売日時点の単価と一致しない
+            ['Apple', '2', '240', '2024-01-15 10:00'],
+            ['Apple', '2', '200', '2024-02-15 10:00'],
+        ])
+        self.assertEqual(result.imported, 2)
+        self.assertEqual(result.rejected['amount_mismatch'], 2)
+
+    def test_add_and_edit_use_price_at_sale_date(self) -> None:
+        self.client.post(reverse('add_sales'), data={
+            'fruit': self.apple.pk, 'quantity': 3, 'sale_date': '2024-01-20 11:00'})
+        sale: Sale = Sale.objects.get()
+        self.assertEqual(sale.total_amount, 300)
+
+        self.client.post(reverse('edit_sales', kwargs={'pk': sale.pk}), data={
+            'fruit': self.apple.pk, 'quantity': 3, 'sale_date': '2024-02-20 11:00'})
+        sale.refresh_from_db()
+        self.assertEqual(sale.total_amount, 360)
+
+    def test_schedule_pickles_for_worker_processes(self) -> None:
+        schedule: PriceSchedule = PriceSchedule([(datetime(2024, 1, 1, tzinfo=JST), 100), (self.change, 120)])
+        restored: PriceSchedule = pickle.loads(pickle.dumps(schedule))
+        self.assertEqual(len(restored), 2)
+        self.assertEqual(restored.at(self.change + timedelta(days=1)), 120)
@@ -0,0 +1,52 @@
+from datetime import date, timedelta
+from io import StringIO
+from typing import List
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from sales.benchmarks import Measurement, ViewBenchmark
+from sales.models import Fruit, Sale
+from sales.rollups import JST, compute_rollup, stored_rollup
+from sales.seeding import generate_sales, seed_fruits
+
+
+class QueryBudgetTest(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.end: date = timezone.now().astimezone(JST).date()
+        self.start: date = self.end - timedelta(days=120)
+        call_command('seed_sales', fruits=5, sales=500, start_day=self.start, end_day=self.end,
+                     inactive_ratio=0.1, stdout=StringIO())
+        self.user: User = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_login(self.user)
+
+    def test_seed_is_deterministic_and_rolled_up(self) -> None:
+        fruits: List[Fruit] = seed_fruits(5)
+        first: List[tuple] = [
+            (sale.fruit.name, sale.quantity, sale.sale_date, sale.is_active)
+            for sale in generate_sales(fruits, 50, self.start, self.end, seed=3)]
+        second: List[tuple] = [
+            (sale.fruit.name, sale.quantity, sale.sale_date, sale.is_active)
+            for sale in generate_sales(fruits, 50, self.start, self.end, seed=3)]
+
+        self.assertEqual(first, second)
+        self.assertEqual(Fruit.objects.count(), 5)
+        self.assertEqual(Sale.objects.count(), 500)
+        self.assertEqual(compute_rollup(), stored_rollup())
+
+    def test_views_stay_within_query_budget(self) -> None:
+        bench: ViewBenchmark = ViewBenchmark(self.client, repeat=1)
+        measurements: List[Measurement] = bench.views() + [
+            bench.csv_import(seed_fruits(5), 200, self.start, self.end, batch_size=50, seed=1)]
+
+        for measurement in measurements:
+            with self.subTest(measurement.name):
+                self.assertEqual(measurement.status_code, 200)
+                self.assertLessEqual(measurement.queries, measurement.budget)
+
+        # 計測したCSV取り込みはロールバックされている
+        self.assertEqual(Sale.objects.count(), 500)
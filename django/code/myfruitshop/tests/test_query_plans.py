@@ -0,0 +1,90 @@
+import json
+import re
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List
+
+from django.db import connection
+from django.db.models import Q, QuerySet
+from django.test import TestCase
+
+from sales.models import Fruit, Sale
+from sales.rollups import day_bounds, rebuild_rollup
+from sales.views import SalesAggregateView
+
+
+def full_table_scans(queryset: QuerySet) -> List[str]:
+    # EXPLAINの結果からインデックスを使わないテーブル全体の走査を抜き出す
+    if connection.vendor == 'mysql':
+        plan: str = queryset.explain(format='JSON')
+        return [
+            table['table_name']
+            for table in _mysql_tables(json.loads(plan))
+            if table.get('access_type') == 'ALL'
+        ]
+    if connection.vendor == 'postgresql':
+        return re.findall(r'Seq Scan on (\w+)', queryset.explain())
+    return re.findall(r'\bSCAN (\w+)$', queryset.explain(), flags=re.MULTILINE)
+
+
+def _mysql_tables(node: object) -> List[Dict]:
+    tables: List[Dict] = []
+    if isinstance(node, dict):
+        if 'table_name' in node and 'access_type' in node:
+            tables.append(node)
+        for value in node.values():
+            tables.extend(_mysql_tables(value))
+    elif isinstance(node, list):
+        for value in node:
+            tables.extend(_mysql_tables(value))
+    return tables
+
+
+class HotQueryPlanTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        fruits: List[Fruit] = Fruit.objects.bulk_create(
+            [Fruit(name=f'fruit-{index}', price=100 + index, is_active=index % 5 != 0) for index in range(40)])
+        start: datetime = datetime(2023, 1, 1, tzinfo=timezone.utc)
+        Sale.objects.bulk_create(
+            [
+                Sale(
+                    fruit=fruits[index % len(fruits)],
+                    quantity=index % 9 + 1,
+                    total_amount=(index % 9 + 1) * fruits[index % len(fruits)].price,
+                    sale_date=start + timedelta(hours=index * 7),
+                    is_active=index % 11 != 0,
+                )
+                for index in range(3000)
+            ],
+            batch_size=500,
+        )
+        rebuild_rollup()
+
+    def hot_queries(self) -> Dict[str, QuerySet]:
+        view: SalesAggregateView = SalesAggregateView()
+        fruit: Fruit = Fruit.objects.get(name='fruit-3')
+        return {
+            # 販売情報管理の一覧
+            'sales_list': Sale.objects.select_related('fruit').filter(is_active=True).order_by('-sale_date')[:10],
+            # 販売情報管理の一覧(カーソル方式の2ページ目以降)
+            'sales_list_keyset': Sale.objects.select_related('fruit').filter(is_active=True).order_by(
+                '-sale_date', '-id').filter(
+                Q(sale_date__lte=datetime(2023, 6, 1, tzinfo=timezone.utc)),
+                Q(sale_date__lt=datetime(2023, 6, 1, tzinfo=timezone.utc)) | Q(pk__lt=1500))[:11],
+            # 販売統計情報の月別・日別集計
+            'aggregate_monthly': view.aggregate_sales(view.start_date_monthly),
+            'aggregate_daily': view.aggregate_sales(view.start_date_daily, is_monthly=False),
+            # 日次集計の再構築(期間指定)
+            'rollup_window': Sale.objects.filter(
+                day_bounds(date(2023, 3, 1), date(2023, 3, 31)), is_active=True),
+            # 果物ごとの期間検索
+            'fruit_window': Sale.objects.filter(
+                fruit=fruit, sale_date__gte=datetime(2023, 3, 1, tzinfo=timezone.utc)).order_by('sale_date'),
+            # 果物名での検索
+            'fruit_by_name': Fruit.objects.filter(name='fruit-3', is_active=True),
+        }
+
+    def test_hot_queries_use_indexes(self) -> None:
+        for name, queryset in self.hot_queries().items():
+            with self.subTest(query=name):
+                self.assertEqual(full_table_scans(queryset), [], queryset.explain())
@@ -0,0 +1,86 @@
+from datetime import date, datetime, timedelta, timezone
+from io import BytesIO, StringIO
+
+from django.core.management import call_command
+from django.urls import reverse
+
+from sales.models import Sale, SalesDailyRollup
+from sales.rollups import RollupDeltas, SaleFigures, apply_deltas, compute_rollup, rebuild_rollup, stored_rollup
+from tests.base import SalesTestCase
+
+JST = timezone(timedelta(hours=9))
+
+
+class SalesDailyRollupTest(SalesTestCase):
+    def assertRollupConsistent(self) -> None:
+        self.assertEqual(stored_rollup(), compute_rollup())
+
+    def test_add_edit_delete_keep_rollup_in_sync(self) -> None:
+        self.client.post(reverse('add_sales'), data={
+            'fruit': self.apple.pk, 'quantity': 3, 'sale_date': '2024-01-20 00:30'})
+        sale: Sale = Sale.objects.get()
+        self.assertEqual(stored_rollup(), {(date(2024, 1, 20), self.apple.pk): (300, 3, 1)})
+
+        self.client.post(reverse('edit_sales', kwargs={'pk': sale.pk}), data={
+            'fruit': self.banana.pk, 'quantity': 4, 'sale_date': '2024-01-21 10:00'})
+        self.assertEqual(stored_rollup(), {(date(2024, 1, 21), self.banana.pk): (200, 4, 1)})
+
+        self.client.get(reverse('delete_sale', kwargs={'pk': sale.pk}))
+        self.assertEqual(stored_rollup(), {})
+        self.assertRollupConsistent()
+
+    def test_csv_import_updates_rollup(self) -> None:
+        csv_file = BytesIO(
+            'Apple,2,200,2024-01-20 08:00\n'
+            'Apple,1,100,2024-01-20 23:59\n'
+            'Banana,2,999,2024-01-20 10:00\n'
+            'Banana,2,100,2024-01-21 10:00\n'.encode('utf-8'))
+        csv_file.name = 'sales.csv'
+        self.client.post(reverse('sales_combined'), data={'csv_file': csv_file})
+
+        self.assertEqual(stored_rollup(), {
+            (date(2024, 1, 20), self.apple.pk): (300, 3, 2),
+            (date(2024, 1, 21), self.banana.pk): (100, 2, 1),
+        })
+        self.assertRollupConsistent()
+
+    def test_rebuild_command_repairs_rollup(self) -> None:
+        Sale.objects.create(fruit=self.apple, quantity=1, total_amount=100,
+                            sale_date=datetime(2024, 1, 1, 0, 30, tzinfo=JST))
+        Sale.objects.create(fruit=self.apple, quantity=1, total_amount=100,
+                            sale_date=datetime(2024, 1, 2, 0, 30, tzinfo=JST), is_active=False)
+        SalesDailyRollup.objects.create(day=date(2023, 12, 31), fruit=self.banana,
+                                        total_amount=1, quantity=1, sale_count=1)
+
+        out: StringIO = StringIO()
+        call_command('rebuild_sales_rollup', '--check', stdout=out)
+        self.assertIn('2 件の差分があります。', out.getvalue())
+
+        call_command('rebuild_sales_rollup', stdout=StringIO())
+        self.assertEqual(stored_rollup(), {(date(2024, 1, 1), self.apple.pk): (100, 1, 1)})
+
+    def test_rebuild_range_keeps_other_days(self) -> None:
+        SalesDailyRollup.objects.create(day=date(2023, 12, 31), fruit=self.banana,
+                                        total_amount=1, quantity=1, sale_count=1)
+        Sale.objects.create(fruit=self.apple, quantity=1, total_amount=100,
+                            sale_date=datetime(2024, 1, 1, 0, 30, tzinfo=JST))
+
+        rebuild_rollup(date(2024, 1, 1), date(2024, 1, 1))
+        self.assertEqual(stored_rollup(), {
+            (date(2023, 12, 31), self.banana.pk): (1, 1, 1),
+            (date(2024, 1, 1), self.apple.pk): (100, 1, 1),
+        })
+
+    def test_first_sale_of_day_adds_to_row_created_concurrently(self) -> None:
+        # 別のリクエストが同じ(日付, 果物)の行を先に作っていても、一意制約違反にならずその行へ加算する
+        SalesDailyRollup.objects.create(day=date(2024, 1, 20), fruit=self.apple,
+                                        total_amount=100, quantity=1, sale_count=1)
+        deltas: RollupDeltas = RollupDeltas()
+        deltas.add(SaleFigures(datetime(2024, 1, 20, 10, tzinfo=JST), self.apple.pk, 300, 3, True))
+        deltas.add(SaleFigures(datetime(2024, 1, 20, 11, tzinfo=JST), self.banana.pk, 50, 1, True))
+
+        apply_deltas(deltas)
+        self.assertEqual(stored_rollup(), {
+            (date(2024, 1, 20), self.apple.pk): (400, 4, 2),
+            (date(2024, 1, 20), self.banana.pk): (50, 1, 1),
+        })
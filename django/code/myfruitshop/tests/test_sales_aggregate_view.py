@@ -1,5 +1,13 @@
+from django.core.cache import cache
 from django.test import TestCase
-from datetime import datetime, timedelta, timezone
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.urls import reverse
+from django.contrib.auth.models import User
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+from sales.models import Fruit, Sale
+from sales.rollups import rebuild_rollup
 from sales.views import SalesAggregateView
 from freezegun import freeze_time
 
@@ -20,3 +28,176 @@ class TestSalesAggregateView(TestCase):
         # start_date_daily のアサーション
         expected_start_date_daily = datetime(2024, 1, 19, 0, 0, 0, tzinfo=timezone(timedelta(hours=9)))
         self.assertEqual(view.start_date_daily, expected_start_date_daily)
+
+
+class TestSalesAggregateQueries(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.user: User = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_login(self.user)
+        apple: Fruit = Fruit.objects.create(name='Apple', price=100)
+        banana: Fruit = Fruit.objects.create(name='Banana', price=50)
+        jst = timezone(timedelta(hours=9))
+
+        Sale.objects.create(fruit=apple, quantity=2, total_amount=200,
+                            sale_date=datetime(2024, 1, 20, 10, 0, tzinfo=jst))
+        # UTCでは1/18だが日本時間では1/19
+        Sale.objects.create(fruit=apple, quantity=1, total_amount=100,
+                            sale_date=datetime(2024, 1, 19, 0, 30, tzinfo=jst))
+        # UTCでは12月だが日本時間では1月
+        Sale.objects.create(fruit=banana, quantity=3, total_amount=150,
+                            sale_date=datetime(2024, 1, 1, 0, 30, tzinfo=jst))
+        # 集計期間外(累計のみに含まれる)
+        Sale.objects.create(fruit=banana, quantity=10, total_amount=500,
+                            sale_date=datetime(2023, 10, 15, 12, 0, tzinfo=jst))
+        # 論理削除済み
+        Sale.objects.create(fruit=apple, quantity=5, total_amount=500,
+                            sale_date=datetime(2024, 1, 20, 11, 0, tzinfo=jst), is_active=False)
+        rebuild_rollup()
+
+    @freeze_time("2024-01-20 03:00:00")
+    def test_aggregate_context(self) -> None:
+        response = self.client.get(reverse('sales_aggregate'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_sales'], 950)
+
+        monthly_data = list(response.context['monthly_data'])
+        self.assertEqual([key for key, _ in monthly_data], [(2024, 1)])
+        self.assertEqual(monthly_data[0][1]['total'], 450)
+        self.assertEqual(monthly_data[0][1]['details']['Apple'],
+                         {'fruit': 'Apple', 'amount': 300, 'quantity': 3})
+        self.assertEqual(monthly_data[0][1]['details']['Banana'],
+                         {'fruit': 'Banana', 'amount': 150, 'quantity': 3})
+
+        daily_data = list(response.context['daily_data'])
+        self.assertEqual([key for key, _ in daily_data], [(2024, 1, 20), (2024, 1, 19)])
+        self.assertEqual([details['total'] for _, details in daily_data], [200, 100])
+
+    @freeze_time("2024-01-20 03:00:00")
+    def test_query_count_is_constant(self) -> None:
+        fruit: Fruit = Fruit.objects.get(name='Apple')
+        Sale.objects.bulk_create([
+            Sale(fruit=fruit, quantity=1, total_amount=100,
+                 sale_date=datetime(2024, 1, 20, 1, 0, tzinfo=timezone.utc))
+            for _ in range(50)
+        ])
+        rebuild_rollup()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('sales_aggregate'))
+
+        # 販売実績テーブルは参照せず、日次集計(月別・日別と売れ筋の今日・今週)、
+        # 売れ筋の今月(14日以上のため果物ごとの累計の差)と全体の累計の1行のみを参照する
+        sale_queries = [q for q in queries.captured_queries if 'sales_sale"' in q['sql'] or 'sales_sale`' in q['sql']]
+        rollup_queries = [q for q in queries.captured_queries if 'sales_salesdailyrollup' in q['sql']]
+        prefix_queries = [q for q in queries.captured_queries if 'sales_salesprefixsum' in q['sql']]
+        total_queries = [q for q in queries.captured_queries if 'sales_salesgrandtotal' in q['sql']]
+        self.assertEqual(len(sale_queries), 0)
+        self.assertEqual(len(rollup_queries), 4)
+        self.assertEqual(len(prefix_queries), 1)
+        self.assertEqual(len(total_queries), 1)
+
+
+class TestSalesAggregatePeriods(TestCase):
+    def test_periods_across_month_and_year_rollovers(self) -> None:
+        # (UTCの現在時刻, タイムゾーン, 月次の開始日, 日次の開始日)
+        cases = [
+            # 日本時間の2024-03-01(うるう年の2月末をまたぐ)
+            ('2024-02-29 16:00:00', 'Asia/Tokyo', date(2024, 1, 1), date(2024, 2, 28)),
+            # 2月は2ヶ月前が前年12月
+            ('2024-02-15 03:00:00', 'Asia/Tokyo', date(2023, 12, 1), date(2024, 2, 13)),
+            ('2024-01-01 03:00:00', 'Asia/Tokyo', date(2023, 11, 1), date(2023, 12, 30)),
+            ('2024-01-02 03:00:00', 'Asia/Tokyo', date(2023, 11, 1), date(2023, 12, 31)),
+            ('2023-03-02 03:00:00', 'Asia/Tokyo', date(2023, 1, 1), date(2023, 2, 28)),
+            # UTCでは1/1でもロサンゼルスはまだ12/31
+            ('2024-01-01 07:00:00', 'America/Los_Angeles', date(2023, 10, 1), date(2023, 12, 29)),
+        ]
+        for now, name, monthly, daily in cases:
+            with self.subTest(now=now, tz=name), freeze_time(now):
+                tz = ZoneInfo(name)
+                view = SalesAggregateView()
+                view.set_time_zone(tz)
+                self.assertEqual(view.start_date_monthly, datetime.combine(monthly, time.min, tzinfo=tz))
+                self.assertEqual(view.start_date_daily, datetime.combine(daily, time.min, tzinfo=tz))
+
+
+class TestSalesAggregateTimeZones(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.user: User = User.objects.create_user(username='testuser', password='testpass')
+        self.client.force_login(self.user)
+        self.apple: Fruit = Fruit.objects.create(name='Apple', price=100)
+
+    def add_sales(self, *moments: datetime) -> None:
+        for moment in moments:
+            Sale.objects.create(fruit=self.apple, quantity=1, total_amount=100, sale_date=moment)
+        rebuild_rollup()
+
+    def aggregate(self, tz: str) -> dict:
+        response = self.client.get(reverse('sales_aggregate'), {'tz': tz})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['time_zone'], tz)
+        return {
+            'monthly': {key: details['total'] for key, details in response.context['monthly_data']},
+            'daily': {key: details['total'] for key, details in response.context['daily_data']},
+        }
+
+    @freeze_time('2024-03-11 16:00:00')
+    def test_spring_forward(self) -> None:
+        new_york = ZoneInfo('America/New_York')
+        self.add_sales(
+            # 2024-03-10は夏時間の開始日(23時間)
+            datetime(2024, 3, 10, 0, 30, tzinfo=new_york),
+            datetime(2024, 3, 10, 23, 30, tzinfo=new_york),
+            # UTC-5の固定オフセットでは3/10になるが、夏時間(UTC-4)では3/11
+            datetime(2024, 3, 11, 0, 30, tzinfo=new_york),
+            # UTCでは2024年だがニューヨークでは2023年(集計期間外)
+            datetime(2023, 12, 31, 23, 30, tzinfo=new_york),
+            datetime(2024, 1, 1, 0, 30, tzinfo=new_york),
+        )
+        self.assertEqual(self.aggregate('America/New_York'), {
+            'monthly': {(2024, 3): 300, (2024, 1): 100},
+            'daily': {(2024, 3, 11): 100, (2024, 3, 10): 200},
+        })
+        # 日本時間の集計(日次集計を使う)とはキャッシュを共有しない
+        self.assertEqual(self.aggregate('Asia/Tokyo')['monthly'], {(2024, 3): 300, (2024, 1): 200})
+
+    @freeze_time('2024-11-04 16:00:00')
+    def test_fall_back(self) -> None:
+        new_york = ZoneInfo('America/New_York')
+        self.add_sales(
+            # 2024-11-03は夏時間の終了日(25時間)。1:30が2回ある
+            datetime(2024, 11, 3, 1, 30, tzinfo=new_york),
+            datetime(2024, 11, 3, 1, 30, fold=1, tzinfo=new_york),
+            # UTC-4の固定オフセットでは11/4になるが、標準時(UTC-5)では11/3
+            datetime(2024, 11, 3, 23, 30, tzinfo=new_york),
+            datetime(2024, 11, 4, 0, 30, tzinfo=new_york),
+        )
+        self.assertEqual(self.aggregate('America/New_York')['daily'], {(2024, 11, 4): 100, (2024, 11, 3): 300})
+
+    @freeze_time('2024-04-01 16:00:00')
+    def test_month_boundary_in_southern_hemisphere(self) -> None:
+        sydney = ZoneInfo('Australia/Sydney')
+        self.add_sales(
+            datetime(2024, 3, 31, 23, 30, tzinfo=sydney),
+            datetime(2024, 4, 1, 0, 30, tzinfo=sydney),
+        )
+        self.assertEqual(self.aggregate('Australia/Sydney')['monthly'], {(2024, 4): 100, (2024, 3): 100})
+
+    @freeze_time('2024-03-11 16:00:00')
+    def test_other_time_zones_are_grouped_in_database(self) -> None:
+        self.add_sales(*[datetime(2024, 3, 10, hour, tzinfo=timezone.utc) for hour in range(24)])
+        with CaptureQueriesContext(connection) as queries:
+            self.aggregate('America/New_York')
+
+        # 日次集計は使わず、販売実績をGROUP BYした行だけを読む
+        # (月別・日別と売れ筋の今日・今月。月曜のため今週は今日とキャッシュを共有する)
+        sale_queries = [q['sql'] for q in queries.captured_queries
+                        if 'sales_sale"' in q['sql'] or 'sales_sale`' in q['sql']]
+        self.assertEqual(len(sale_queries), 4)
+        self.assertTrue(all('GROUP BY' in sql for sql in sale_queries))
+        self.assertFalse([q for q in queries.captured_queries if 'sales_salesdailyrollup' in q['sql']])
+
+    def test_invalid_time_zone(self) -> None:
+        self.assertEqual(self.client.get(reverse('sales_aggregate'), {'tz': 'Mars/Olympus'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('sales_aggregate_async'), {'tz': 'Mars/Olympus'}).status_code, 400)
@@ -1,10 +1,14 @@
+from datetime import datetime, timezone as dt_timezone
 from django.test import TestCase, RequestFactory
 from django.urls import reverse
 from django.contrib.auth.models import User
 from unittest.mock import patch
-from typing import Any, List, Union
+from typing import Any, Dict, Tuple
+from django.core.cache import cache
+from freezegun import freeze_time
 
 from sales.models import Fruit, Sale
+from sales.rollups import JST, rebuild_rollup
 from sales.views import (
     FruitListView,
     AddFruitView,
@@ -14,7 +18,6 @@ from sales.views import (
     AddSaleView,
     EditSaleView,
     DeleteSaleView,
-    SalesAggregateView,
 )
 
 class FruitViewsTest(TestCase):
@@ -153,7 +156,8 @@ class DeleteSaleViewTest(TestCase):
     @patch('sales.views.DeleteSaleView.get_object')
     def test_delete_sale_view_post(self, mock_get_object: Any) -> None:
         sale: Sale = Sale.objects.create(fruit=Fruit.objects.create(
-            name='Test Fruit', price=10), quantity=5, total_amount=50, sale_date='2023-01-01')
+            name='Test Fruit', price=10), quantity=5, total_amount=50,
+            sale_date=datetime(2023, 1, 1, tzinfo=dt_timezone.utc))
         mock_get_object.return_value = sale
 
         url: str = reverse('delete_sale', kwargs={'pk': sale.pk})
@@ -162,18 +166,45 @@ class DeleteSaleViewTest(TestCase):
 
         response: Any = DeleteSaleView.as_view()(request, pk=sale.pk)
         self.assertEqual(response.status_code, 302)
+        # POSTでも論理削除になる
+        self.assertFalse(Sale.objects.get(pk=sale.pk).is_active)
 
 
 class SalesAggregateViewTest(TestCase):
     def setUp(self) -> None:
-        self.factory: RequestFactory = RequestFactory()
-
-    @patch('sales.views.Sale.objects.all')
-    def test_sales_aggregate_view_get(self, mock_all: Any) -> None:
-        mock_all.return_value = Sale.objects.all()
-
-        url: str = reverse('sales_aggregate')
-        request: Any = self.factory.get(url)
+        cache.clear()
+        self.user: User = User.objects.create_user(
+            username='testuser',
+            password='testpass',
+        )
 
-        response: Any = SalesAggregateView.as_view()(request)
+    @freeze_time('2024-03-15 03:00:00')
+    def test_sales_aggregate_view_get(self) -> None:
+        apple: Fruit = Fruit.objects.create(name='Apple', price=100)
+        banana: Fruit = Fruit.objects.create(name='Banana', price=50)
+        for fruit, quantity, sale_date in [
+            (apple, 1, datetime(2024, 3, 15, 9, tzinfo=JST)),
+            (banana, 2, datetime(2024, 3, 15, 10, tzinfo=JST)),
+            (apple, 3, datetime(2024, 3, 14, 9, tzinfo=JST)),
+            (banana, 4, datetime(2024, 2, 1, 9, tzinfo=JST)),
+        ]:
+            Sale.objects.create(fruit=fruit, quantity=quantity, total_amount=quantity * fruit.price,
+                                sale_date=sale_date)
+        Sale.objects.create(fruit=apple, quantity=9, total_amount=900, is_active=False,
+                            sale_date=datetime(2024, 3, 15, 11, tzinfo=JST))
+        rebuild_rollup()
+
+        self.client.force_login(self.user)
+        response: Any = self.client.get(reverse('sales_aggregate'))
         self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_sales'], 700)
+        # 新しい期間から順に、期間ごとの合計と果物ごとの内訳
+        self.assertEqual([(key, data['total']) for key, data in response.context['monthly_data']],
+                         [((2024, 3), 500), ((2024, 2), 200)])
+        daily: Dict[Tuple[int, ...], Dict[str, Any]] = dict(response.context['daily_data'])
+        self.assertEqual(daily[(2024, 3, 15)]['details'], {
+            'Apple': {'fruit': 'Apple', 'amount': 100, 'quantity': 1},
+            'Banana': {'fruit': 'Banana', 'amount': 100, 'quantity': 2},
+        })
+        self.assertEqual(daily[(2024, 3, 14)]['total'], 300)
+        self.assertContains(response, 'Banana')
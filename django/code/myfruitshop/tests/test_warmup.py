@@ -0,0 +1,57 @@
+import logging
+import os
+import tempfile
+import unittest
+
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase
+
+from myfruitshop.log_handlers import QueuedFileHandler
+from myfruitshop.warmup import project_template_names, warm_up
+from sales.catalog import fruit_catalog
+from sales.models import Fruit
+
+
+class WarmUpTest(TestCase):
+    def test_warm_up_loads_project_templates_and_catalog(self) -> None:
+        Fruit.objects.create(name='Apple', price=100)
+        fruit_catalog.invalidate()
+
+        report: dict = warm_up()
+
+        self.assertEqual(list(report), ['database', 'urls', 'templates', 'caches'])
+        self.assertIn('sales_aggregate.html', project_template_names())
+        self.assertNotIn('admin/base.html', project_template_names())
+        self.assertEqual(report['templates']['count'], len(project_template_names()))
+        self.assertEqual(report['caches']['count'], 1)
+
+
+@unittest.skipUnless(hasattr(os, 'fork'), 'requires fork')
+class PreforkLoggingTest(SimpleTestCase):
+    def test_worker_forked_after_logging_setup_writes_to_file(self) -> None:
+        # preload_appと同じく、ログの設定を済ませたマスターからforkしたワーカーのログもファイルに届く
+        directory: tempfile.TemporaryDirectory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path: str = os.path.join(directory.name, 'debug.log')
+        handler: QueuedFileHandler = QueuedFileHandler(
+            path, rotation=settings.LOG_ROTATION, max_bytes=settings.LOG_MAX_BYTES, backup_count=settings.LOG_BACKUP_COUNT)
+        handler.setFormatter(logging.Formatter('%(process)d %(message)s'))
+        logger: logging.Logger = logging.getLogger('myfruitshop.requests')
+        logger.addHandler(handler)
+        self.addCleanup(logger.setLevel, logger.level)
+        logger.setLevel(logging.INFO)
+        self.addCleanup(handler.close)
+        self.addCleanup(logger.removeHandler, handler)
+
+        pid: int = os.fork()
+        if pid == 0:
+            try:
+                logger.info('GET /sales/ 200 from worker')
+                # ワーカーの終了時(atexit)と同じく書き込みスレッドを止める
+                handler.close()
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+
+        with open(path, encoding='utf-8') as file:
+            self.assertIn('GET /sales/ 200 from worker', file.read())